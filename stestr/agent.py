@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Run batches of tests on other hosts.
+
+An agent is a long running ``stestr agent`` process, usually on another
+machine with its own checkout of the project, which listens for connections
+from ``stestr run --agent``. Each connection sends batches of test ids, the
+agent runs every batch with the test command from its own config file and
+streams the subunit v2 output back as it is produced, followed by the return
+code of the test command. An empty batch closes the connection.
+
+On the run side each batch looks like a local worker process, so the results
+go through the same loading path as those of local workers. Like the
+dispatcher only :mod:`multiprocessing.connection` is used, messages are
+plain bytes and nothing is ever unpickled. Both sides must share the
+authentication key in the environment, as anyone who can connect to an agent
+can run its tests.
+"""
+
+import io
+from multiprocessing import connection
+import os
+import threading
+
+from stestr import dispatcher
+
+# The authentication key shared by agents and the runs which use them.
+AUTHKEY_ENV = "STESTR_AGENT_AUTHKEY"
+
+# The return code reported for a batch when the agent goes away before
+# sending one.
+LOST_AGENT_RETURNCODE = 255
+
+
+class AgentError(Exception):
+    """Raised when an agent can't be connected to."""
+
+
+def get_authkey():
+    """Get the shared agent authentication key from the environment.
+
+    :return: The key as bytes, or None if it isn't set.
+    """
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        return None
+    return authkey.encode("utf8")
+
+
+def serve_batches(conn, run_batch):
+    """Run the batches of tests sent over a connection until it is closed.
+
+    :param conn: A multiprocessing.connection.Connection to the run
+    :param run_batch: A callable which takes a list of test ids and a write
+        callable, runs the tests passing each chunk of subunit output to
+        write, and returns the return code of the test command.
+    """
+    try:
+        while True:
+            batch = dispatcher.decode_ids(conn.recv_bytes())
+            if not batch:
+                return
+            returncode = run_batch(batch, conn.send_bytes)
+            conn.send_bytes(b"")
+            conn.send_bytes(str(returncode).encode("ascii"))
+    except (EOFError, OSError):
+        # The run went away, there is nobody left to report to.
+        return
+
+
+class AgentServer:
+    """Accept connections from runs and run the batches of tests they send.
+
+    Every connection is served in its own thread, so a run which connects
+    to the same agent more than once runs that many batches at a time.
+
+    :param str address: The address to listen on, a host:port pair or a unix
+        socket path. Port 0 picks a free port.
+    :param bytes authkey: The shared authentication key
+    :param run_batch: A callable which takes a list of test ids and a write
+        callable, runs the tests passing each chunk of subunit output to
+        write, and returns the return code of the test command.
+    """
+
+    def __init__(self, address, authkey, run_batch):
+        self.listener = connection.Listener(
+            dispatcher.parse_address(address), authkey=authkey
+        )
+        self.address = dispatcher.format_address(self.listener.address)
+        self.run_batch = run_batch
+
+    def serve_forever(self):
+        """Serve connections until the listener is closed."""
+        while True:
+            try:
+                conn = self.listener.accept()
+            except connection.AuthenticationError:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            serve_batches(conn, self.run_batch)
+
+    def close(self):
+        """Stop accepting new connections."""
+        self.listener.close()
+
+
+class _AgentStream(io.RawIOBase):
+    """A readable stream of the subunit output of a BatchProcess."""
+
+    def __init__(self, process):
+        self._process = process
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._pending = self._process._recv()
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+
+class BatchProcess:
+    """Run a batch of tests over a connection to an agent or pool worker.
+
+    This has the parts of the subprocess.Popen interface used to read the
+    results of a local worker: the subunit output can be read from
+    ``stdout``, and ``wait()`` returns the return code of the test command
+    once the output has been read.
+
+    :param conn: A multiprocessing.connection.Connection to the process
+        which runs the batch, see :func:`serve_batches`.
+    :param list test_ids: The test ids to run
+    :param bool keep_open: Leave the connection open for more batches once
+        this batch has finished, instead of closing it.
+    """
+
+    def __init__(self, conn, test_ids, keep_open=False):
+        self.returncode = None
+        self._conn = conn
+        self._keep_open = keep_open
+        conn.send_bytes(dispatcher.encode_ids(test_ids))
+        self.stdout = io.BufferedReader(_AgentStream(self))
+
+    def _recv(self):
+        """Receive the next chunk of output, b'' once it has all been read."""
+        if self.returncode is not None:
+            return b""
+        try:
+            chunk = self._conn.recv_bytes()
+            if chunk:
+                return chunk
+            self.returncode = int(self._conn.recv_bytes())
+            if self._keep_open:
+                return b""
+            self._conn.send_bytes(b"")
+        except (EOFError, OSError, ValueError):
+            self.returncode = LOST_AGENT_RETURNCODE
+        self._conn.close()
+        return b""
+
+    def wait(self):
+        """Wait for the batch to finish, discarding any unread output."""
+        while self._recv():
+            pass
+        return self.returncode
+
+    def close(self):
+        """Abandon the batch without waiting for its results."""
+        if self.returncode is None:
+            self.returncode = LOST_AGENT_RETURNCODE
+            self._conn.close()
+
+
+class AgentProcess(BatchProcess):
+    """Run a batch of tests on an agent.
+
+    :param str address: The address of the agent
+    :param bytes authkey: The shared authentication key
+    :param list test_ids: The test ids to run
+    :raises AgentError: If the agent can't be connected to.
+    """
+
+    def __init__(self, address, authkey, test_ids):
+        self.address = address
+        try:
+            conn = connection.Client(dispatcher.parse_address(address), authkey=authkey)
+            super().__init__(conn, test_ids)
+        except (OSError, connection.AuthenticationError) as e:
+            raise AgentError("Could not connect to the agent at %s: %s" % (address, e))
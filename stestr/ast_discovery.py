@@ -0,0 +1,445 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""List tests by parsing the test modules instead of importing them.
+
+Listing the tests normally imports every test module, running all of the code
+at their top level. For most test modules that isn't needed to know which
+tests they contain: :func:`list_tests` parses them with :mod:`ast` and finds
+the ``unittest.TestCase`` subclasses and their ``test*`` methods the same way
+unittest's loader would, resolving base classes defined in the same module or
+in any other module under the top level directory. The ids are the same as
+listing the tests by importing them gives, in the same order.
+
+Modules whose tests can't be known without running them are listed by
+importing them as usual. That includes modules and packages with a
+``load_tests`` function, test classes with decorators (other than the skip
+and mock.patch ones) or metaclasses, which may add or change tests, test
+classes with ``scenarios``, and test classes derived from a class outside of
+the top level directory other than ``unittest.TestCase`` and
+``testtools.TestCase``, whose tests can't be seen.
+
+A few things are not noticed without importing the modules. Test modules
+which fail to import aren't reported until their tests are run, and test
+classes imported from outside of the top level directory into a test module
+are assumed to have no tests of their own.
+"""
+
+import ast
+import builtins
+import os
+
+from stestr import discovery
+
+#: Test case classes from outside the top level directory which are known to
+#: have no tests of their own.
+TEST_CASES = {
+    "unittest.TestCase",
+    "unittest.case.TestCase",
+    "unittest.IsolatedAsyncioTestCase",
+    "unittest.async_case.IsolatedAsyncioTestCase",
+    "testtools.TestCase",
+    "testtools.testcase.TestCase",
+}
+
+#: Class decorators which return the class they are given, with the same
+#: test methods.
+CLASS_DECORATORS = {
+    "skip",
+    "skipIf",
+    "skipUnless",
+    "expectedFailure",
+    "patch",
+    "object",
+    "dict",
+    "multiple",
+}
+
+
+class _Dynamic(Exception):
+    """Raised when the tests of a module can only be found by importing it."""
+
+
+class _Ref:
+    """What a name in a module namespace refers to.
+
+    :ivar kind: ``module`` for a module under the top level directory,
+        ``class`` for a class defined in one, ``external`` for anything
+        imported from outside the top level directory and ``other`` for
+        anything else.
+    :ivar name: The module name, the defining module and class name of a
+        class, or the dotted name an external object was imported as.
+    """
+
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+
+
+_OTHER = _Ref("other")
+
+
+def _assigned_names(node):
+    """Return the names an assignment binds, and the attributes it sets."""
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    names = []
+    attributes = []
+    while targets:
+        target = targets.pop()
+        if isinstance(target, ast.Name):
+            names.append(target.id)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            targets.extend(target.elts)
+        elif isinstance(target, ast.Starred):
+            targets.append(target.value)
+        elif isinstance(target, ast.Attribute):
+            attributes.append(target.attr)
+    return names, attributes
+
+
+def _decorator_name(node):
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+class _Module:
+    def __init__(self, finder, name, path, is_package):
+        self.finder = finder
+        self.name = name
+        self.is_package = is_package
+        self.dynamic = False
+        self.namespace = {}
+        self.classes = {}
+        if path is None:
+            # A namespace package.
+            return
+        try:
+            with open(path, "rb") as fd:
+                tree = ast.parse(fd.read(), path)
+        except (SyntaxError, ValueError):
+            # Importing it reports the error.
+            self.dynamic = True
+            return
+        self._bind_statements(tree.body, top_level=True)
+
+    def _package(self):
+        if self.is_package:
+            return self.name
+        return self.name.rpartition(".")[0]
+
+    def _bind_statements(self, body, top_level=False):
+        for node in body:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        self.namespace[alias.asname] = self.finder.module_ref(
+                            alias.name
+                        )
+                    else:
+                        top = alias.name.partition(".")[0]
+                        self.namespace[top] = self.finder.module_ref(top)
+            elif isinstance(node, ast.ImportFrom):
+                self._bind_import_from(node)
+            elif isinstance(node, ast.ClassDef):
+                if not top_level:
+                    self.dynamic = True
+                self.namespace[node.name] = _Ref("class", (self.name, node.name))
+                self.classes[node.name] = node
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if node.name == "load_tests":
+                    self.dynamic = True
+                self.namespace[node.name] = _OTHER
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                names, attributes = _assigned_names(node)
+                for name in names:
+                    self._bind_assign(name, node.value)
+                if any(x.startswith("test") for x in attributes):
+                    # Maybe a test added to a class from outside of it.
+                    self.dynamic = True
+            elif isinstance(node, ast.Delete):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        self.namespace.pop(target.id, None)
+            elif isinstance(node, ast.Expr):
+                if isinstance(node.value, ast.Call):
+                    if _decorator_name(node.value) == "setattr":
+                        self.dynamic = True
+            else:
+                for field in ("body", "orelse", "finalbody", "handlers"):
+                    for child in getattr(node, field, []):
+                        if isinstance(child, ast.ExceptHandler):
+                            self._bind_statements(child.body)
+                        else:
+                            self._bind_statements([child])
+
+    def _bind_assign(self, name, value):
+        if name == "load_tests":
+            self.dynamic = True
+        ref = _OTHER
+        if isinstance(value, (ast.Name, ast.Attribute)):
+            try:
+                ref = self.resolve(value)
+            except _Dynamic:
+                pass
+        elif isinstance(value, ast.Call) and _decorator_name(value) == "type":
+            # A class made at import time.
+            self.dynamic = True
+        self.namespace[name] = ref
+
+    def _bind_import_from(self, node):
+        module = node.module or ""
+        if node.level:
+            package = self._package().split(".")
+            if node.level > 1:
+                package = package[: -(node.level - 1)]
+            module = ".".join(x for x in package + [module] if x)
+        source = self.finder.module_ref(module)
+        for alias in node.names:
+            if alias.name == "*":
+                if source.kind != "module":
+                    self.dynamic = True
+                    continue
+                other = self.finder.module(source.name)
+                if other.dynamic:
+                    self.dynamic = True
+                for name, ref in other.namespace.items():
+                    if not name.startswith("_"):
+                        self.namespace[name] = ref
+                continue
+            self.namespace[alias.asname or alias.name] = self.finder.attribute_ref(
+                source, alias.name
+            )
+
+    def resolve(self, node):
+        """Return the _Ref of a Name or Attribute expression.
+
+        :raises _Dynamic: If the expression can't be resolved.
+        """
+        if isinstance(node, ast.Name):
+            if node.id in self.namespace:
+                return self.namespace[node.id]
+            if hasattr(builtins, node.id):
+                return _OTHER
+            raise _Dynamic(node.id)
+        if isinstance(node, ast.Attribute):
+            ref = self.resolve(node.value)
+            if ref.kind in ("module", "external"):
+                return self.finder.attribute_ref(ref, node.attr)
+        raise _Dynamic(ast.dump(node))
+
+
+class _Finder:
+    """Parse the modules under the top level directory as they are needed."""
+
+    def __init__(self, top_dir):
+        self.top_dir = top_dir
+        self._modules = {}
+        self._classes = {}
+
+    def _path(self, name):
+        return os.path.join(self.top_dir, *name.split("."))
+
+    def module_ref(self, name):
+        path = self._path(name)
+        if (
+            os.path.isfile(os.path.join(path, "__init__.py"))
+            or os.path.isfile(path + ".py")
+            or os.path.isdir(path)
+        ):
+            return _Ref("module", name)
+        return _Ref("external", name)
+
+    def module(self, name):
+        if name not in self._modules:
+            path = self._path(name)
+            if os.path.isfile(os.path.join(path, "__init__.py")):
+                source, is_package = os.path.join(path, "__init__.py"), True
+            elif os.path.isfile(path + ".py"):
+                source, is_package = path + ".py", False
+            else:
+                source, is_package = None, True
+            # Guard against import cycles while the module is parsed.
+            self._modules[name] = _Module(self, name, None, is_package)
+            self._modules[name].dynamic = True
+            self._modules[name] = _Module(self, name, source, is_package)
+        return self._modules[name]
+
+    def attribute_ref(self, ref, attr):
+        if ref.kind == "external":
+            return _Ref("external", "%s.%s" % (ref.name, attr))
+        if ref.kind != "module":
+            return _OTHER
+        module = self.module(ref.name)
+        if attr in module.namespace:
+            return module.namespace[attr]
+        if module.is_package:
+            return self.module_ref("%s.%s" % (ref.name, attr))
+        return _OTHER
+
+    def test_case(self, ref):
+        """Return whether a class is a test case and its test names.
+
+        :return: A (is_test_case, test_names, has_run_test, uncertain) tuple.
+            uncertain is set if the class has test names which can't be
+            known, which only matters if it is used by a test case.
+        :raises _Dynamic: If the class is, or could be, a test case whose
+            tests can't be known without importing it.
+        """
+        if ref.kind == "external":
+            if ref.name in TEST_CASES:
+                return True, set(), False, False
+            raise _Dynamic(ref.name)
+        if ref.kind != "class":
+            return False, set(), False, False
+        if ref.name in self._classes:
+            if self._classes[ref.name] is None:
+                raise _Dynamic("%s.%s" % ref.name)
+            return self._classes[ref.name]
+        self._classes[ref.name] = None
+        module = self.module(ref.name[0])
+        if module.dynamic:
+            raise _Dynamic(module.name)
+        node = module.classes[ref.name[1]]
+        is_test_case = False
+        names = set()
+        run_test = False
+        uncertain = bool(node.keywords) or any(
+            _decorator_name(x) not in CLASS_DECORATORS for x in node.decorator_list
+        )
+        for base in node.bases:
+            base_info = self.test_case(module.resolve(base))
+            is_test_case |= base_info[0]
+            names |= base_info[1]
+            run_test |= base_info[2]
+            uncertain |= base_info[3]
+        for child in node.body:
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if child.name == "runTest":
+                    run_test = True
+                if child.name.startswith("test"):
+                    names.add(child.name)
+                    uncertain |= any(
+                        _decorator_name(x) in ("property", "cached_property")
+                        for x in child.decorator_list
+                    )
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)):
+                uncertain |= any(
+                    x.startswith("test") or x in ("scenarios", "runTest")
+                    for x in _assigned_names(child)[0]
+                )
+            elif isinstance(child, ast.ClassDef):
+                uncertain |= child.name.startswith("test")
+            elif not isinstance(child, (ast.Expr, ast.Pass)):
+                # Anything else, like an if statement, could bind a test name.
+                uncertain = True
+        if is_test_case and uncertain:
+            raise _Dynamic("%s.%s" % ref.name)
+        self._classes[ref.name] = (is_test_case, names, run_test, uncertain)
+        return self._classes[ref.name]
+
+    def list_module(self, name):
+        """Return the test ids in a module, like loadTestsFromModule.
+
+        :raises _Dynamic: If the module has to be imported to know its tests.
+        """
+        module = self.module(name)
+        if module.dynamic:
+            raise _Dynamic(name)
+        test_ids = []
+        for attr in sorted(module.namespace):
+            ref = module.namespace[attr]
+            if ref.kind != "class":
+                continue
+            is_test_case, names, run_test, _ = self.test_case(ref)
+            if not is_test_case:
+                continue
+            if not names and run_test:
+                names = {"runTest"}
+            class_id = "%s.%s" % ref.name
+            test_ids.extend("%s.%s" % (class_id, x) for x in sorted(names))
+        return test_ids
+
+
+def _walk(finder, top_dir, start_dir):
+    """Yield the modules in discovery order with their ids where known.
+
+    :return: An iterator of (name, test_ids) tuples, test_ids is None for
+        modules and packages which have to be imported.
+    """
+
+    def module_name(path):
+        return os.path.splitext(os.path.relpath(path, top_dir))[0].replace(os.sep, ".")
+
+    def find_package(path):
+        name = module_name(path)
+        try:
+            yield name, finder.list_module(name)
+        except _Dynamic:
+            yield name, None
+            return
+        yield from find_tests(path)
+
+    def find_tests(path):
+        for entry in sorted(os.listdir(path)):
+            full_path = os.path.join(path, entry)
+            if os.path.isfile(os.path.join(full_path, "__init__.py")):
+                yield from find_package(full_path)
+            elif os.path.isfile(full_path) and discovery._is_test_module(entry):
+                name = module_name(full_path)
+                try:
+                    yield name, finder.list_module(name)
+                except _Dynamic:
+                    yield name, None
+
+    if os.path.abspath(start_dir) != os.path.abspath(top_dir) and os.path.isfile(
+        os.path.join(start_dir, "__init__.py")
+    ):
+        # Like discovery the tests of the start package itself are loaded,
+        # and its load_tests function decides what else is found.
+        yield from find_package(start_dir)
+    else:
+        yield from find_tests(start_dir)
+
+
+def list_tests(top_dir, start_dir, list_modules):
+    """List the tests by parsing the test modules where possible.
+
+    :param str top_dir: The top level directory of the discovery.
+    :param str start_dir: The directory discovery starts in.
+    :param list_modules: A callable which takes a list of module and package
+        names and returns the test ids found by importing them.
+    :return: A list of test ids, in the order discovery finds them.
+    """
+    found = list(_walk(_Finder(top_dir), top_dir, start_dir))
+    imported = [name for name, test_ids in found if test_ids is None]
+    if imported:
+        # Give each module back the ids it was listed with. The ids are in
+        # the order of the modules, so an id which doesn't start with the
+        # name of any of them belongs with the module before it.
+        by_module = {name: [] for name in imported}
+        current = imported[0]
+        for test_id in list_modules(imported):
+            for name in imported:
+                if test_id.startswith(name + "."):
+                    current = name
+                    break
+            by_module[current].append(test_id)
+        found = [
+            (name, by_module[name] if test_ids is None else test_ids)
+            for name, test_ids in found
+        ]
+    return [test_id for _, test_ids in found for test_id in test_ids]
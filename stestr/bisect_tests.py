@@ -10,26 +10,45 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from concurrent import futures
 import math
 
+import subunit
 import testtools
 
 from stestr import output
+from stestr import scheduler
 
 
 class IsolationAnalyzer:
+    """Find the tests which make other tests fail when run before them.
+
+    The tests are run in probes: a probe runs a failing test after a slice of
+    the tests which ran before it on the same worker in latest_run, all in a
+    single test runner. Up to concurrency probes are run at the same time,
+    and with a pool or a run_func one at a time.
+
+    :param run_func: An optional function to run each probe with, it is
+        called with the run command like ``run_func(cmd, False,
+        pretty_out=False, repo_url=repo_url)`` and the failures are then read
+        from repo. This stores each probe in the repository, without it the
+        probes' results are only used to find the causes.
+    """
+
     def __init__(
         self,
         latest_run,
         conf,
-        run_func,
-        repo,
+        run_func=None,
+        repo=None,
         test_path=None,
         top_dir=None,
         group_regex=None,
         repo_url=None,
         serial=False,
         concurrency=0,
+        pool=None,
+        targeted_load=False,
     ):
         super().__init__()
         self._worker_to_test = None
@@ -40,80 +59,231 @@ class IsolationAnalyzer:
         self.repo_url = repo_url
         self.serial = serial
         self.concurrency = concurrency
+        self.pool = pool
+        self.targeted_load = targeted_load
         self.test_path = test_path
         self.top_dir = top_dir
         self.run_func = run_func
         self.repo = repo
 
     def bisect_tests(self, spurious_failures):
+        """Find the test which makes each of spurious_failures fail.
+
+        The tests which ran before each failure are searched in rounds. Each
+        round splits the tests left for every failure into as many slices as
+        there are probes to spare for it, at least two, and runs a probe for
+        each slice. The search goes on with the first slice the failure
+        failed with until it is down to one test, the cause. If the failure
+        passed with every slice it needs more than one of the tests to fail,
+        and a minimal set of them is searched for with
+        :meth:`minimize_tests` instead.
 
+        :param spurious_failures: The ids of tests which failed in
+            latest_run but pass when run on their own.
+        :return: 3 after printing a table of the causes found.
+        :raises ValueError: If spurious_failures is empty.
+        """
         test_conflicts = {}
         if not spurious_failures:
             raise ValueError("No failures provided to bisect the cause of")
+        workers = self._workers()
+        # spurious-failure -> the tests which may cause it.
+        searches = {}
         for spurious_failure in spurious_failures:
-            candidate_causes = self._prior_tests(self.latest_run, spurious_failure)
-            bottom = 0
-            top = len(candidate_causes)
-            width = top - bottom
-            while width:
-                check_width = int(math.ceil(width / 2.0))
-                test_ids = candidate_causes[bottom : bottom + check_width] + [
-                    spurious_failure
-                ]
-                cmd = self.conf.get_run_command(
-                    test_ids,
-                    group_regex=self.group_regex,
-                    repo_url=self.repo_url,
-                    serial=self.serial,
-                    concurrency=self.concurrency,
-                    test_path=self.test_path,
-                    top_dir=self.top_dir,
+            searches[spurious_failure] = self._prior_tests(
+                self.latest_run, spurious_failure
+            )
+        # spurious-failure -> the fewest tests it has been seen failing with.
+        reproducing = {}
+        interactions = []
+        while searches:
+            slices = max(2, workers // len(searches))
+            probes = []
+            for spurious_failure in sorted(searches):
+                candidate_causes = searches[spurious_failure]
+                width = max(1, int(math.ceil(len(candidate_causes) / slices)))
+                for bottom in range(0, len(candidate_causes), width):
+                    probes.append(
+                        (spurious_failure, candidate_causes[bottom : bottom + width])
+                    )
+            with futures.ThreadPoolExecutor(workers) as executor:
+                failed = list(
+                    executor.map(lambda x: self._run_probe(x[1] + [x[0]]), probes)
                 )
-                self.run_func(cmd, False, pretty_out=False, repo_url=self.repo_url)
-                # check that the test we're probing still failed - still
-                # awkward.
-                found_fail = []
-
-                def find_fail(test_dict):
-                    if test_dict["id"] == spurious_failure:
-                        found_fail.append(True)
-
-                checker = testtools.StreamToDict(find_fail)
-                checker.startTestRun()
-                try:
-                    self.repo.get_failing().get_test().run(checker)
-                finally:
-                    checker.stopTestRun()
-                if found_fail:
-                    # Our conflict is in bottom - clamp the range down.
-                    top = bottom + check_width
-                    if width == 1:
-                        # found the cause
-                        test_conflicts[spurious_failure] = candidate_causes[bottom]
-                        width = 0
-                    else:
-                        width = top - bottom
+            reproduced = {}
+            for (spurious_failure, causes), probe_failed in zip(probes, failed):
+                if spurious_failure in probe_failed:
+                    reproduced.setdefault(spurious_failure, causes)
+            for spurious_failure in list(searches):
+                causes = reproduced.get(spurious_failure)
+                if causes is None:
+                    # Either the failure is racy, or it needs more than one
+                    # of the tests before it.
+                    interactions.append(spurious_failure)
+                elif len(causes) == 1:
+                    # found the cause
+                    test_conflicts[spurious_failure] = causes
                 else:
-                    # Conflict in the range we did not run: discard bottom.
-                    bottom = bottom + check_width
-                    if width == 1:
-                        # there will be no more to check, so we didn't
-                        # reproduce the failure.
-                        width = 0
-                    else:
-                        width = top - bottom
-            if spurious_failure not in test_conflicts:
+                    searches[spurious_failure] = causes
+                    reproducing[spurious_failure] = causes
+                    continue
+                del searches[spurious_failure]
+        for spurious_failure in sorted(interactions):
+            if spurious_failure in reproducing:
+                causes = self.minimize_tests(
+                    spurious_failure, reproducing[spurious_failure], reproduced=True
+                )
+            else:
+                causes = self.minimize_tests(
+                    spurious_failure,
+                    self._prior_tests(self.latest_run, spurious_failure),
+                )
+            if causes is None:
                 # Could not determine cause
-                test_conflicts[spurious_failure] = "unknown - no conflicts"
+                causes = ["unknown - no conflicts"]
+            test_conflicts[spurious_failure] = causes
         if test_conflicts:
             table = [("failing test", "caused by test")]
             for failure in sorted(test_conflicts):
                 causes = test_conflicts[failure]
-                table.append((failure, causes))
+                table.append((failure, causes[0]))
+                # A failure caused by several tests together gets a row for
+                # each of them.
+                table.extend(("", x) for x in causes[1:])
             output.output_table(table)
             return 3
         return 0
 
+    def minimize_tests(self, spurious_failure, candidate_causes, reproduced=False):
+        """Find a minimal set of tests which make spurious_failure fail.
+
+        This is the ddmin delta debugging algorithm: candidate_causes are
+        split into subsets, and spurious_failure is run after each subset
+        and after each subset's complement, all in separate test runners at
+        the same time. The search goes on with the first of those the failure
+        failed with, a subset before a complement, and otherwise splits
+        candidate_causes into twice as many subsets. It ends once the failure
+        passes without any one of the tests left, with them in the order they
+        ran in latest_run.
+
+        :param str spurious_failure: The id of the failing test.
+        :param list candidate_causes: The ids of the tests which ran before it
+            on the same worker, in the order they ran in.
+        :param bool reproduced: Whether spurious_failure is already known to
+            fail when run after all of candidate_causes.
+        :return: A list of test ids, or None if spurious_failure doesn't fail
+            after all of candidate_causes.
+        """
+        workers = self._workers()
+        if not candidate_causes:
+            return None
+        if not reproduced:
+            probes = [candidate_causes]
+            if self._first_reproducing(spurious_failure, probes, workers) is None:
+                return None
+        granularity = 2
+        while len(candidate_causes) >= 2:
+            width = int(math.ceil(len(candidate_causes) / granularity))
+            subsets = []
+            complements = []
+            for bottom in range(0, len(candidate_causes), width):
+                subsets.append(candidate_causes[bottom : bottom + width])
+                complements.append(
+                    candidate_causes[:bottom] + candidate_causes[bottom + width :]
+                )
+            if len(subsets) == 2:
+                # The complement of each half is the other half.
+                complements = []
+            probes = subsets + complements
+            index = self._first_reproducing(spurious_failure, probes, workers)
+            if index is not None:
+                candidate_causes = probes[index]
+                if index < len(subsets):
+                    granularity = 2
+                else:
+                    granularity = max(granularity - 1, 2)
+            elif granularity >= len(candidate_causes):
+                # The failure needs every one of the tests left.
+                break
+            else:
+                granularity = min(len(candidate_causes), granularity * 2)
+        return candidate_causes
+
+    def _first_reproducing(self, spurious_failure, probes, workers):
+        """Run spurious_failure after each of probes, up to workers at a time.
+
+        :return: The index of the first of probes spurious_failure failed
+            after, or None if it passed after all of them. Once it has failed
+            the later probes which haven't started yet are skipped.
+        """
+        with futures.ThreadPoolExecutor(workers) as executor:
+            running = [
+                executor.submit(self._run_probe, x + [spurious_failure]) for x in probes
+            ]
+            for index, future in enumerate(running):
+                if spurious_failure in future.result():
+                    for later in running[index + 1 :]:
+                        later.cancel()
+                    return index
+        return None
+
+    def _workers(self):
+        """Return how many probes to run at the same time."""
+        # The batches a pool runs all have to finish before it can be given
+        # more, so probes can't share it. Probes run with run_func read their
+        # failures back from the repository, so they can't overlap either.
+        if self.serial or self.pool is not None or self.run_func is not None:
+            return 1
+        if self.concurrency and self.concurrency != "auto":
+            return int(self.concurrency)
+        return scheduler.local_concurrency() or 1
+
+    def _run_probe(self, test_ids):
+        """Run test_ids in a single test runner.
+
+        :return: A set of the ids of the tests which failed.
+        """
+        cmd = self.conf.get_run_command(
+            test_ids,
+            group_regex=self.group_regex,
+            repo_url=self.repo_url,
+            serial=True,
+            test_path=self.test_path,
+            top_dir=self.top_dir,
+            pool=self.pool,
+            targeted_load=self.targeted_load,
+        )
+        failed = set()
+
+        def find_fail(test_dict):
+            if test_dict["status"] == "fail":
+                failed.add(test_dict["id"])
+
+        if self.run_func is not None:
+            self.run_func(cmd, False, pretty_out=False, repo_url=self.repo_url)
+            checker = testtools.StreamToDict(find_fail)
+            checker.startTestRun()
+            try:
+                self.repo.get_failing().get_test().run(checker)
+            finally:
+                checker.stopTestRun()
+            return failed
+        cmd.setUp()
+        try:
+            checker = testtools.StreamToDict(find_fail)
+            checker.startTestRun()
+            try:
+                for proc in cmd.run_tests():
+                    subunit.ByteStreamToStreamResult(
+                        proc.stdout, non_subunit_name="stdout"
+                    ).run(checker)
+                    proc.wait()
+            finally:
+                checker.stopTestRun()
+        finally:
+            cmd.cleanUp()
+        return failed
+
     def _prior_tests(self, run, failing_id):
         """Calculate what tests from the test run run ran before test_id.
 
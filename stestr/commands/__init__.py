@@ -10,6 +10,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from stestr.commands.agent import agent_command
 from stestr.commands.failing import failing as failing_command
 from stestr.commands.history import history_list as history_list_command
 from stestr.commands.history import history_remove as history_remove_command
@@ -18,16 +19,19 @@ from stestr.commands.init import init as init_command
 from stestr.commands.last import last as last_command
 from stestr.commands.list import list_command
 from stestr.commands.load import load as load_command
+from stestr.commands.plan import plan as plan_command
 from stestr.commands.run import run_command
 from stestr.commands.slowest import slowest as slowest_command
 
 
 __all__ = [
+    "agent_command",
     "failing_command",
     "init_command",
     "last_command",
     "list_command",
     "load_command",
+    "plan_command",
     "run_command",
     "slowest_command",
     "history_show_command",
@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Run tests sent by stestr run on other hosts."""
+
+import functools
+import secrets
+import sys
+
+from cliff import command
+
+from stestr import agent
+from stestr import config_file
+from stestr.repository import abstract as repository
+from stestr.repository import util
+
+
+class Agent(command.Command):
+    """Listen for batches of tests to run from stestr run --agent.
+
+    The agent runs every batch it is sent with the test command from its
+    own config file, and streams the subunit results back to the run. It
+    keeps serving runs until it is interrupted.
+    """
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.add_argument(
+            "--listen",
+            default="localhost:0",
+            metavar="ADDRESS",
+            help="The host:port or unix socket path to listen on. Port 0 "
+            "picks a free port, the address listened on is printed at "
+            "startup. Defaults to localhost:0.",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        return agent_command(
+            config=self.app_args.config,
+            repo_url=self.app_args.repo_url,
+            test_path=self.app_args.test_path,
+            top_dir=self.app_args.top_dir,
+            listen=parsed_args.listen,
+        )
+
+
+def agent_command(
+    config=config_file.TestrConf.DEFAULT_CONFIG_FILENAME,
+    repo_url=None,
+    test_path=None,
+    top_dir=None,
+    listen="localhost:0",
+    stdout=sys.stdout,
+):
+    """Serve batches of tests from stestr run --agent until interrupted
+
+    The key shared with the runs is read from the ``STESTR_AGENT_AUTHKEY``
+    environment variable. If it isn't set a random key is generated and
+    printed, which the runs then need to set.
+
+    :param str config: The path to the stestr config file. Must be a string.
+    :param str repo_url: The url of the repository to use.
+    :param str test_path: Set the test path to use for unittest discovery.
+        If both this and the corresponding config file option are set, this
+        value will be used.
+    :param str top_dir: The top dir to use for unittest discovery. This takes
+        precedence over the value in the config file. (if one is present in
+        the config file)
+    :param str listen: The host:port or unix socket path to listen on.
+    :param file stdout: The output file to write all output to. By default
+        this is sys.stdout
+
+    :return return_code: The exit code for the command. 0 for success and > 0
+        for failures.
+    :rtype: int
+    """
+    conf = config_file.TestrConf.load_from_file(config)
+    try:
+        util.get_repo_open(repo_url=repo_url)
+    except repository.RepositoryNotFound:
+        util.get_repo_initialise(repo_url=repo_url)
+    authkey = agent.get_authkey()
+    if authkey is None:
+        key = secrets.token_hex(16)
+        stdout.write(
+            "%s is not set, runs using this agent must set it to %s\n"
+            % (agent.AUTHKEY_ENV, key)
+        )
+        authkey = key.encode("utf8")
+
+    def run_batch(test_ids, write):
+        cmd = conf.get_run_command(
+            test_ids,
+            repo_url=repo_url,
+            serial=True,
+            test_path=test_path,
+            top_dir=top_dir,
+        )
+        with cmd:
+            proc = cmd.run_tests()[0]
+            try:
+                for chunk in iter(functools.partial(proc.stdout.read1, 65536), b""):
+                    write(chunk)
+            except BaseException:
+                # The run went away, don't leave the tests running for nobody.
+                proc.kill()
+                proc.wait()
+                raise
+            return proc.wait()
+
+    server = agent.AgentServer(listen, authkey, run_batch)
+    stdout.write("Listening on %s\n" % server.address)
+    stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
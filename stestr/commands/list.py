@@ -19,6 +19,7 @@ from cliff import command
 
 from stestr import config_file
 from stestr import output
+from stestr import utils
 
 
 class List(command.Command):
@@ -70,6 +71,34 @@ class List(command.Command):
             "initial safe list selection, which by default is "
             "everything.",
         )
+        parser.add_argument(
+            "--shard",
+            default=None,
+            metavar="INDEX/TOTAL",
+            help="Only list the tests in one of TOTAL shards of the "
+            "selected tests, see the run command. INDEX starts at 1.",
+        )
+        parser.add_argument(
+            "--discovery-cache",
+            action="store_true",
+            default=False,
+            help="Reuse the test ids listed by earlier commands instead of "
+            "listing the tests again, see the run command.",
+        )
+        parser.add_argument(
+            "--parallel-discovery",
+            action="store_true",
+            default=False,
+            help="List the tests in each package in the test path with a "
+            "separate process, running one for each CPU at the same time.",
+        )
+        parser.add_argument(
+            "--static-discovery",
+            action="store_true",
+            default=False,
+            help="Find the tests by parsing the test modules instead of "
+            "importing them where possible, see the run command.",
+        )
         return parser
 
     def take_action(self, parsed_args):
@@ -85,6 +114,10 @@ class List(command.Command):
             include_list=args.include_list,
             exclude_regex=args.exclude_regex,
             filters=filters,
+            shard=args.shard,
+            discovery_cache=args.discovery_cache,
+            parallel_discovery=args.parallel_discovery,
+            static_discovery=args.static_discovery,
         )
 
 
@@ -98,6 +131,10 @@ def list_command(
     include_list=None,
     exclude_regex=None,
     filters=None,
+    shard=None,
+    discovery_cache=False,
+    parallel_discovery=False,
+    static_discovery=False,
     stdout=sys.stdout,
 ):
     """Print a list of test_ids for a project
@@ -127,11 +164,31 @@ def list_command(
     :param list filters: A list of string regex filters to initially apply on
         the test list. Tests that match any of the regexes will be used.
         (assuming any other filtering specified also uses it)
+    :param str shard: An optional ``INDEX/TOTAL`` string, if set only the
+        tests in that shard of the selected tests are listed, see
+        :func:`stestr.scheduler.select_shard`. INDEX starts at 1.
+    :param bool discovery_cache: Reuse the test ids listed by earlier
+        commands while the python files in the test path are unchanged, see
+        :mod:`stestr.discovery`.
+    :param bool parallel_discovery: List the tests in each package in the
+        test path with a separate process, up to one for each CPU at a time.
+    :param bool static_discovery: Find the tests by parsing the test modules
+        instead of importing them where possible, see
+        :mod:`stestr.ast_discovery`.
     :param file stdout: The output file to write all output to. By default
         this is sys.stdout
 
     """
     ids = None
+    if shard is not None:
+        try:
+            shard = utils.parse_shard(shard)
+        except ValueError:
+            stdout.write(
+                "The provided shard: %s is not valid. INDEX/TOTAL with "
+                "1 <= INDEX <= TOTAL must be used.\n" % shard
+            )
+            return 2
     conf = config_file.TestrConf.load_from_file(config)
     cmd = conf.get_run_command(
         regexes=filters,
@@ -142,12 +199,17 @@ def list_command(
         exclude_regex=exclude_regex,
         test_path=test_path,
         top_dir=top_dir,
+        shard=shard,
+        cache_discovery=discovery_cache,
+        parallel_discovery=parallel_discovery,
+        static_discovery=static_discovery,
     )
     not_filtered = (
         filters is None
         and include_list is None
         and exclude_list is None
         and exclude_regex is None
+        and shard is None
     )
     try:
         cmd.setUp()
@@ -184,6 +184,8 @@ def load(
     serial=False,
     all_attachments=False,
     show_binary_attachments=False,
+    spawn_time=None,
+    result_decorator=None,
 ):
     """Load subunit streams into a repository
 
@@ -212,6 +214,13 @@ def load(
         text attachments on successful test execution.
     :param bool show_binary_attachments: When set to true, subunit_trace will
         print binary attachments in addition to text attachments.
+    :param datetime spawn_time: The time the workers writing in_streams were
+        started. If set the time each worker took to emit its first event is
+        used to update the repository's estimate of worker startup time.
+    :param result_decorator: An optional callable which is passed the
+        StreamResult that the streams are loaded into, and returns the
+        StreamResult to send the events of the streams to instead. For
+        example to drop duplicate results.
 
     :return return_code: The exit code for the command. 0 for success and > 0
         for failures.
@@ -262,6 +271,11 @@ def load(
     else:
         inserter = repo.get_inserter(run_id=run_id)
 
+    extra_results = []
+    if spawn_time is not None:
+        startup_result = results.StartupTimeResult(spawn_time)
+        extra_results.append(startup_result)
+
     retval = 0
     if serial:
         for stream in streams:
@@ -279,6 +293,8 @@ def load(
                 suppress_attachments,
                 all_attachments,
                 show_binary_attachments,
+                extra_results,
+                result_decorator,
             )
             if result or retval:
                 retval = 1
@@ -298,11 +314,27 @@ def load(
             suppress_attachments,
             all_attachments,
             show_binary_attachments,
+            extra_results,
+            result_decorator,
         )
 
+    if spawn_time is not None:
+        _update_startup_time(repo, startup_result.get_startup_times())
     return retval
 
 
+def _update_startup_time(repo, startup_times):
+    if not startup_times:
+        return
+    startup_time = sum(startup_times) / len(startup_times)
+    previous = repo.get_startup_time()
+    # Average with the previous estimate so that a single slow start (for
+    # example from a cold disk cache) doesn't skew the next run too much.
+    if previous is not None:
+        startup_time = (startup_time + previous) / 2
+    repo.set_startup_time(startup_time)
+
+
 def _load_case(
     inserter,
     repo,
@@ -315,6 +347,8 @@ def _load_case(
     suppress_attachments,
     all_attachments,
     show_binary_attachments,
+    extra_results=(),
+    result_decorator=None,
 ):
     if subunit_out:
         output_result, summary_result = output.make_result(
@@ -344,7 +378,9 @@ def _load_case(
             previous_run = None
         output_result = results.CLITestResult(inserter.get_id, stdout, previous_run)
         summary_result = output_result.get_summary()
-    result = testtools.CopyStreamResult([inserter, output_result])
+    result = testtools.CopyStreamResult([inserter, output_result] + list(extra_results))
+    if result_decorator is not None:
+        result = result_decorator(result)
     result.startTestRun()
     try:
         case.run(result)
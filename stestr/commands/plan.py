@@ -0,0 +1,352 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Show how tests would be scheduled without running them."""
+
+import sys
+
+from cliff import command
+
+from stestr import config_file
+from stestr import output
+from stestr.repository import timing
+from stestr.repository import util
+from stestr import scheduler
+from stestr import utils
+
+
+class Plan(command.Command):
+    """Show how the tests would be split between workers.
+
+    The tests are listed and filtered just like with the run command, and
+    then partitioned using the timing data in the repository, but no tests
+    are run. This shows the predicted time each worker would take and how
+    the predicted run time changes with the number of workers.
+    """
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.add_argument(
+            "filters",
+            nargs="*",
+            default=None,
+            help="A list of string regex filters to initially "
+            "apply on the test list. Tests that match any of "
+            "the regexes will be used. (assuming any other "
+            "filtering specified also uses it)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            action="store",
+            default=0,
+            type=int,
+            help="How many workers to plan for. The default (0) "
+            "autodetects your CPU count.",
+        )
+        parser.add_argument(
+            "--max-concurrency",
+            action="store",
+            default=None,
+            type=int,
+            help="Predict the run time for every number of workers up "
+            "to this. Defaults to the larger of --concurrency and "
+            "twice your CPU count.",
+        )
+        parser.add_argument(
+            "--worker-file",
+            action="store",
+            default=None,
+            dest="worker_path",
+            help="Optional path of a manual worker grouping file to plan with",
+        )
+        parser.add_argument(
+            "--exclude-list",
+            "-e",
+            default=None,
+            dest="exclude_list",
+            help="Path to an exclusion list file, this file "
+            "contains a separate regex exclude on each "
+            "newline",
+        )
+        parser.add_argument(
+            "--include-list",
+            "-i",
+            default=None,
+            dest="include_list",
+            help="Path to an inclusion list file, this file "
+            "contains a separate regex on each newline.",
+        )
+        parser.add_argument(
+            "--exclude-regex",
+            "-E",
+            default=None,
+            dest="exclude_regex",
+            help="Test rejection regex. If a test cases name "
+            "matches on re.search() operation , "
+            "it will be removed from the final test list.",
+        )
+        parser.add_argument(
+            "--time-estimator",
+            choices=timing.ESTIMATORS,
+            default="last",
+            help="How to estimate each test's duration from its "
+            "recorded timing history, see the run command.",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        args = parsed_args
+        if args.concurrency < 0 or (
+            args.max_concurrency is not None and args.max_concurrency < 1
+        ):
+            sys.stdout.write("The number of workers to plan for must be positive.\n")
+            return 2
+        return plan(
+            config=self.app_args.config,
+            repo_url=self.app_args.repo_url,
+            test_path=self.app_args.test_path,
+            top_dir=self.app_args.top_dir,
+            group_regex=self.app_args.group_regex,
+            concurrency=args.concurrency,
+            max_concurrency=args.max_concurrency,
+            worker_path=args.worker_path,
+            exclude_list=args.exclude_list,
+            include_list=args.include_list,
+            exclude_regex=args.exclude_regex,
+            filters=args.filters or None,
+            time_estimator=args.time_estimator,
+        )
+
+
+def predict_loads(partitions, test_times, fixture_times, startup_time, weights=None):
+    """Predict how long each worker will take to run its partition.
+
+    :param list partitions: A list of lists of test ids, one for each worker
+    :param dict test_times: A dict mapping test ids to their duration, tests
+        which aren't in it are counted as taking no time.
+    :param dict fixture_times: A dict mapping class and module ids to the
+        cost of their fixtures, which every worker running a test from that
+        class or module pays.
+    :param float startup_time: The time it takes to start a worker
+    :param list weights: An optional relative speed for each worker, the time
+        a worker takes to run its tests is divided by its weight.
+    :return: A list of the predicted time for each partition, None for
+        empty partitions as no worker is started for them.
+    """
+    loads = []
+    for index, partition in enumerate(partitions):
+        if not partition:
+            loads.append(None)
+            continue
+        fixtures = set()
+        load = 0.0
+        for test_id in partition:
+            load += test_times.get(test_id, 0.0)
+            if fixture_times:
+                fixtures.update(utils.get_parent_ids(test_id, 2))
+        load += sum(fixture_times.get(x, 0.0) for x in fixtures)
+        if weights:
+            load /= weights[index]
+        loads.append(startup_time + load)
+    return loads
+
+
+def summarize_loads(loads):
+    """Return the makespan and imbalance ratio of the worker loads.
+
+    The imbalance ratio is the slowest worker's time divided by the mean time
+    of the workers, 1.0 is a perfect balance.
+    """
+    loads = [x for x in loads if x is not None]
+    if not loads:
+        return 0.0, 1.0
+    makespan = max(loads)
+    mean = sum(loads) / len(loads)
+    return makespan, makespan / mean if mean else 1.0
+
+
+def stops_improving(makespans):
+    """Return the number of workers at which adding more stops helping.
+
+    :param list makespans: The predicted makespan for 1, 2, ... workers.
+    :return: The fewest workers with the lowest makespan, compared to the
+        millisecond as they are printed, and that makespan.
+    """
+    best = min(round(x, 3) for x in makespans)
+    for workers, makespan in enumerate(makespans, 1):
+        if round(makespan, 3) <= best:
+            return workers, makespan
+
+
+def plan(
+    config=config_file.TestrConf.DEFAULT_CONFIG_FILENAME,
+    repo_url=None,
+    test_path=None,
+    top_dir=None,
+    group_regex=None,
+    concurrency=0,
+    max_concurrency=None,
+    worker_path=None,
+    exclude_list=None,
+    include_list=None,
+    exclude_regex=None,
+    filters=None,
+    time_estimator="last",
+    stdout=sys.stdout,
+):
+    """Print the predicted schedule for a test run without running it
+
+    The tests are listed and filtered as the run command would, partitioned
+    between the workers, and the predicted time each worker will take, the
+    makespan (the time the slowest worker takes) and the imbalance ratio
+    (the makespan divided by the mean worker time) are printed. Unless a
+    worker file is used the makespan is also predicted for every number of
+    workers from 1 to max_concurrency, along with the number of workers at
+    which adding more stops reducing it and the number of workers
+    ``--concurrency auto`` would choose, see
+    :func:`stestr.scheduler.choose_concurrency`.
+
+    :param str config: The path to the stestr config file. Must be a string.
+    :param str repo_url: The url of the repository to use.
+    :param str test_path: Set the test path to use for unittest discovery.
+        If both this and the corresponding config file option are set, this
+        value will be used.
+    :param str top_dir: The top dir to use for unittest discovery. This takes
+        precedence over the value in the config file. (if one is present in
+        the config file)
+    :param str group_regex: Set a group regex to use for grouping tests
+        together in the stestr scheduler. If both this and the corresponding
+        config file option are set this value will be used.
+    :param int concurrency: How many workers to plan for. The default (0)
+        autodetects your CPU count and uses that.
+    :param int max_concurrency: The most workers to predict the makespan for.
+        Defaults to the larger of concurrency and twice the CPU count.
+    :param str worker_path: Optional path of a manual worker grouping file
+        to plan with.
+    :param str exclude_list: Path to an exclusion list file, this file
+        contains a separate regex exclude on each newline.
+    :param str include_list: Path to an inclusion list file, this file
+        contains a separate regex on each newline.
+    :param str exclude_regex: Test rejection regex. If a test cases name
+        matches on re.search() operation, it will be removed from the final
+        test list.
+    :param list filters: A list of string regex filters to initially apply on
+        the test list. Tests that match any of the regexes will be used.
+        (assuming any other filtering specified also uses it)
+    :param str time_estimator: How to estimate each test's duration from its
+        timing history. One of ``last``, ``mean``, ``ewma``, ``p50`` or
+        ``p90``.
+    :param file stdout: The output file to write all output to. By default
+        this is sys.stdout
+
+    :return return_code: The exit code for the command. 0 for success and > 0
+        for failures.
+    :rtype: int
+    """
+    cpus = scheduler.local_concurrency() or 1
+    concurrency = concurrency or cpus
+    if max_concurrency is None:
+        max_concurrency = max(concurrency, cpus * 2)
+    conf = config_file.TestrConf.load_from_file(config)
+    cmd = conf.get_run_command(
+        regexes=filters,
+        repo_url=repo_url,
+        group_regex=group_regex,
+        exclude_list=exclude_list,
+        include_list=include_list,
+        exclude_regex=exclude_regex,
+        test_path=test_path,
+        top_dir=top_dir,
+        time_estimator=time_estimator,
+    )
+    try:
+        cmd.setUp()
+        ids = cmd.test_ids
+        if ids is None:
+            ids = cmd.list_tests()
+        group_callback = cmd._group_callback
+    finally:
+        cmd.cleanUp()
+    if not ids:
+        stdout.write("The specified regex doesn't match with anything\n")
+        return 1
+    repo = util.get_repo_open(repo_url=repo_url)
+    test_times = repo.get_test_times(ids, time_estimator)["known"]
+    fixture_times = repo.get_fixture_times()
+    startup_time = repo.get_startup_time() or 0.0
+
+    weights = scheduler.get_worker_weights(worker_path) if worker_path else None
+
+    def partition(workers):
+        estimates = {}
+        if worker_path:
+            partitions = scheduler.generate_worker_partitions(
+                ids,
+                worker_path,
+                repo,
+                group_callback,
+                estimator=time_estimator,
+                estimates=estimates,
+            )
+        else:
+            partitions = scheduler.partition_tests(
+                ids,
+                workers,
+                repo,
+                group_callback,
+                estimator=time_estimator,
+                estimates=estimates,
+            )
+        times = {**test_times, **estimates}
+        loads = predict_loads(partitions, times, fixture_times, startup_time, weights)
+        return partitions, loads
+
+    partitions, loads = partition(concurrency)
+    rows = [("Worker", "Tests", "Predicted time (s)")]
+    for worker, (tests, load) in enumerate(zip(partitions, loads)):
+        rows.append((worker, len(tests), "-" if load is None else "%.3f" % load))
+    output.output_table(rows, output=stdout)
+    makespan, imbalance = summarize_loads(loads)
+    stdout.write(
+        "\nPredicted makespan: %.3fs, imbalance (slowest / mean worker): %.2f\n"
+        % (makespan, imbalance)
+    )
+    untimed = len(ids) - len(test_times)
+    if untimed:
+        stdout.write(
+            "%d of %d tests have no timing data, those without related timed "
+            "tests are counted as taking no time\n" % (untimed, len(ids))
+        )
+    if worker_path:
+        return 0
+
+    stdout.write("\n")
+    rows = [("Workers", "Makespan (s)", "Imbalance")]
+    makespans = []
+    for workers in range(1, max_concurrency + 1):
+        makespan, imbalance = summarize_loads(partition(workers)[1])
+        makespans.append(makespan)
+        rows.append((workers, "%.3f" % makespan, "%.2f" % imbalance))
+    output.output_table(rows, output=stdout)
+    workers, makespan = stops_improving(makespans)
+    stdout.write(
+        "\nAdding workers stops reducing the predicted makespan at %d workers "
+        "(%.3fs)\n" % (workers, makespan)
+    )
+    choice = scheduler.choose_concurrency(
+        ids, repo, cpus, group_callback, time_estimator
+    )
+    stdout.write("--concurrency auto would use %d workers" % choice.workers)
+    if choice.makespan is not None:
+        stdout.write(", predicted to take %.3fs" % choice.makespan)
+    stdout.write(": %s\n" % choice.reason)
+    return 0
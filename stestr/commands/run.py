@@ -12,6 +12,7 @@
 
 """Run a projects tests and load them into stestr."""
 
+import argparse
 import errno
 import functools
 import io
@@ -24,18 +25,22 @@ from cliff import command
 import subunit
 import testtools
 
+from stestr import agent
 from stestr import bisect_tests
 from stestr.commands import load
 from stestr.commands import slowest
 from stestr import config_file
 from stestr import output
+from stestr import pool
 from stestr.repository import abstract as repository
+from stestr.repository import timing
 from stestr.repository import util
 from stestr import results
 from stestr.subunit_runner import program
 from stestr.subunit_runner import run as subunit_run
 from stestr.testlist import parse_list
 from stestr import user_config
+from stestr import utils
 
 
 def _to_int(possible, default=0, out=sys.stderr):
@@ -48,6 +53,17 @@ def _to_int(possible, default=0, out=sys.stderr):
     return i
 
 
+def _concurrency_type(value):
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid concurrency: %r, must be an integer or auto" % value
+        )
+
+
 class Run(command.Command):
     """Run the tests for a project and store them into the repository.
 
@@ -86,9 +102,11 @@ class Run(command.Command):
             "--concurrency",
             action="store",
             default=None,
-            type=int,
+            type=_concurrency_type,
             help="How many processes to use. The default (0) "
-            "autodetects your CPU count.",
+            "autodetects your CPU count. 'auto' chooses how many "
+            "up to the CPU count, from the recorded test times and "
+            "worker startup time, to finish the run soonest.",
         )
         parser.add_argument(
             "--load-list", default=None, help="Only run tests listed in the named file."
@@ -109,13 +127,23 @@ class Run(command.Command):
             "--analyze-isolation",
             action="store_true",
             default=False,
-            help="Search the last test run for 2-test test " "isolation interactions.",
+            help="Search the last test run for the tests which make other "
+            "tests fail when run before them.",
         )
         parser.add_argument(
             "--isolated",
             action="store_true",
             default=False,
-            help="Run each test id in a separate test runner.",
+            help="Run each test id in a separate test runner, running up "
+            "to --concurrency of them at the same time.",
+        )
+        parser.add_argument(
+            "--warm-pool",
+            action="store_true",
+            default=False,
+            help="With --until-failure, --isolated or --analyze-isolation, "
+            "keep the test runner processes running between the runs "
+            "instead of discovering and importing the tests for every run.",
         )
         parser.add_argument(
             "--worker-file",
@@ -124,6 +152,28 @@ class Run(command.Command):
             dest="worker_path",
             help="Optional path of a manual worker grouping " "file to use for the run",
         )
+        parser.add_argument(
+            "--agent",
+            action="append",
+            default=None,
+            dest="agents",
+            metavar="ADDRESS",
+            help="The host:port or unix socket path of a 'stestr agent' "
+            "to run a share of the tests on, alongside the local "
+            "workers. May be given more than once, and an agent "
+            "given twice runs two shares at a time. The shared key "
+            "must be set in the %s environment variable." % agent.AUTHKEY_ENV,
+        )
+        parser.add_argument(
+            "--shard",
+            default=None,
+            metavar="INDEX/TOTAL",
+            help="Only run one of TOTAL shards of the selected tests, for "
+            "splitting a run between several jobs. The shards are "
+            "balanced using the timing data in the repository, and jobs "
+            "which use the same repository contents get shards which "
+            "neither overlap nor miss tests. INDEX starts at 1.",
+        )
         parser.add_argument(
             "--exclude-list",
             "-e",
@@ -182,6 +232,120 @@ class Run(command.Command):
             help="Randomize the test order after they are "
             "partitioned into separate workers",
         )
+        parser.add_argument(
+            "--dynamic",
+            action="store_true",
+            default=False,
+            help="Instead of partitioning the tests up front, "
+            "have each worker request small batches of tests "
+            "as it becomes idle.",
+        )
+        parser.add_argument(
+            "--speculate",
+            action="store_true",
+            default=False,
+            help="With --dynamic, once there are no tests left to hand "
+            "out, give idle workers copies of the tests still waiting "
+            "on the busiest worker (and of the test it is running if "
+            "that has the idempotent attribute). The first result of "
+            "each test is kept.",
+        )
+        parser.add_argument(
+            "--pipeline",
+            action="store_true",
+            default=False,
+            help="With --dynamic, start the workers right away instead of "
+            "after the tests are listed, and hand them the tests of each "
+            "package in the test path as soon as it has been listed.",
+        )
+        parser.add_argument(
+            "--discovery-cache",
+            action="store_true",
+            default=False,
+            help="Reuse the test ids listed by earlier commands instead of "
+            "listing the tests again, while the python files in the test "
+            "path are unchanged. Only the test modules which changed are "
+            "listed again.",
+        )
+        parser.add_argument(
+            "--parallel-discovery",
+            action="store_true",
+            default=False,
+            help="List the tests in each package in the test path with a "
+            "separate process, running as many at the same time as the "
+            "run has workers.",
+        )
+        parser.add_argument(
+            "--static-discovery",
+            action="store_true",
+            default=False,
+            help="Find the tests by parsing the test modules instead of "
+            "importing them, only importing the modules whose tests can't "
+            "be found that way, like those with a load_tests function.",
+        )
+        parser.add_argument(
+            "--targeted-load",
+            action="store_true",
+            default=False,
+            help="Have each test runner process import only the test "
+            "modules of the tests it was given, instead of discovering and "
+            "importing every test module. A runner falls back to discovering "
+            "all of the tests when its tests can't be found that way, like "
+            "when a load_tests function is used.",
+        )
+        parser.add_argument(
+            "--fork-server",
+            action="store_true",
+            default=False,
+            help="Discover and import the tests once in a single process, "
+            "which then forks a worker for each partition instead of "
+            "starting a new process for each one. Only supported on "
+            "platforms with fork().",
+        )
+        parser.add_argument(
+            "--failfast",
+            action="store_true",
+            default=False,
+            help="Stop every worker as soon as any test fails. The "
+            "results of the tests which finished before that are still "
+            "stored.",
+        )
+        parser.add_argument(
+            "--longest-first",
+            action="store_true",
+            default=False,
+            help="Run the tests which took longest in previous runs "
+            "first on each worker, keeping the tests of a class or "
+            "group together. This can not be used with --random.",
+        )
+        parser.add_argument(
+            "--memory-limit",
+            default=None,
+            metavar="SIZE",
+            help="Limit the total memory which the tests running at "
+            "the same time have been recorded using, for example 8G. "
+            "Tests which use more than their share of it are kept on "
+            "fewer workers. This can not be used with --dynamic.",
+        )
+        parser.add_argument(
+            "--record-memory",
+            action="store_true",
+            default=False,
+            help="Record the memory used by each test in the repository, "
+            "for later runs with --memory-limit. This is implied by "
+            "--memory-limit.",
+        )
+        parser.add_argument(
+            "--time-estimator",
+            choices=timing.ESTIMATORS,
+            default=None,
+            help="How to estimate each test's duration from its "
+            "recorded timing history when scheduling. 'last' "
+            "uses the most recent duration, 'mean' and 'ewma' "
+            "the mean and moving average, and 'p50' and 'p90' "
+            "percentiles of the recent durations. Defaults to "
+            "'last'.",
+        )
         parser.add_argument(
             "--combine",
             action="store_true",
@@ -274,6 +438,33 @@ class Run(command.Command):
             else:
                 concurrency = args.concurrency
             random = args.random or user_conf.run.get("random", False)
+            dynamic = args.dynamic or user_conf.run.get("dynamic", False)
+            speculate = args.speculate or user_conf.run.get("speculate", False)
+            pipeline = args.pipeline or user_conf.run.get("pipeline", False)
+            failfast = args.failfast or user_conf.run.get("failfast", False)
+            fork_server = args.fork_server or user_conf.run.get("fork-server", False)
+            discovery_cache = args.discovery_cache or user_conf.run.get(
+                "discovery-cache", False
+            )
+            parallel_discovery = args.parallel_discovery or user_conf.run.get(
+                "parallel-discovery", False
+            )
+            static_discovery = args.static_discovery or user_conf.run.get(
+                "static-discovery", False
+            )
+            targeted_load = args.targeted_load or user_conf.run.get(
+                "targeted-load", False
+            )
+            longest_first = args.longest_first or user_conf.run.get(
+                "longest-first", False
+            )
+            memory_limit = args.memory_limit or user_conf.run.get("memory-limit")
+            record_memory = args.record_memory or user_conf.run.get(
+                "record-memory", False
+            )
+            time_estimator = args.time_estimator or user_conf.run.get(
+                "time-estimator", "last"
+            )
             color = args.color or user_conf.run.get("color", False)
             abbreviate = args.abbreviate or user_conf.run.get("abbreviate", False)
             suppress_attachments_conf = user_conf.run.get("suppress-attachments", False)
@@ -291,6 +482,19 @@ class Run(command.Command):
             pretty_out = args.force_subunit_trace or not args.no_subunit_trace
             concurrency = args.concurrency or 0
             random = args.random
+            dynamic = args.dynamic
+            speculate = args.speculate
+            pipeline = args.pipeline
+            failfast = args.failfast
+            fork_server = args.fork_server
+            discovery_cache = args.discovery_cache
+            parallel_discovery = args.parallel_discovery
+            static_discovery = args.static_discovery
+            targeted_load = args.targeted_load
+            longest_first = args.longest_first
+            memory_limit = args.memory_limit
+            record_memory = args.record_memory
+            time_estimator = args.time_estimator or "last"
             color = args.color
             abbreviate = args.abbreviate
             suppress_attachments = args.suppress_attachments
@@ -298,8 +502,9 @@ class Run(command.Command):
         verbose_level = self.app.options.verbose_level
         stdout = open(os.devnull, "w") if verbose_level == 0 else sys.stdout
         # Make sure all (python) callers have provided an int()
-        concurrency = _to_int(concurrency)
-        if concurrency and concurrency < 0:
+        if concurrency != "auto":
+            concurrency = _to_int(concurrency)
+        if concurrency != "auto" and concurrency < 0:
             msg = (
                 "The provided concurrency value: %s is not valid. An "
                 "integer >= 0 must be used.\n" % concurrency
@@ -320,12 +525,28 @@ class Run(command.Command):
             until_failure=args.until_failure,
             analyze_isolation=args.analyze_isolation,
             isolated=args.isolated,
+            warm_pool=args.warm_pool,
             worker_path=args.worker_path,
+            agents=args.agents,
+            shard=args.shard,
             exclude_list=args.exclude_list,
             include_list=args.include_list,
             exclude_regex=args.exclude_regex,
             no_discover=args.no_discover,
             random=random,
+            dynamic=dynamic,
+            speculate=speculate,
+            pipeline=pipeline,
+            failfast=failfast,
+            fork_server=fork_server,
+            discovery_cache=discovery_cache,
+            parallel_discovery=parallel_discovery,
+            static_discovery=static_discovery,
+            targeted_load=targeted_load,
+            longest_first=longest_first,
+            memory_limit=memory_limit,
+            record_memory=record_memory,
+            time_estimator=time_estimator,
             combine=args.combine,
             filters=filters,
             pretty_out=pretty_out,
@@ -381,12 +602,28 @@ def run_command(
     until_failure=False,
     analyze_isolation=False,
     isolated=False,
+    warm_pool=False,
     worker_path=None,
+    agents=None,
+    shard=None,
     exclude_list=None,
     include_list=None,
     exclude_regex=None,
     no_discover=False,
     random=False,
+    dynamic=False,
+    speculate=False,
+    pipeline=False,
+    failfast=False,
+    fork_server=False,
+    discovery_cache=False,
+    parallel_discovery=False,
+    static_discovery=False,
+    targeted_load=False,
+    longest_first=False,
+    memory_limit=None,
+    record_memory=False,
+    time_estimator="last",
     combine=False,
     filters=None,
     pretty_out=True,
@@ -419,17 +656,33 @@ def run_command(
     :param bool failing: Run only tests known to be failing.
     :param bool serial: Run tests serially
     :param int concurrency: "How many processes to use. The default (0)
-        autodetects your CPU count and uses that.
+        autodetects your CPU count and uses that. If this is ``auto`` the
+        number is chosen from the recorded test and worker startup times,
+        up to the CPU count.
     :param str load_list: The path to a list of test_ids. If specified only
         tests listed in the named file will be run.
     :param bool subunit_out: Display results in subunit format.
     :param bool until_failure: Repeat the run again and again until failure
         occurs.
-    :param bool analyze_isolation: Search the last test run for 2-test test
-        isolation interactions.
-    :param bool isolated: Run each test id in a separate test runner.
+    :param bool analyze_isolation: Search the last test run for the tests
+        which make other tests fail when run before them.
+    :param bool isolated: Run each test id in a separate test runner, up to
+        concurrency of them at the same time. The results of every test are
+        stored as a single run. With warm_pool each test is run as a batch of
+        its own on up to concurrency pool workers.
+    :param bool warm_pool: Keep the test runner processes running between
+        the runs of until_failure, isolated or analyze_isolation, so the tests
+        are only discovered and imported once. This can not be used with
+        dynamic, agents, failfast, no_discover or pdb.
     :param str worker_path: Optional path of a manual worker grouping file
         to use for the run.
+    :param list agents: An optional list of ``stestr agent`` addresses to
+        run a share of the tests on alongside the local workers. This can not
+        be used with serial, worker_path, dynamic or isolated.
+    :param str shard: An optional ``INDEX/TOTAL`` string, if set only the
+        tests in that shard of the selected tests are run. The shards all
+        have the same predicted duration, see
+        :func:`stestr.scheduler.select_shard`. INDEX starts at 1.
     :param str exclude_list: Path to an exclusion list file, this file
         contains a separate regex exclude on each newline.
     :param str include_list: Path to a inclusion list file, this file
@@ -442,6 +695,44 @@ def run_command(
         in place of a test name.
     :param bool random: Randomize the test order after they are partitioned
         into separate workers
+    :param bool dynamic: Have each worker request batches of tests as it
+        becomes idle instead of partitioning the tests up front.
+    :param bool speculate: With dynamic, once there are no tests left to
+        hand out give idle workers copies of the tests still waiting on the
+        busiest worker, keeping the first result of each test. This can only
+        be used with dynamic.
+    :param bool pipeline: With dynamic, start the workers before listing the
+        tests and hand them the tests of each package in the test path as
+        soon as it has been listed. This can only be used with dynamic.
+    :param bool failfast: Stop every worker as soon as a test fails, keeping
+        the results of the tests which finished before that. This can not be
+        used with agents or analyze_isolation.
+    :param bool fork_server: Discover and import the tests once in a single
+        process which forks a worker for each partition. This requires
+        os.fork and can not be used with dynamic, agents, warm_pool,
+        failfast, no_discover or pdb.
+    :param bool discovery_cache: Reuse the test ids listed by earlier
+        commands while the python files in the test path are unchanged, see
+        :mod:`stestr.discovery`.
+    :param bool parallel_discovery: List the tests in each package in the
+        test path with a separate process, up to concurrency at a time.
+    :param bool static_discovery: Find the tests by parsing the test modules
+        instead of importing them where possible, see
+        :mod:`stestr.ast_discovery`.
+    :param bool targeted_load: Have each test runner process only import the
+        test modules of the tests it runs, where that finds the same tests as
+        discovering all of them, see :func:`stestr.discovery.find_modules`.
+    :param bool longest_first: Run the slowest tests first on each worker,
+        keeping the tests of each class or group together. This can not be
+        used with random.
+    :param memory_limit: A limit on the total memory the tests running at the
+        same time have been recorded using, either in bytes or as a string
+        like ``8G``. This can not be used with dynamic.
+    :param bool record_memory: Record the memory used by each test in the
+        repository, this is implied by memory_limit.
+    :param str time_estimator: How to estimate each test's duration from its
+        timing history when scheduling. One of ``last``, ``mean``, ``ewma``,
+        ``p50`` or ``p90``.
     :param bool combine: Combine the results from the test run with the
         last run in the repository
     :param list filters: A list of string regex filters to initially apply on
@@ -493,9 +784,10 @@ def run_command(
             return 1
 
     combine_id = None
-    concurrency = _to_int(concurrency)
+    if concurrency != "auto":
+        concurrency = _to_int(concurrency)
 
-    if concurrency and concurrency < 0:
+    if concurrency != "auto" and concurrency < 0:
         msg = (
             "The provided concurrency value: %s is not valid. An integer "
             ">= 0 must be used.\n" % concurrency
@@ -512,6 +804,128 @@ def run_command(
         )
         stdout.write(msg)
         return 2
+    if speculate and not dynamic:
+        stdout.write("--speculate can only be used with --dynamic")
+        return 2
+    if pipeline and not dynamic:
+        stdout.write("--pipeline can only be used with --dynamic")
+        return 2
+    if warm_pool:
+        if not (until_failure or isolated or analyze_isolation):
+            stdout.write(
+                "--warm-pool can only be used with --until-failure, "
+                "--isolated or --analyze-isolation"
+            )
+            return 2
+        for option, value in (
+            ("--dynamic", dynamic),
+            ("--agent", agents),
+            ("--failfast", failfast),
+            ("--no-discover", no_discover),
+            ("--pdb", pdb),
+        ):
+            if value:
+                stdout.write(
+                    "--warm-pool and %s are mutually exclusive options, only "
+                    "specify one at a time" % option
+                )
+                return 2
+    if fork_server:
+        if not hasattr(os, "fork"):
+            stdout.write("--fork-server is not supported on this platform")
+            return 2
+        for option, value in (
+            ("--dynamic", dynamic),
+            ("--agent", agents),
+            ("--warm-pool", warm_pool),
+            ("--failfast", failfast),
+            ("--no-discover", no_discover),
+            ("--pdb", pdb),
+        ):
+            if value:
+                stdout.write(
+                    "--fork-server and %s are mutually exclusive options, only "
+                    "specify one at a time" % option
+                )
+                return 2
+    if failfast and analyze_isolation:
+        msg = (
+            "--failfast and --analyze-isolation are mutually exclusive "
+            "options, only specify one at a time"
+        )
+        stdout.write(msg)
+        return 2
+    if random and longest_first:
+        msg = (
+            "--random and --longest-first are mutually exclusive options, "
+            "only specify one at a time"
+        )
+        stdout.write(msg)
+        return 2
+    if memory_limit is not None:
+        if dynamic:
+            msg = (
+                "--dynamic and --memory-limit are mutually exclusive options, "
+                "only specify one at a time"
+            )
+            stdout.write(msg)
+            return 2
+        try:
+            memory_limit = utils.parse_memory_size(memory_limit)
+        except ValueError:
+            msg = (
+                "The provided memory limit: %s is not valid. A number of "
+                "bytes optionally followed by K, M, G or T must be used.\n"
+                % memory_limit
+            )
+            stdout.write(msg)
+            return 2
+        # The limit is only as good as the memory use recorded for it.
+        record_memory = True
+    if agents:
+        for option, value in (
+            ("--serial", serial),
+            ("--worker-file", worker_path),
+            ("--dynamic", dynamic),
+            ("--isolated", isolated),
+            ("--analyze-isolation", analyze_isolation),
+            ("--no-discover", no_discover),
+            ("--pdb", pdb),
+            ("--failfast", failfast),
+        ):
+            if value:
+                stdout.write(
+                    "--agent and %s are mutually exclusive options, only "
+                    "specify one at a time" % option
+                )
+                return 2
+        if agent.get_authkey() is None:
+            stdout.write(
+                "The key shared with the agents must be set in the %s "
+                "environment variable\n" % agent.AUTHKEY_ENV
+            )
+            return 2
+    if shard is not None:
+        for option, value in (
+            ("--isolated", isolated),
+            ("--analyze-isolation", analyze_isolation),
+            ("--no-discover", no_discover),
+            ("--pdb", pdb),
+        ):
+            if value:
+                stdout.write(
+                    "--shard and %s are mutually exclusive options, only "
+                    "specify one at a time" % option
+                )
+                return 2
+        try:
+            shard = utils.parse_shard(shard)
+        except ValueError:
+            stdout.write(
+                "The provided shard: %s is not valid. INDEX/TOTAL with "
+                "1 <= INDEX <= TOTAL must be used.\n" % shard
+            )
+            return 2
     if pdb and until_failure:
         msg = (
             "pdb mode does not function with the --until-failure flag, "
@@ -540,7 +954,12 @@ def run_command(
             raise RuntimeError(
                 "The Python interpreter was not found and " "PYTHON is not set"
             )
-        run_cmd = python_bin + " -m stestr.subunit_runner.run " + ids
+        run_cmd = python_bin + " -m stestr.subunit_runner.run "
+        if failfast:
+            run_cmd += "--failfast "
+        if record_memory:
+            run_cmd += "--record-memory "
+        run_cmd += ids
 
         def run_tests():
             run_proc = [
@@ -604,6 +1023,7 @@ def run_command(
             module=None,
             argv=["stestr", ids],
             testRunner=functools.partial(runner, stdout=stream),
+            failfast=failfast,
         )
         stream.seek(0)
         run_proc = [("subunit", stream)]
@@ -639,65 +1059,41 @@ def run_command(
             ids = list_ids.intersection(ids)
 
     conf = config_file.TestrConf.load_from_file(config)
-    if not analyze_isolation:
-        cmd = conf.get_run_command(
-            ids,
-            regexes=filters,
-            group_regex=group_regex,
-            repo_url=repo_url,
-            serial=serial,
-            worker_path=worker_path,
-            concurrency=concurrency,
-            exclude_list=exclude_list,
-            include_list=include_list,
-            exclude_regex=exclude_regex,
-            top_dir=top_dir,
-            test_path=test_path,
-            randomize=random,
-        )
-        if isolated:
-            result = 0
-            cmd.setUp()
-            try:
-                ids = cmd.list_tests()
-            finally:
-                cmd.cleanUp()
-            for test_id in ids:
-                # TODO(mtreinish): add regex
-                cmd = conf.get_run_command(
-                    [test_id],
-                    filters,
-                    group_regex=group_regex,
-                    repo_url=repo_url,
-                    serial=serial,
-                    worker_path=worker_path,
-                    concurrency=concurrency,
-                    exclude_list=exclude_list,
-                    include_list=include_list,
-                    exclude_regex=exclude_regex,
-                    randomize=random,
-                    test_path=test_path,
-                    top_dir=top_dir,
-                )
-
-                run_result = _run_tests(
-                    cmd,
-                    until_failure,
-                    subunit_out=subunit_out,
-                    combine_id=combine_id,
-                    repo_url=repo_url,
-                    pretty_out=pretty_out,
-                    color=color,
-                    abbreviate=abbreviate,
-                    stdout=stdout,
-                    suppress_attachments=suppress_attachments,
-                    all_attachments=all_attachments,
-                    show_binary_attachments=show_binary_attachments,
-                )
-                if run_result > result:
-                    result = run_result
-            return result
-        else:
+    worker_pool = pool.WorkerPool() if warm_pool else None
+    try:
+        if not analyze_isolation:
+            cmd = conf.get_run_command(
+                ids,
+                regexes=filters,
+                group_regex=group_regex,
+                repo_url=repo_url,
+                serial=serial,
+                worker_path=worker_path,
+                concurrency=concurrency,
+                exclude_list=exclude_list,
+                include_list=include_list,
+                exclude_regex=exclude_regex,
+                top_dir=top_dir,
+                test_path=test_path,
+                randomize=random,
+                dynamic=dynamic,
+                speculate=speculate,
+                pipeline=pipeline,
+                failfast=failfast,
+                time_estimator=time_estimator,
+                longest_first=longest_first,
+                memory_limit=memory_limit,
+                agents=agents,
+                shard=shard,
+                pool=worker_pool,
+                fork_server=fork_server,
+                cache_discovery=discovery_cache,
+                parallel_discovery=parallel_discovery,
+                static_discovery=static_discovery,
+                targeted_load=targeted_load,
+                isolated=isolated,
+                record_memory=record_memory,
+            )
             return _run_tests(
                 cmd,
                 until_failure,
@@ -712,59 +1108,67 @@ def run_command(
                 all_attachments=all_attachments,
                 show_binary_attachments=show_binary_attachments,
             )
-    else:
-        # Where do we source data about the cause of conflicts.
-        latest_run = repo.get_latest_run()
-        # Stage one: reduce the list of failing tests (possibly further
-        # reduced by testfilters) to eliminate fails-on-own tests.
-        spurious_failures = set()
-        for test_id in ids:
-            # TODO(mtrienish): Add regex
-            cmd = conf.get_run_command(
-                [test_id],
+        else:
+            # Where do we source data about the cause of conflicts.
+            latest_run = repo.get_latest_run()
+            # Stage one: reduce the list of failing tests (possibly further
+            # reduced by testfilters) to eliminate fails-on-own tests.
+            # This is arguably ugly, why not just tell the system that a pass
+            # here isn't a real pass? [so that when we find a test that is
+            # spuriously failing, we don't forget that it is actually failing.
+            # Alternatively, perhaps this is a case for data mining: when a
+            # test starts passing, keep a journal, and allow digging back in
+            # time to see that it was a failure, what it failed with etc...
+            # The current solution is to just let it get marked as a pass
+            # temporarily.
+            spurious_failures = set()
+            if ids:
+                # Run every failing test in a test runner of its own, up to
+                # concurrency at a time.
+                cmd = conf.get_run_command(
+                    list(ids),
+                    group_regex=group_regex,
+                    repo_url=repo_url,
+                    serial=serial,
+                    concurrency=concurrency,
+                    exclude_list=exclude_list,
+                    include_list=include_list,
+                    exclude_regex=exclude_regex,
+                    randomize=random,
+                    test_path=test_path,
+                    top_dir=top_dir,
+                    pool=worker_pool,
+                    targeted_load=targeted_load,
+                    isolated=True,
+                )
+                _run_tests(cmd, until_failure)
+                # If a test was filtered, it won't have been run.
+                run_ids = repo.get_test_ids(repo.latest_id())
+                still_failing = set(_find_failing(repo))
+                spurious_failures = {
+                    x for x in ids if x in run_ids and x not in still_failing
+                }
+            if not spurious_failures:
+                # All done.
+                return 0
+            bisect_runner = bisect_tests.IsolationAnalyzer(
+                latest_run,
+                conf,
+                repo=repo,
+                test_path=test_path,
+                top_dir=top_dir,
                 group_regex=group_regex,
                 repo_url=repo_url,
                 serial=serial,
-                worker_path=worker_path,
                 concurrency=concurrency,
-                exclude_list=exclude_list,
-                include_list=include_list,
-                exclude_regex=exclude_regex,
-                randomize=random,
-                test_path=test_path,
-                top_dir=top_dir,
+                pool=worker_pool,
+                targeted_load=targeted_load,
             )
-            if not _run_tests(cmd, until_failure):
-                # If the test was filtered, it won't have been run.
-                if test_id in repo.get_test_ids(repo.latest_id()):
-                    spurious_failures.add(test_id)
-                # This is arguably ugly, why not just tell the system that
-                # a pass here isn't a real pass? [so that when we find a
-                # test that is spuriously failing, we don't forget
-                # that it is actually failing.
-                # Alternatively, perhaps this is a case for data mining:
-                # when a test starts passing, keep a journal, and allow
-                # digging back in time to see that it was a failure,
-                # what it failed with etc...
-                # The current solution is to just let it get marked as
-                # a pass temporarily.
-        if not spurious_failures:
-            # All done.
-            return 0
-        bisect_runner = bisect_tests.IsolationAnalyzer(
-            latest_run,
-            conf,
-            _run_tests,
-            repo,
-            test_path=test_path,
-            top_dir=top_dir,
-            group_regex=group_regex,
-            repo_url=repo_url,
-            serial=serial,
-            concurrency=concurrency,
-        )
-        # spurious-failure -> cause.
-        return bisect_runner.bisect_tests(spurious_failures)
+            # spurious-failure -> cause.
+            return bisect_runner.bisect_tests(spurious_failures)
+    finally:
+        if worker_pool is not None:
+            worker_pool.close()
 
 
 def _run_tests(
@@ -784,16 +1188,28 @@ def _run_tests(
     """Run the tests cmd was parameterised with."""
     cmd.setUp()
     try:
+        if cmd.concurrency_choice and not subunit_out:
+            _report_concurrency(cmd.concurrency_choice, stdout)
 
         def run_tests():
+            try:
+                procs = cmd.run_tests()
+            except agent.AgentError as e:
+                stdout.write("%s\n" % e)
+                return 1
             run_procs = [
-                ("subunit", output.ReturnCodeToSubunit(proc))
-                for proc in cmd.run_tests()
+                ("subunit", output.ReturnCodeToSubunit(proc)) for proc in procs
             ]
             if not run_procs:
+                if cmd.unsharded_count:
+                    stdout.write(
+                        "None of the %d selected tests are in shard %d/%d\n"
+                        % ((cmd.unsharded_count,) + cmd.shard)
+                    )
+                    return 0
                 stdout.write("The specified regex doesn't match with anything")
                 return 1
-            return load.load(
+            result = load.load(
                 (None, None),
                 in_streams=run_procs,
                 subunit_out=subunit_out,
@@ -806,7 +1222,12 @@ def _run_tests(
                 suppress_attachments=suppress_attachments,
                 all_attachments=all_attachments,
                 show_binary_attachments=show_binary_attachments,
+                spawn_time=cmd.spawn_time,
+                result_decorator=cmd.decorate_result,
             )
+            if cmd.estimated_times and not subunit_out:
+                _report_estimates(cmd.estimated_times, repo_url, stdout)
+            return result
 
         if not until_failure:
             return run_tests()
@@ -832,3 +1253,31 @@ def _run_tests(
                     return result
     finally:
         cmd.cleanUp()
+
+
+def _report_concurrency(choice, stdout):
+    """Report the number of workers chosen for --concurrency auto."""
+    plural = "s" if choice.workers != 1 else ""
+    stdout.write("Running with %d worker%s" % (choice.workers, plural))
+    if choice.makespan is not None:
+        stdout.write(", predicted to take %.3fs" % choice.makespan)
+    stdout.write(": %s\n" % choice.reason)
+
+
+def _report_estimates(estimated_times, repo_url, stdout):
+    """Report how accurate the estimated test durations were."""
+    repo = util.get_repo_open(repo_url=repo_url)
+    actual_times = repo.get_test_times(estimated_times)["known"]
+    stdout.write(
+        "%d tests were scheduled using durations estimated from related tests"
+        % len(estimated_times)
+    )
+    if actual_times:
+        estimated = sum(estimated_times[x] for x in actual_times)
+        actual = sum(actual_times.values())
+        error = sum(abs(estimated_times[x] - actual_times[x]) for x in actual_times)
+        stdout.write(
+            ", estimated %.3fs and took %.3fs (mean absolute error %.3fs)"
+            % (estimated, actual, error / len(actual_times))
+        )
+    stdout.write("\n")
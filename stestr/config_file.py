@@ -113,6 +113,23 @@ class TestrConf:
         exclude_regex=None,
         randomize=False,
         parallel_class=None,
+        dynamic=False,
+        time_estimator="last",
+        longest_first=False,
+        memory_limit=None,
+        agents=None,
+        shard=None,
+        speculate=False,
+        failfast=False,
+        pool=None,
+        fork_server=False,
+        cache_discovery=False,
+        parallel_discovery=False,
+        static_discovery=False,
+        targeted_load=False,
+        pipeline=False,
+        isolated=False,
+        record_memory=False,
     ):
         """Get a test_processor.TestProcessorFixture for this config file
 
@@ -158,6 +175,43 @@ class TestrConf:
             stestr scheduler by class. If both this and the corresponding
             config file option which includes `group-regex` are set, this value
             will be used.
+        :param bool dynamic: Have workers request batches of tests from a
+            dispatcher as they become idle instead of partitioning the tests
+            up front.
+        :param str time_estimator: How the duration of each test is estimated
+            from its timing history when scheduling, one of ``last``,
+            ``mean``, ``ewma``, ``p50`` or ``p90``.
+        :param bool longest_first: Run the slowest tests first on each worker
+            instead of in the order they were discovered in.
+        :param int memory_limit: A limit in bytes on the total memory the
+            tests running at the same time have been recorded using.
+        :param list agents: The addresses of ``stestr agent`` processes to
+            run some of the tests on alongside the local workers.
+        :param tuple shard: An optional (index, total) tuple selecting one of
+            total shards of the tests with the same predicted duration.
+        :param bool speculate: With dynamic scheduling, run copies of the
+            tests waiting on the slowest worker on idle workers at the end
+            of the run, keeping the first result of each test.
+        :param bool failfast: Stop every worker as soon as a test fails.
+        :param pool: An optional stestr.pool.WorkerPool to run the tests on
+            instead of starting new test runner processes.
+        :param bool fork_server: Import the tests once in a single process
+            which forks a worker for each partition.
+        :param bool cache_discovery: Reuse the test ids listed by earlier
+            commands while the test files are unchanged.
+        :param bool parallel_discovery: List the tests in each package in the
+            test path with a separate process.
+        :param bool static_discovery: Find the tests by parsing the test
+            modules instead of importing them where possible.
+        :param bool targeted_load: Have the test runners load only the test
+            modules of the tests they are given instead of discovering every
+            test module, where that finds the same tests.
+        :param bool pipeline: With dynamic scheduling, start the workers
+            right away and hand them tests while the rest are being listed.
+        :param bool isolated: Run each test in a new test runner, running up
+            to concurrency of them at the same time.
+        :param bool record_memory: Have the test runners record the memory
+            use of each test, which memory_limit schedules with.
 
         :returns: a TestProcessorFixture object for the specified config file
             and any arguments passed into this function
@@ -174,8 +228,8 @@ class TestrConf:
         if not top_dir and not self.top_dir:
             top_dir = "./"
 
-        test_path = self._sanitize_path(test_path or self.test_path)
-        top_dir = self._sanitize_path(top_dir or self.top_dir)
+        test_path = test_path or self.test_path
+        top_dir = top_dir or self.top_dir
 
         stestr_python = sys.executable
         # let's try to be explicit, even if it means a longer set of ifs
@@ -200,10 +254,23 @@ class TestrConf:
 
         command = (
             '%s -m stestr.subunit_runner.run discover -t "%s" "%s" '
-            "$LISTOPT $IDOPTION" % (python, top_dir, test_path)
+            "$LISTOPT $IDOPTION"
+            % (python, self._sanitize_path(top_dir), self._sanitize_path(test_path))
         )
+        if record_memory:
+            command += " --record-memory"
         listopt = "--list"
         idoption = "--load-list $IDFILE"
+        if longest_first:
+            idoption += " --preserve-order"
+        if targeted_load:
+            idoption += " --targeted-load"
+        dispatchoption = "--dispatch $DISPATCH"
+        pooloption = "--pool $POOL"
+        moduleoption = "--modules $MODULES"
+        forkoption = "--fork-workers $WORKERS"
+        if longest_first:
+            forkoption += " --preserve-order"
         # If the command contains $IDOPTION read that command from config
         # Use a group regex if one is defined
         if parallel_class or self.parallel_class:
@@ -236,4 +303,25 @@ class TestrConf:
             exclude_regex=exclude_regex,
             include_list=include_list,
             randomize=randomize,
+            dynamic=dynamic,
+            dispatchoption=dispatchoption,
+            time_estimator=time_estimator,
+            longest_first=longest_first,
+            memory_limit=memory_limit,
+            agents=agents,
+            shard=shard,
+            speculate=speculate,
+            failfast=failfast,
+            pool=pool,
+            pooloption=pooloption,
+            fork_server=fork_server,
+            forkoption=forkoption,
+            cache_discovery=cache_discovery,
+            top_dir=top_dir,
+            test_path=test_path,
+            moduleoption=moduleoption,
+            parallel_discovery=parallel_discovery,
+            static_discovery=static_discovery,
+            pipeline=pipeline,
+            isolated=isolated,
         )
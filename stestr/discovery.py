@@ -0,0 +1,305 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Cache the test ids found by test discovery in the repository.
+
+Listing the tests imports every test module, which can take longer than
+running the few tests a filtered run selects. :func:`list_tests` stores the
+ids it lists in the repository along with a fingerprint of the python files
+discovery would look at: every ``.py`` file in the start directory and the
+packages below it. While none of those files change the stored ids are used
+instead of listing the tests again.
+
+When only test modules changed, were added or were removed, only those
+modules are listed again. Any other change, to a helper module or a package
+``__init__.py`` for example, lists all of the tests again. So does a change
+to the list command, or finding tests which can't be attributed to the test
+module they were discovered in, because they were made by a ``load_tests``
+function for example.
+
+The cache can't see changes outside the start directory, like a test base
+class in the code under test gaining a test method, which is why it is only
+used when asked for.
+
+:func:`split_packages` splits the discovery of the start directory by the
+packages in it, so that each can be listed by a separate process, and
+:func:`find_modules` finds the few test modules a test runner has to load to
+run a list of test ids.
+"""
+
+import fnmatch
+import hashlib
+import os
+
+#: The pattern test discovery finds test modules with.
+PATTERN = "test*.py"
+
+
+def _hash_file(path):
+    with open(path, "rb") as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+def _scan(top_dir, start_dir):
+    """Return the stat of every python file discovery looks at.
+
+    :return: A dict mapping paths relative to top_dir to a (mtime, size)
+        tuple.
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(start_dir):
+        # Like discovery only descend into packages.
+        dirnames[:] = sorted(
+            x
+            for x in dirnames
+            if os.path.isfile(os.path.join(dirpath, x, "__init__.py"))
+        )
+        for name in filenames:
+            if not name.endswith(".py"):
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, top_dir)] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def _fingerprint(top_dir, files, cached):
+    """Return the fingerprint of files, hashing only files whose stat changed.
+
+    :param dict files: The output of :func:`_scan`.
+    :param dict cached: A previous fingerprint to take hashes from.
+    :return: A dict mapping paths to [mtime, size, sha1] lists.
+    """
+    fingerprint = {}
+    for path, (mtime, size) in files.items():
+        old = cached.get(path)
+        if old and old[0] == mtime and old[1] == size:
+            digest = old[2]
+        else:
+            digest = _hash_file(os.path.join(top_dir, path))
+        fingerprint[path] = [mtime, size, digest]
+    return fingerprint
+
+
+def _is_test_module(path):
+    name = os.path.basename(path)
+    return fnmatch.fnmatch(name, PATTERN) and name[:-3].isidentifier()
+
+
+def _module_name(path):
+    return os.path.splitext(path)[0].replace(os.sep, ".")
+
+
+def _sort_key(path):
+    # Discovery walks each directory in sorted order, so sorting on the path
+    # components puts the modules in the order they are discovered in.
+    return path.split(os.sep)
+
+
+def _assign(test_ids, paths):
+    """Split test ids by the test module they are in.
+
+    :param list test_ids: The test ids to split.
+    :param list paths: The paths of the test modules they can be in.
+    :return: A dict mapping each path to its test ids, or None if any of
+        the ids is not in one of the modules.
+    """
+    names = {_module_name(x): x for x in paths}
+    modules = {x: [] for x in paths}
+    for test_id in test_ids:
+        parts = test_id.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            path = names.get(".".join(parts[:i]))
+            if path is not None:
+                modules[path].append(test_id)
+                break
+        else:
+            return None
+    return modules
+
+
+def _defines_load_tests(path):
+    with open(path, "rb") as fd:
+        return b"load_tests" in fd.read()
+
+
+def _has_load_tests(top_dir, files):
+    # A load_tests function in a package changes what is found in all of the
+    # modules below it, which listing the modules on their own would miss.
+    return any(
+        _defines_load_tests(os.path.join(top_dir, x))
+        for x in files
+        if os.path.basename(x) == "__init__.py"
+    )
+
+
+def split_packages(top_dir, start_dir):
+    """Split the discovery of start_dir by the packages directly in it.
+
+    Each package is discovered on its own, while the test modules between
+    them are loaded together.
+
+    :param str top_dir: The top level directory of the discovery.
+    :param str start_dir: The directory discovery starts in.
+    :return: A list of lists of module and package names in the order
+        discovery finds them, so that concatenating the tests found in
+        each list gives the tests discovery finds. None is returned if the
+        discovery can't be split, because there are less than two lists or
+        start_dir has a load_tests function which decides what is found.
+    """
+    init = os.path.join(start_dir, "__init__.py")
+    if os.path.isfile(init) and _defines_load_tests(init):
+        return None
+    groups = []
+    modules = []
+    for name in sorted(os.listdir(start_dir)):
+        path = os.path.join(start_dir, name)
+        module = _module_name(os.path.relpath(path, top_dir))
+        if os.path.isfile(os.path.join(path, "__init__.py")):
+            if modules:
+                groups.append(modules)
+                modules = []
+            groups.append([module])
+        elif os.path.isfile(path) and _is_test_module(name):
+            modules.append(module)
+    if modules:
+        groups.append(modules)
+    if len(groups) < 2:
+        return None
+    return groups
+
+
+def _find_module(top_dir, test_id):
+    # The longest dotted prefix of the id which is a python file.
+    parts = test_id.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        if not all(x.isidentifier() for x in parts[:i]):
+            continue
+        path = os.path.join(top_dir, *parts[:i])
+        if os.path.isfile(path + ".py"):
+            if os.path.isdir(path):
+                # A package and a module of the same name, which one the id
+                # is in depends on the import system.
+                return None
+            return path + ".py"
+    return None
+
+
+def find_modules(top_dir, start_dir, test_ids):
+    """Find the test modules discovery would load test_ids from.
+
+    :param str top_dir: The top level directory of the discovery.
+    :param str start_dir: The directory discovery starts in.
+    :param test_ids: An iterable of test ids.
+    :return: A list of the names of the test modules with the ids in them, in
+        the order discovery finds them. None is returned if loading just
+        those modules may not find the same tests as discovery: if an id
+        isn't in a test module discovery looks in, like a test case from a
+        helper module, or the module or a package it is in has a load_tests
+        function.
+    """
+    top_dir = os.path.abspath(top_dir)
+    start_dir = os.path.abspath(start_dir)
+    found = {}
+    paths = {}
+    for test_id in test_ids:
+        # Every test of a class is in the same module.
+        prefix = test_id.rsplit(".", 1)[0]
+        if prefix not in found:
+            found[prefix] = _find_module(top_dir, test_id)
+        path = found[prefix]
+        if path is None:
+            return None
+        paths[path] = _module_name(os.path.relpath(path, top_dir))
+    packages = set()
+    for path in paths:
+        if not _is_test_module(path) or _defines_load_tests(path):
+            return None
+        dirname = os.path.dirname(path)
+        if os.path.commonpath([start_dir, dirname]) != start_dir:
+            return None
+        while dirname not in packages:
+            packages.add(dirname)
+            init = os.path.join(dirname, "__init__.py")
+            if dirname == start_dir:
+                if (
+                    start_dir != top_dir
+                    and os.path.isfile(init)
+                    and _defines_load_tests(init)
+                ):
+                    return None
+                break
+            # Discovery only descends into packages.
+            if not os.path.isfile(init) or _defines_load_tests(init):
+                return None
+            dirname = os.path.dirname(dirname)
+    return [
+        paths[x]
+        for x in sorted(paths, key=lambda x: _sort_key(os.path.relpath(x, top_dir)))
+    ]
+
+
+def list_tests(repository, key, top_dir, start_dir, list_modules):
+    """List the tests using the ids cached in the repository where possible.
+
+    :param repository: The repository to store the cache in.
+    :param list key: A JSON serializable list of everything besides the files
+        which the test ids depend on, like the list command. Cached ids are
+        only used while this is unchanged.
+    :param str top_dir: The top level directory of the discovery.
+    :param str start_dir: The directory discovery starts in.
+    :param list_modules: A callable which takes a list of module names and
+        returns the test ids in them, or returns every test id discovered if
+        it is passed None.
+    :return: A list of test ids.
+    """
+    files = _scan(top_dir, start_dir)
+    cache = repository.get_discovery_cache()
+    if not cache or cache.get("key") != key:
+        cache = {"files": {}, "modules": None}
+    fingerprint = _fingerprint(top_dir, files, cache["files"])
+    changed = {
+        path
+        for path in set(fingerprint) | set(cache["files"])
+        if fingerprint.get(path, [None])[-1] != cache["files"].get(path, [None])[-1]
+    }
+    modules = cache["modules"]
+    if modules is not None and changed:
+        if "" in modules or not all(_is_test_module(x) for x in changed):
+            modules = None
+        else:
+            modules = {k: v for k, v in modules.items() if k not in changed}
+            relist = sorted(x for x in changed if x in fingerprint)
+            if relist:
+                relisted = _assign(
+                    list_modules([_module_name(x) for x in relist]), relist
+                )
+                if relisted is None:
+                    modules = None
+                else:
+                    modules.update(relisted)
+    if modules is None:
+        paths = [x for x in fingerprint if _is_test_module(x)]
+        test_ids = list_modules(None)
+        modules = _assign(test_ids, paths)
+        if modules is None or _has_load_tests(top_dir, fingerprint):
+            # The ids can't be split by module, so they are stored as one
+            # list and any change lists all of the tests again.
+            modules = {"": test_ids}
+    if modules != cache["modules"] or fingerprint != cache["files"]:
+        repository.set_discovery_cache(
+            {"key": key, "files": fingerprint, "modules": modules}
+        )
+    test_ids = []
+    for path in sorted(modules, key=_sort_key):
+        test_ids.extend(modules[path])
+    return test_ids
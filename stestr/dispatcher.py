@@ -0,0 +1,152 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Hand out batches of test ids to workers while a run is in progress.
+
+The dispatcher is the parent side of the dynamic scheduling mode. Instead of
+writing a fixed partition of test ids to a load-list file for each worker, a
+listener is opened and every worker connects back to it once test discovery
+has finished in the worker. Each time a worker is idle it requests another
+batch of test ids, and an empty batch tells the worker there is nothing left
+to run.
+
+Only the standard library's :mod:`multiprocessing.connection` module is used
+so the same protocol works with unix sockets, windows named pipes and TCP.
+Messages are plain utf8 encoded bytes, nothing is ever unpickled.
+"""
+
+from multiprocessing import connection
+import os
+import threading
+
+# The authentication key is passed to workers in the environment so that it
+# doesn't show up in the process list.
+AUTHKEY_ENV = "STESTR_DISPATCH_AUTHKEY"
+
+_REQUEST = b"ready"
+
+
+def format_address(address):
+    """Convert a listener address to a string usable on a command line.
+
+    :param address: The address of a multiprocessing.connection.Listener.
+        Either a path string or a (host, port) tuple.
+    :return: A string form of the address that parse_address() will accept
+    """
+    if isinstance(address, tuple):
+        return "%s:%d" % address
+    return address
+
+
+def parse_address(address):
+    """Convert an address string back to a multiprocessing address.
+
+    :param str address: The address string, either a unix socket path, a
+        windows named pipe or a host:port pair.
+    :return: The address in the form expected by
+        multiprocessing.connection.Client
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit() and not address.startswith(("/", "\\")):
+        return (host, int(port))
+    return address
+
+
+def encode_ids(test_ids):
+    return "\n".join(test_ids).encode("utf8")
+
+
+def decode_ids(ids_bytes):
+    return [x for x in ids_bytes.decode("utf8").split("\n") if x]
+
+
+class Dispatcher:
+    """Serve batches of test ids from a queue to connecting workers.
+
+    :param queue: An object with a ``get_batch(worker)`` method that returns
+        the next list of test ids to run for the worker with that index, an
+        empty list means that there are no more tests to run. See
+        :class:`stestr.scheduler.DispatchQueue`.
+    :param int workers: The number of workers which will connect.
+    :param str family: An optional multiprocessing.connection address family
+        to listen on. By default the platform default is used.
+    """
+
+    def __init__(self, queue, workers, family=None):
+        self.queue = queue
+        self.workers = workers
+        self.authkey = os.urandom(32)
+        self.listener = connection.Listener(family=family, authkey=self.authkey)
+        self.address = format_address(self.listener.address)
+        self._threads = []
+
+    def start(self):
+        """Start accepting worker connections in the background."""
+        accept_thread = threading.Thread(target=self._accept, daemon=True)
+        accept_thread.start()
+        self._threads.append(accept_thread)
+
+    def _accept(self):
+        accepted = 0
+        while accepted < self.workers:
+            try:
+                conn = self.listener.accept()
+            except connection.AuthenticationError:
+                continue
+            except OSError:
+                # The listener was closed, every worker has either finished
+                # or died before connecting.
+                return
+            worker_thread = threading.Thread(
+                target=self._serve, args=(conn, accepted), daemon=True
+            )
+            accepted += 1
+            worker_thread.start()
+            self._threads.append(worker_thread)
+
+    def _serve(self, conn, worker):
+        with conn:
+            try:
+                while True:
+                    conn.recv_bytes()
+                    batch = self.queue.get_batch(worker)
+                    conn.send_bytes(encode_ids(batch))
+                    if not batch:
+                        return
+            except (EOFError, OSError):
+                # The worker went away, anything it was running will show up
+                # in its subunit stream (or the lack thereof).
+                return
+
+    def close(self):
+        """Stop accepting new worker connections."""
+        self.listener.close()
+
+
+def iter_batches(address, authkey):
+    """Request batches of test ids from a dispatcher until it runs dry.
+
+    This is the worker side of the dispatch protocol.
+
+    :param str address: The dispatcher address as returned by
+        format_address()
+    :param bytes authkey: The shared authentication key
+    :return: A generator of lists of test ids
+    """
+    conn = connection.Client(parse_address(address), authkey=authkey)
+    with conn:
+        while True:
+            conn.send_bytes(_REQUEST)
+            batch = decode_ids(conn.recv_bytes())
+            if not batch:
+                return
+            yield batch
@@ -0,0 +1,206 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Keep test runner processes running between the runs of a command.
+
+``stestr run --until-failure``, ``--isolated`` and ``--analyze-isolation`` run
+tests over and over again, and normally every one of those runs starts new
+test runner processes which discover and import the whole test tree again. A
+:class:`WorkerPool` starts its workers once instead. Each worker discovers the
+tests, connects back to the pool and then runs every batch of test ids the
+pool sends it until the pool is closed.
+
+Batches use the protocol of :mod:`stestr.agent`, only the worker connects to
+the pool rather than the other way around. Where :func:`os.fork` is available
+a worker runs each batch in a child forked from itself, so the test modules
+stay imported but anything a batch changes in them is thrown away with the
+child, and the batches are as isolated from each other as before.
+"""
+
+import io
+from multiprocessing import connection
+import os
+import queue
+import sys
+import threading
+import traceback
+
+from stestr import agent
+from stestr import dispatcher
+
+
+class PoolError(Exception):
+    """Raised when a worker exits before connecting to the pool."""
+
+
+class WorkerPool:
+    """A pool of test runner processes which run batches of test ids.
+
+    Workers are started as they are needed, a run which needs more workers
+    than the pool has grows it. Workers which die are replaced by the next
+    run. The pool must be closed once it is no longer needed, which stops
+    all the workers.
+    """
+
+    def __init__(self):
+        self.authkey = os.urandom(32)
+        self.listener = connection.Listener(authkey=self.authkey)
+        self.address = dispatcher.format_address(self.listener.address)
+        self._procs = []
+        self._conns = []
+        self._accepted = queue.Queue()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._conns)
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except connection.AuthenticationError:
+                continue
+            except OSError:
+                # The pool was closed.
+                return
+            self._accepted.put(conn)
+
+    def _grow(self, count, start_worker):
+        procs = [start_worker() for _ in range(count)]
+        self._procs.extend(procs)
+        while count:
+            try:
+                self._conns.append(self._accepted.get(timeout=0.1))
+                count -= 1
+            except queue.Empty:
+                for proc in procs:
+                    if proc.poll() is not None:
+                        raise PoolError(
+                            "A worker exited with return code %d before "
+                            "connecting to the pool" % proc.returncode
+                        )
+
+    def run_batches(self, test_id_groups, start_worker):
+        """Run each batch of test ids on a different worker.
+
+        :param list test_id_groups: A list of lists of test ids, empty lists
+            are skipped.
+        :param start_worker: A callable which starts a new worker process and
+            returns its subprocess.Popen object. The worker has to connect to
+            ``address`` with ``authkey``, see :func:`run_worker`.
+        :return: A list of :class:`stestr.agent.BatchProcess` objects, one
+            for each batch. The output of every batch must be read before
+            the pool is used again.
+        :raises PoolError: If a new worker exits before connecting.
+        """
+        test_id_groups = [x for x in test_id_groups if x]
+        conns = self.connections(len(test_id_groups), start_worker)
+        return [
+            agent.BatchProcess(conn, test_ids, keep_open=True)
+            for conn, test_ids in zip(conns, test_id_groups)
+        ]
+
+    def connections(self, count, start_worker):
+        """Return the connections to count different workers.
+
+        Each connection runs one batch at a time, started with
+        :class:`stestr.agent.BatchProcess` with keep_open set, and the output
+        of every batch must be read before the pool is used again.
+
+        :param int count: The number of workers needed
+        :param start_worker: A callable which starts a new worker process,
+            see :meth:`run_batches`.
+        :raises PoolError: If a new worker exits before connecting.
+        """
+        self._conns = [x for x in self._conns if not x.closed]
+        self._procs = [x for x in self._procs if x.poll() is None]
+        if count > len(self._conns):
+            self._grow(count - len(self._conns), start_worker)
+        return self._conns[:count]
+
+    def close(self):
+        """Stop every worker in the pool."""
+        self.listener.close()
+        while not self._accepted.empty():
+            self._conns.append(self._accepted.get())
+        for conn in self._conns:
+            try:
+                conn.send_bytes(b"")
+            except OSError:
+                pass
+            conn.close()
+        self._conns = []
+        for proc in self._procs:
+            proc.wait()
+        self._procs = []
+
+
+class _ConnectionWriter(io.RawIOBase):
+    """A binary stream writing to a BatchProcess connection."""
+
+    def __init__(self, write):
+        self._write = write
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        # An empty message ends the batch, so never send one.
+        if data:
+            self._write(bytes(data))
+        return len(data)
+
+
+def _run_forked(run_batch, test_ids, stream):
+    pid = os.fork()
+    if not pid:
+        returncode = 0
+        try:
+            run_batch(test_ids, stream)
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def run_worker(address, authkey, run_batch):
+    """Run the batches of tests a pool sends until it is closed.
+
+    This is the worker side of the pool.
+
+    :param str address: The address of the pool
+    :param bytes authkey: The authentication key of the pool
+    :param run_batch: A callable which takes a list of test ids and a binary
+        stream, and runs the tests writing the subunit output to the stream.
+    """
+    conn = connection.Client(dispatcher.parse_address(address), authkey=authkey)
+
+    def serve_batch(test_ids, write):
+        stream = io.BufferedWriter(_ConnectionWriter(write))
+        if hasattr(os, "fork"):
+            return _run_forked(run_batch, test_ids, stream)
+        run_batch(test_ids, stream)
+        return 0
+
+    with conn:
+        agent.serve_batches(conn, serve_batch)
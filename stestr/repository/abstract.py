@@ -28,6 +28,8 @@ the initialize function in the appropriate repository module.
 
 from testtools import StreamToDict
 
+from stestr.repository import timing
+
 
 class AbstractRepositoryFactory:
     """Interface for making or opening repositories."""
@@ -118,23 +120,30 @@ class AbstractRepository:
         """
         raise NotImplementedError(self.get_test_run)
 
-    def get_test_times(self, test_ids):
+    def get_test_times(self, test_ids, estimator="last"):
         """Retrieve estimated times for the tests test_ids.
 
         :param test_ids: The test ids to query for timing data.
+        :param str estimator: How to estimate the time of each test from its
+            recorded durations. One of ``last`` (the most recent duration),
+            ``mean``, ``ewma`` (an exponentially weighted moving average),
+            ``p50`` or ``p90`` (percentiles of the recent durations).
         :return: A dict with two keys: 'known' and 'unknown'. The unknown
             key contains a set with the test ids that did run. The known
             key contains a dict mapping test ids to time in seconds.
         """
+        timing.check_estimator(estimator)
         test_ids = frozenset(test_ids)
-        known_times = self._get_test_times(test_ids)
+        known_times = self._get_test_times(test_ids, estimator)
         unknown_times = test_ids - set(known_times)
         return dict(known=known_times, unknown=unknown_times)
 
-    def _get_test_times(self, test_ids):
+    def _get_test_times(self, test_ids, estimator):
         """Retrieve estimated times for tests test_ids.
 
         :param test_ids: The test ids to query for timing data.
+        :param str estimator: The name of the estimator to use, see
+            get_test_times().
         :return: A dict mapping test ids to duration in seconds. Tests that no
             timing data is present for should not be returned - the base class
             get_test_times function will collate the missing test ids and put
@@ -142,6 +151,68 @@ class AbstractRepository:
         """
         raise NotImplementedError(self._get_test_times)
 
+    def get_fixture_times(self, fixture_ids=None):
+        """Retrieve the estimated cost of class and module fixtures.
+
+        The cost of a fixture is measured from the gap between the last test
+        of one class and the first test of the next on the same worker, see
+        :func:`stestr.repository.timing.measure_fixture_times`.
+
+        :param fixture_ids: The class and module ids to query for. If None the
+            cost of every fixture that has been measured is returned.
+        :return: A dict mapping fixture ids to time in seconds, fixtures which
+            have never been measured are not included.
+        """
+        raise NotImplementedError(self.get_fixture_times)
+
+    def get_test_memory(self, test_ids=None):
+        """Retrieve the peak memory use of tests.
+
+        This is the most memory a test has been recorded using, above what
+        its worker was using when it started, in its recent runs.
+
+        :param test_ids: The test ids to query for. If None the memory use of
+            every test with any recorded is returned.
+        :return: A dict mapping test ids to memory use in bytes, tests with
+            no recorded memory use are not included.
+        """
+        raise NotImplementedError(self.get_test_memory)
+
+    def get_startup_time(self):
+        """Return the estimated startup time of a test worker.
+
+        This is the fixed cost every worker pays before its first test
+        starts: interpreter start, test discovery and importing the test
+        modules.
+
+        :return: The startup time in seconds, or None if it has never been
+            measured.
+        """
+        raise NotImplementedError(self.get_startup_time)
+
+    def set_startup_time(self, startup_time):
+        """Store the estimated startup time of a test worker.
+
+        :param float startup_time: The startup time in seconds.
+        """
+        raise NotImplementedError(self.set_startup_time)
+
+    def get_discovery_cache(self):
+        """Return the test ids stored by the last discovery.
+
+        :return: The dict last stored with :meth:`set_discovery_cache`, or
+            None if nothing has been stored. See :mod:`stestr.discovery`
+            for its contents.
+        """
+        raise NotImplementedError(self.get_discovery_cache)
+
+    def set_discovery_cache(self, cache):
+        """Store the test ids found by a discovery.
+
+        :param dict cache: A dict which can be serialized as JSON.
+        """
+        raise NotImplementedError(self.set_discovery_cache)
+
     def latest_id(self):
         """Return the run id for the most recently inserted test run."""
         raise NotImplementedError(self.latest_id)
@@ -14,8 +14,10 @@
 
 import errno
 from io import BytesIO
+import json
 from operator import methodcaller
 import os
+import sqlite3
 import sys
 import tempfile
 
@@ -25,6 +27,7 @@ import subunit.v2
 import testtools
 
 from stestr.repository import abstract as repository
+from stestr.repository import timing
 from stestr import utils
 
 
@@ -159,30 +162,113 @@ class Repository(repository.AbstractRepository):
     def _get_inserter(self, partial, run_id=None, metadata=None):
         return _Inserter(self, partial, run_id, metadata=metadata)
 
-    def _get_test_times(self, test_ids):
-        # May be too slow, but build and iterate.
-        # 'c' because an existing repo may be missing a file.
+    def _get_test_times(self, test_ids, estimator):
+        wanted = {}
+        for test_id in test_ids:
+            if type(test_id) != str:
+                test_id = test_id.decode("utf8")
+            wanted.setdefault(utils.cleanup_test_name(test_id), []).append(test_id)
+        with self._get_times_store() as store:
+            estimates = store.get_estimates(wanted, estimator)
+        result = {}
+        for stripped_test_id, duration in estimates.items():
+            for test_id in wanted[stripped_test_id]:
+                result[test_id] = duration
+        return result
+
+    def _get_times_store(self):
+        path = self._path("times.db")
+        migrate = not os.path.exists(path)
         try:
-            db = my_dbm.open(self._path("times.dbm"), "c")
-        except my_dbm.error:
-            os.remove(self._path("times.dbm"))
-            db = my_dbm.open(self._path("times.dbm"), "c")
+            store = timing.TimingStore(path)
+        except sqlite3.DatabaseError:
+            os.remove(path)
+            store = timing.TimingStore(path)
+        if migrate:
+            self._migrate_times_dbm(store)
+        return store
+
+    def _migrate_times_dbm(self, store):
+        # Repositories written by older versions of stestr only have the
+        # last duration of each test stored in times.dbm
+        dbm_path = self._path("times.dbm")
+        if not os.path.exists(dbm_path + ".dir"):
+            return
+        durations = {}
         try:
-            result = {}
+            db = my_dbm.open(dbm_path, "r")
+            try:
+                for key in db.keys():
+                    test_id = key.decode("utf8") if type(key) is bytes else key
+                    durations[test_id] = float(db[key])
+            finally:
+                db.close()
+        except (my_dbm.error, ValueError, OSError):
+            # A corrupt times file just means the timing data is lost, as
+            # it was before when the dbm was recreated.
+            durations = {}
+        store.add(durations)
+        for suffix in (".dat", ".dir", ".bak"):
+            if os.path.exists(dbm_path + suffix):
+                os.remove(dbm_path + suffix)
+
+    def get_fixture_times(self, fixture_ids=None):
+        with self._get_times_store() as store:
+            return store.get_estimates(fixture_ids, "ewma", "fixtures")
+
+    def get_test_memory(self, test_ids=None):
+        wanted = None
+        if test_ids is not None:
+            wanted = {}
             for test_id in test_ids:
-                if type(test_id) != str:
-                    test_id = test_id.encode("utf8")
-                stripped_test_id = utils.cleanup_test_name(test_id)
-                # gdbm does not support get().
-                try:
-                    duration = db[stripped_test_id]
-                except KeyError:
-                    duration = None
-                if duration is not None:
-                    result[test_id] = float(duration)
-            return result
-        finally:
-            db.close()
+                wanted.setdefault(utils.cleanup_test_name(test_id), []).append(test_id)
+        with self._get_times_store() as store:
+            stats = store.get_stats(wanted, "memory")
+        if wanted is None:
+            return {test_id: int(x.peak) for test_id, x in stats.items()}
+        result = {}
+        for stripped_test_id, test_stats in stats.items():
+            for test_id in wanted[stripped_test_id]:
+                result[test_id] = int(test_stats.peak)
+        return result
+
+    def get_startup_time(self):
+        try:
+            with open(self._path("startup")) as fp:
+                return float(fp.read())
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        except ValueError:
+            # A corrupt estimate is not worth failing a run over, it will be
+            # replaced after the next run.
+            return None
+
+    def set_startup_time(self, startup_time):
+        prefix = self._path("startup")
+        with open(prefix + ".new", "wt") as stream:
+            stream.write("%f\n" % startup_time)
+        atomicish_rename(prefix + ".new", prefix)
+
+    def get_discovery_cache(self):
+        try:
+            with open(self._path("discovery")) as fp:
+                return json.load(fp)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        except ValueError:
+            # Like the startup time, a corrupt cache only means the next
+            # run discovers the tests again.
+            return None
+
+    def set_discovery_cache(self, cache):
+        prefix = self._path("discovery")
+        with open(prefix + ".new", "wt") as stream:
+            json.dump(cache, stream)
+        atomicish_rename(prefix + ".new", prefix)
 
     def _path(self, suffix):
         return os.path.join(self.base, suffix)
@@ -274,6 +360,11 @@ class _SafeInserter:
         self.partial = partial
         # The time take by each test, flushed at the end.
         self._times = {}
+        # The peak memory use of each test, flushed at the end.
+        self._memory = {}
+        # (worker, start, stop, test_id) for each test, used to measure
+        # fixture costs at the end.
+        self._test_runs = []
         self._test_start = None
         self._time = None
         subunit_client = testtools.StreamToExtendedDecorator(TestProtocolClient(stream))
@@ -287,7 +378,12 @@ class _SafeInserter:
         if test_dict["status"] == "exists" or None in (start, stop):
             return
         test_id = utils.cleanup_test_name(test_dict["id"])
-        self._times[test_id] = str((stop - start).total_seconds())
+        self._times[test_id] = (stop - start).total_seconds()
+        memory = timing.find_memory(test_dict["details"])
+        if memory is not None:
+            self._memory[test_id] = memory
+        worker = timing.find_worker(test_dict["tags"])
+        self._test_runs.append((worker, start, stop, test_id))
 
     def startTestRun(self):
         self.hook.startTestRun()
@@ -308,21 +404,10 @@ class _SafeInserter:
             finally:
                 db.close()
 
-        # May be too slow, but build and iterate.
-        db = my_dbm.open(self._repository._path("times.dbm"), "c")
-        try:
-            db_times = {}
-            for key, value in self._times.items():
-                if type(key) != str:
-                    key = key.encode("utf8")
-                db_times[key] = value
-            if getattr(db, "update", None):
-                db.update(db_times)
-            else:
-                for key, value in db_times.items():
-                    db[key] = value
-        finally:
-            db.close()
+        with self._repository._get_times_store() as store:
+            store.add(self._times)
+            store.add(timing.measure_fixture_times(self._test_runs), "fixtures")
+            store.add(self._memory, "memory")
         if not self._run_id:
             self._run_id = run_id
 
@@ -20,6 +20,7 @@ import subunit
 import testtools
 
 from stestr.repository import abstract as repository
+from stestr.repository import timing
 
 
 class RepositoryFactory(repository.AbstractRepositoryFactory):
@@ -50,7 +51,11 @@ class Repository(repository.AbstractRepository):
         # Test runs:
         self._runs = []
         self._failing = OrderedDict()  # id -> test
-        self._times = {}  # id -> duration
+        self._times = {}  # id -> timing.TimingStats
+        self._fixture_times = {}  # id -> timing.TimingStats
+        self._test_memory = {}  # id -> timing.TimingStats
+        self._startup_time = None
+        self._discovery_cache = None
 
     def count(self):
         return len(self._runs)
@@ -80,14 +85,55 @@ class Repository(repository.AbstractRepository):
     def _get_inserter(self, partial, run_id=None, metadata=None):
         return _Inserter(self, partial, run_id, metadata)
 
-    def _get_test_times(self, test_ids):
+    def _get_test_times(self, test_ids, estimator):
         result = {}
         for test_id in test_ids:
-            duration = self._times.get(test_id, None)
-            if duration is not None:
-                result[test_id] = duration
+            stats = self._times.get(test_id, None)
+            if stats is not None:
+                result[test_id] = stats.estimate(estimator)
         return result
 
+    def _add_test_time(self, test_id, duration, times=None):
+        if times is None:
+            times = self._times
+        stats = times.get(test_id)
+        if stats is None:
+            times[test_id] = timing.TimingStats.from_duration(duration)
+        else:
+            times[test_id] = stats.add(duration)
+
+    def get_fixture_times(self, fixture_ids=None):
+        if fixture_ids is None:
+            fixture_ids = list(self._fixture_times)
+        result = {}
+        for fixture_id in fixture_ids:
+            stats = self._fixture_times.get(fixture_id)
+            if stats is not None:
+                result[fixture_id] = stats.ewma
+        return result
+
+    def get_test_memory(self, test_ids=None):
+        if test_ids is None:
+            test_ids = list(self._test_memory)
+        result = {}
+        for test_id in test_ids:
+            stats = self._test_memory.get(test_id)
+            if stats is not None:
+                result[test_id] = stats.peak
+        return result
+
+    def get_startup_time(self):
+        return self._startup_time
+
+    def set_startup_time(self, startup_time):
+        self._startup_time = startup_time
+
+    def get_discovery_cache(self):
+        return self._discovery_cache
+
+    def set_discovery_cache(self, cache):
+        self._discovery_cache = cache
+
 
 # XXX: Too much duplication between this and _Inserter
 class _Failures(repository.AbstractTestRun):
@@ -160,10 +206,25 @@ class _Inserter(repository.AbstractTestRun):
             duration_delta.microseconds
             + (duration_delta.seconds + duration_delta.days * 24 * 3600) * 10**6
         ) / 10.0**6
-        self._repository._times[test_dict["id"]] = duration_seconds
+        self._repository._add_test_time(test_dict["id"], duration_seconds)
+        memory = timing.find_memory(test_dict["details"])
+        if memory is not None:
+            self._repository._add_test_time(
+                test_dict["id"], memory, self._repository._test_memory
+            )
 
     def stopTestRun(self):
         self._hook.stopTestRun()
+        test_runs = []
+        for test_dict in self._tests:
+            start, stop = test_dict["timestamps"]
+            if test_dict["status"] != "exists" and None not in (start, stop):
+                worker = timing.find_worker(test_dict["tags"])
+                test_runs.append((worker, start, stop, test_dict["id"]))
+        for fixture_id, duration in timing.measure_fixture_times(test_runs).items():
+            self._repository._add_test_time(
+                fixture_id, duration, self._repository._fixture_times
+            )
         self._repository._runs.append(self)
         if not self._run_id:
             self._run_id = len(self._repository._runs) - 1
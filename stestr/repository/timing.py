@@ -0,0 +1,320 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Per test timing statistics.
+
+Rather than only remembering the last duration of each test, the repository
+keeps streaming statistics for every test: the number of runs, the mean and
+variance (using Welford's algorithm), an exponentially weighted moving
+average and a bounded history of the most recent durations which is used for
+percentiles. Any of these can then be used as the estimate of how long a test
+will take when scheduling.
+"""
+
+import collections
+import math
+import operator
+import sqlite3
+
+from stestr import utils
+
+#: The estimators that can be passed to get_test_times()
+ESTIMATORS = ("last", "mean", "ewma", "p50", "p90")
+
+#: The tables in a TimingStore, "times" holds the durations of tests,
+#: "fixtures" the cost of class and module fixtures and "memory" the peak
+#: memory use of tests in bytes
+TABLES = ("times", "fixtures", "memory")
+
+#: The name of the attachment the test runner records the peak memory use of
+#: each test in
+MEMORY_ATTACHMENT = "peak-rss"
+
+#: The number of recent durations kept for each test
+HISTORY_SIZE = 20
+
+#: The weight given to the newest duration in the moving average
+EWMA_WEIGHT = 0.3
+
+#: The most ids looked up in a single query, older sqlite versions limit a
+#: statement to 999 parameters
+QUERY_CHUNK_SIZE = 500
+
+
+class TimingStats(
+    collections.namedtuple("TimingStats", ["count", "mean", "m2", "ewma", "history"])
+):
+    """Streaming duration statistics for a single test.
+
+    Instances are immutable, add() returns the updated statistics.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_duration(cls, duration):
+        return cls(1, duration, 0.0, duration, (duration,))
+
+    def add(self, duration):
+        """Return new statistics with duration added."""
+        count = self.count + 1
+        delta = duration - self.mean
+        mean = self.mean + delta / count
+        m2 = self.m2 + delta * (duration - mean)
+        ewma = self.ewma + EWMA_WEIGHT * (duration - self.ewma)
+        history = (self.history + (duration,))[-HISTORY_SIZE:]
+        return TimingStats(count, mean, m2, ewma, history)
+
+    @property
+    def last(self):
+        return self.history[-1]
+
+    @property
+    def peak(self):
+        return max(self.history)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def estimate(self, estimator):
+        """Return the estimated duration of the test.
+
+        :param str estimator: One of ESTIMATORS
+        """
+        check_estimator(estimator)
+        if estimator == "last":
+            return self.last
+        elif estimator == "mean":
+            return self.mean
+        elif estimator == "ewma":
+            return self.ewma
+        return _percentile(self.history, int(estimator[1:]))
+
+
+def _percentile(values, percent):
+    # Nearest rank, so the result is always an observed duration.
+    values = sorted(values)
+    rank = max(int(math.ceil(percent / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def check_estimator(estimator):
+    if estimator not in ESTIMATORS:
+        raise ValueError(
+            "Unknown time estimator %s, must be one of: %s"
+            % (estimator, ", ".join(ESTIMATORS))
+        )
+
+
+def measure_fixture_times(test_runs):
+    """Work out class and module fixture costs from the gaps between tests.
+
+    When a worker moves on from one test class to another, the time between
+    the end of the last test and the start of the next is spent tearing down
+    the old class fixtures and setting up the new ones. If the module changed
+    too the gap is charged to the new module, otherwise to the new class.
+
+    :param test_runs: An iterable of (worker, start, stop, test_id) tuples for
+        each test that was run, where worker is any identifier for the worker
+        that ran the test and start and stop are datetimes.
+    :return: A dict mapping class and module ids to fixture time in seconds.
+    """
+    by_worker = collections.defaultdict(list)
+    for worker, start, stop, test_id in test_runs:
+        by_worker[worker].append((start, stop, test_id))
+    result = {}
+    for worker_runs in by_worker.values():
+        worker_runs.sort(key=operator.itemgetter(0))
+        last_stop = last_class = last_module = None
+        for start, stop, test_id in worker_runs:
+            parents = utils.get_parent_ids(test_id, 2)
+            if len(parents) < 2:
+                last_stop = None
+                continue
+            test_class, module = parents
+            if last_stop is not None and test_class != last_class:
+                fixture_id = module if module != last_module else test_class
+                gap = max((start - last_stop).total_seconds(), 0.0)
+                # A class that was split up is set up more than once, they
+                # should all cost about the same so keep the largest.
+                result[fixture_id] = max(gap, result.get(fixture_id, 0.0))
+            last_stop, last_class, last_module = stop, test_class, module
+    return result
+
+
+def find_memory(details):
+    """Return the peak memory use recorded in a test's details, or None.
+
+    :param dict details: The details of a test, as from StreamToDict.
+    :return: The memory used in bytes.
+    """
+    detail = details.get(MEMORY_ATTACHMENT)
+    if detail is None:
+        return None
+    try:
+        return int(detail.as_text())
+    except ValueError:
+        return None
+
+
+def find_worker(tags):
+    """Return the worker tag from a set of test tags, or None."""
+    for tag in tags:
+        if tag.startswith("worker-"):
+            return tag
+    return None
+
+
+def _check_table(table):
+    if table not in TABLES:
+        raise ValueError("Unknown timing table: %s" % table)
+
+
+def _encode_history(history):
+    return " ".join(repr(x) for x in history)
+
+
+def _decode_history(history):
+    return tuple(float(x) for x in history.split())
+
+
+class TimingStore:
+    """An sqlite database of TimingStats keyed by test or fixture id.
+
+    Unlike a dbm.dumb file, whose data file grows every time a key is
+    rewritten, sqlite reuses the space of updated rows. The file is also
+    compacted after an update if more than half of it is unused.
+
+    :param str path: The path of the database file, it is created if it
+        doesn't exist.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            for table in TABLES:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS %s ("
+                    "id TEXT PRIMARY KEY, "
+                    "count INTEGER NOT NULL, "
+                    "mean REAL NOT NULL, "
+                    "m2 REAL NOT NULL, "
+                    "ewma REAL NOT NULL, "
+                    "last REAL NOT NULL, "
+                    "history TEXT NOT NULL)" % table
+                )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _select(self, columns, table, test_ids):
+        """Yield the id and columns of the rows for test_ids.
+
+        Only the rows for test_ids are read, a chunk of ids at a time.
+
+        :param str columns: The columns to select after the id
+        :param test_ids: The test ids to look up, or None for all of them.
+        :param str table: The table to look in, one of TABLES
+        """
+        # The column and table names are from a fixed set so this is safe
+        query = "SELECT id, %s FROM %s" % (columns, table)
+        if test_ids is None:
+            yield from self._conn.execute(query)
+            return
+        test_ids = list(dict.fromkeys(test_ids))
+        for bottom in range(0, len(test_ids), QUERY_CHUNK_SIZE):
+            chunk = test_ids[bottom : bottom + QUERY_CHUNK_SIZE]
+            yield from self._conn.execute(
+                "%s WHERE id IN (%s)" % (query, ", ".join("?" * len(chunk))), chunk
+            )
+
+    def get_estimates(self, test_ids, estimator, table="times"):
+        """Return the estimated durations of test_ids.
+
+        :param test_ids: The test ids to look up, or None for all of them.
+        :param str estimator: One of ESTIMATORS
+        :param str table: The table to look in, one of TABLES
+        :return: A dict mapping test id to duration for the test ids with
+            timing data.
+        """
+        check_estimator(estimator)
+        _check_table(table)
+        result = {}
+        if estimator in ("last", "mean", "ewma"):
+            result.update(self._select(estimator, table, test_ids))
+        else:
+            for test_id, stats in self.get_stats(test_ids, table).items():
+                result[test_id] = stats.estimate(estimator)
+        return result
+
+    def get_stats(self, test_ids, table="times"):
+        """Return the TimingStats for test_ids.
+
+        :param test_ids: The test ids to look up, or None for all of them.
+        :param str table: The table to look in, one of TABLES
+        :return: A dict mapping test id to TimingStats for the test ids with
+            timing data.
+        """
+        _check_table(table)
+        result = {}
+        rows = self._select("count, mean, m2, ewma, history", table, test_ids)
+        for test_id, count, mean, m2, ewma, history in rows:
+            result[test_id] = TimingStats(
+                count, mean, m2, ewma, _decode_history(history)
+            )
+        return result
+
+    def add(self, durations, table="times"):
+        """Add a new duration for each test.
+
+        :param dict durations: A dict mapping test id to duration in seconds.
+        :param str table: The table to update, one of TABLES
+        """
+        stats = self.get_stats(durations, table)
+        rows = []
+        for test_id, duration in durations.items():
+            if test_id in stats:
+                test_stats = stats[test_id].add(duration)
+            else:
+                test_stats = TimingStats.from_duration(duration)
+            rows.append(
+                (
+                    test_id,
+                    test_stats.count,
+                    test_stats.mean,
+                    test_stats.m2,
+                    test_stats.ewma,
+                    test_stats.last,
+                    _encode_history(test_stats.history),
+                )
+            )
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?, ?)" % table, rows
+            )
+        (free,) = self._conn.execute("PRAGMA freelist_count").fetchone()
+        (pages,) = self._conn.execute("PRAGMA page_count").fetchone()
+        if free * 2 > pages:
+            self.compact()
+
+    def compact(self):
+        """Return unused space in the database file to the filesystem."""
+        self._conn.execute("VACUUM")
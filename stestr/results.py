@@ -14,6 +14,10 @@ import subunit
 import testtools
 
 from stestr import output
+from stestr.repository import timing
+
+#: Test statuses which don't mean that the test has finished.
+INTERIM_STATES = frozenset(["exists", "inprogress"])
 
 
 def wasSuccessful(summary):
@@ -50,6 +54,101 @@ class SummarizingResult(testtools.StreamSummary):
         return (self._last_time - self._first_time).total_seconds()
 
 
+class StartupTimeResult(testtools.StreamResult):
+    """Measure how long each worker took to produce its first event.
+
+    :param datetime spawn_time: The time the workers were started.
+    """
+
+    def __init__(self, spawn_time):
+        super().__init__()
+        self.spawn_time = spawn_time
+        self._first_times = {}
+
+    def status(self, test_id=None, test_status=None, test_tags=None, **kwargs):
+        timestamp = kwargs.get("timestamp")
+        if timestamp is None:
+            return
+        worker = timing.find_worker(test_tags or ())
+        if worker not in self._first_times or timestamp < self._first_times[worker]:
+            self._first_times[worker] = timestamp
+
+    def get_startup_times(self):
+        """Return the startup time of each worker in seconds."""
+        return [
+            max((first - self.spawn_time).total_seconds(), 0.0)
+            for first in self._first_times.values()
+        ]
+
+
+class FirstResultWins(testtools.StreamResult):
+    """Forward only the first result of each test to another result.
+
+    This is used when some tests are run by more than one worker at the same
+    time. The events of each copy of a test, told apart by the route code of
+    the stream it came from, are held back until that copy finishes. The
+    first copy to finish is forwarded and the others are dropped. Tests
+    which no copy finished are forwarded at the end of the run as they are.
+
+    :param target: The StreamResult to forward the events to.
+    :param observer: An optional callable which is called with the test id,
+        test status and route of every event after it has been handled.
+    """
+
+    def __init__(self, target, observer=None):
+        super().__init__()
+        self.target = target
+        self.observer = observer
+        self._pending = {}
+        self._finished = set()
+        self._dropped_routes = set()
+
+    def startTestRun(self):
+        self.target.startTestRun()
+
+    def stopTestRun(self):
+        forwarded = set()
+        for (test_id, _), events in self._pending.items():
+            if test_id in forwarded:
+                continue
+            forwarded.add(test_id)
+            for event in events:
+                self.target.status(**event)
+        self._pending = {}
+        self.target.stopTestRun()
+
+    def drop_route(self, route):
+        """Drop every later event from the stream with this route.
+
+        The held back events of the tests which haven't finished on that
+        stream are dropped too, so a stream which is cut off part way
+        through a test doesn't leave that test half reported.
+        """
+        self._dropped_routes.add(route)
+        for key in [x for x in self._pending if x[1] == route]:
+            del self._pending[key]
+
+    def status(self, test_id=None, test_status=None, **kwargs):
+        route_code = kwargs.get("route_code")
+        route = route_code.split("/")[0] if route_code else None
+        if route in self._dropped_routes:
+            return
+        if test_id is None:
+            self.target.status(test_id=test_id, test_status=test_status, **kwargs)
+        elif test_id not in self._finished:
+            key = (test_id, route)
+            events = self._pending.setdefault(key, [])
+            events.append(dict(kwargs, test_id=test_id, test_status=test_status))
+            if test_status is not None and test_status not in INTERIM_STATES:
+                self._finished.add(test_id)
+                for event in self._pending.pop(key):
+                    self.target.status(**event)
+                for other in [x for x in self._pending if x[0] == test_id]:
+                    del self._pending[other]
+        if self.observer is not None:
+            self.observer(test_id, test_status, route)
+
+
 class CatFiles(testtools.StreamResult):
     """Cat file attachments received to a stream."""
 
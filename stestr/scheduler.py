@@ -11,23 +11,54 @@
 # under the License.
 
 import collections
+import heapq
 import itertools
 import multiprocessing
 import operator
 import random
+import threading
 
 import yaml
 
 from stestr import selection
+from stestr import utils
 
+#: Gaps between tests shorter than this are treated as the test runner's own
+#: overhead rather than a fixture worth keeping a class together for.
+MIN_FIXTURE_TIME = 0.01
 
-def partition_tests(test_ids, concurrency, repository, group_callback, randomize=False):
+
+def partition_tests(
+    test_ids,
+    concurrency,
+    repository,
+    group_callback,
+    randomize=False,
+    estimator="last",
+    estimates=None,
+    longest_first=False,
+    memory_limit=None,
+    fill_all=False,
+):
     """Partition test_ids by concurrency.
 
     Test durations from the repository are used to get partitions which
     have roughly the same expected runtime. New tests - those with no
-    recorded duration - are allocated in round-robin fashion to the
-    partitions created using test durations.
+    recorded duration - are scheduled using the mean duration of the known
+    tests in the same class, or failing that the same module or package.
+    Tests without any known relatives are allocated in round-robin fashion
+    to the partitions created using test durations.
+
+    If the repository has a measured worker startup time then only as many
+    partitions are filled as the fewest workers with the shortest predicted
+    makespan, see :func:`_worker_limit`, the remaining partitions are left
+    empty. Any more workers would only get tiny partitions which don't
+    shorten the run but each still cost a worker startup.
+
+    If a memory_limit is given, tests recorded using more than their share of
+    it (memory_limit / the number of partitions) are only put on as many
+    partitions as can run the heaviest of them at the same time without going
+    over the limit, see :func:`_memory_heavy_groups`.
 
     :param list test_ids: The list of test_ids to be partitioned
     :param int concurrency: The concurrency that will be used for running
@@ -41,77 +72,157 @@ def partition_tests(test_ids, concurrency, repository, group_callback, randomize
         identifier will be kept on the same worker.
     :param bool randomize: If true each partition's test order will be
                         randomized
+    :param str estimator: The estimator used for test durations, see
+        :meth:`stestr.repository.abstract.AbstractRepository.get_test_times`
+    :param dict estimates: An optional dict which will be updated with the
+        estimated duration of every test which was scheduled using the
+        durations of its relatives.
+    :param bool longest_first: If true the tests in each partition are
+        ordered with :func:`order_longest_first`. This is ignored if
+        randomize is set.
+    :param int memory_limit: An optional limit in bytes on the total memory
+        used by the tests running at the same time.
+    :param bool fill_all: If true every partition is filled, regardless of
+        the worker startup time.
 
     :return: A list where each element is a distinct subset of test_ids,
-        and the union of all the elements is equal to set(test_ids).
+        and the union of all the elements is equal to set(test_ids). The list
+        always has concurrency elements, some of which may be empty.
     """
 
-    def noop(_):
-        return None
-
-    _group_callback = group_callback
     partitions = [list() for i in range(concurrency)]
-    timed_partitions = [[0.0, partition] for partition in partitions]
-    time_data = {}
+    timed_tests = {}
     if repository:
-        time_data = repository.get_test_times(test_ids)
-        timed_tests = time_data["known"]
-        unknown_tests = time_data["unknown"]
-    else:
-        timed_tests = {}
-        unknown_tests = set(test_ids)
-    # Group tests: generate group_id -> test_ids.
-    group_ids = collections.defaultdict(list)
-    if _group_callback is None:
-        group_callback = noop
-    else:
-        group_callback = _group_callback
-    for test_id in test_ids:
-        group_id = group_callback(test_id) or test_id
-        group_ids[group_id].append(test_id)
-    # Time groups: generate three sets of groups:
-    # - fully timed dict(group_id -> time),
-    # - partially timed dict(group_id -> time) and
-    # - unknown (set of group_id)
+        timed_tests = repository.get_test_times(test_ids, estimator)["known"]
+    estimated = _estimate_unknown_times(test_ids, timed_tests)
+    if estimates is not None:
+        estimates.update(estimated)
+    if estimated:
+        timed_tests = {**timed_tests, **estimated}
+    workers = concurrency
+    fixture_times = {}
+    group_ids = None
+    if group_callback is not None:
+        group_ids = _group_test_ids(test_ids, group_callback)
+    if timed_tests:
+        mean = sum(timed_tests.values()) / len(timed_tests)
+        total_time = sum(timed_tests.values()) + mean * (
+            len(test_ids) - len(timed_tests)
+        )
+        startup_time = repository and repository.get_startup_time()
+        if startup_time and not fill_all:
+            if group_ids is None:
+                longest = max(timed_tests.values())
+            else:
+                longest = max(
+                    sum(timed_tests.get(x, mean) for x in group_tests)
+                    for group_tests in group_ids.values()
+                )
+            workers = _worker_limit(startup_time, total_time, longest, concurrency)
+        if group_callback is None:
+            group_callback, fixture_times = _fixture_groups(
+                test_ids, timed_tests, repository, total_time, workers
+            )
+    heavy_groups = frozenset()
+    heavy_workers = workers
+    if memory_limit and repository:
+        heavy_groups, heavy_workers = _memory_heavy_groups(
+            test_ids, repository, group_callback, memory_limit, workers
+        )
+    # Time groups: generate a group_id -> time mapping and three lists:
+    # - fully timed group ids,
+    # - partially timed group ids and
+    # - unknown groups (as lists of test_ids)
     # We may in future treat partially timed different for scheduling, but
     # at least today we just schedule them after the fully timed groups.
-    timed = {}
-    partial = {}
+    timed = []
+    partial = []
     unknown = []
-    for group_id, group_tests in group_ids.items():
-        untimed_ids = unknown_tests.intersection(group_tests)
-        group_time = sum(
-            [
-                timed_tests[test_id]
-                for test_id in untimed_ids.symmetric_difference(group_tests)
-            ]
-        )
-        if not untimed_ids:
-            timed[group_id] = group_time
-        elif group_time:
-            partial[group_id] = group_time
-        else:
-            unknown.append(group_id)
+    if group_callback is None:
+        # Every test is its own group, skip building the group mapping which
+        # dominates the runtime for very large test lists.
+        group_ids = None
+        group_times = timed_tests
+        for test_id in test_ids:
+            if test_id in timed_tests:
+                timed.append(test_id)
+            else:
+                unknown.append([test_id])
+    else:
+        if group_ids is None:
+            group_ids = _group_test_ids(test_ids, group_callback)
+        group_times = {}
+        get_time = timed_tests.get
+        for group_id, group_tests in group_ids.items():
+            group_time = fixture_times.get(group_id, 0.0)
+            untimed = False
+            for test_id in group_tests:
+                duration = get_time(test_id)
+                if duration is None:
+                    untimed = True
+                else:
+                    group_time += duration
+            group_times[group_id] = group_time
+            if not untimed:
+                timed.append(group_id)
+            elif group_time:
+                partial.append(group_id)
+            else:
+                unknown.append(group_tests)
 
     # Scheduling is NP complete in general, so we avoid aiming for
     # perfection. A quick approximation that is sufficient for our general
-    # needs:
+    # needs (the LPT rule):
     # sort the groups by time
     # allocate to partitions by putting each group in to the partition with
-    # the current (lowest time, shortest length[in tests])
-    def consume_queue(groups):
-        queue = sorted(groups.items(), key=operator.itemgetter(1), reverse=True)
-        for group_id, duration in queue:
-            timed_partitions[0][0] = timed_partitions[0][0] + duration
-            timed_partitions[0][1].extend(group_ids[group_id])
-            timed_partitions.sort(key=lambda item: (item[0], len(item[1])))
-
-    consume_queue(timed)
-    consume_queue(partial)
+    # the current (lowest time, shortest length[in tests]). A heap of
+    # (time, length, index) makes finding that partition O(log concurrency).
+    heap = [(0.0, 0, index, partitions[index]) for index in range(workers)]
+    heapreplace = heapq.heapreplace
+
+    def consume_queue(groups, heap):
+        groups.sort(key=group_times.__getitem__, reverse=True)
+        durations = map(group_times.__getitem__, groups)
+        for group_id, duration in zip(groups, durations):
+            time, length, index, partition = heap[0]
+            if group_ids is None:
+                partition.append(group_id)
+                length += 1
+            else:
+                group_tests = group_ids[group_id]
+                partition.extend(group_tests)
+                length += len(group_tests)
+            heapreplace(heap, (time + duration, length, index, partition))
+
+    if heavy_groups:
+        # Place the memory heavy groups first, on the partitions which are
+        # allowed them, then fill in around them with everything else.
+        heavy_heap = heap[:heavy_workers]
+        consume_queue([x for x in timed if x in heavy_groups], heavy_heap)
+        consume_queue([x for x in partial if x in heavy_groups], heavy_heap)
+        heap = heavy_heap + heap[heavy_workers:]
+        heapq.heapify(heap)
+        timed = [x for x in timed if x not in heavy_groups]
+        partial = [x for x in partial if x not in heavy_groups]
+        heavy_unknown = []
+        light_unknown = []
+        for group_tests in unknown:
+            test_id = group_tests[0]
+            group_id = (group_callback and group_callback(test_id)) or test_id
+            if group_id in heavy_groups:
+                heavy_unknown.append(group_tests)
+            else:
+                light_unknown.append(group_tests)
+        unknown = light_unknown
+        heavy_partitions = itertools.cycle(partitions[:heavy_workers])
+        for partition, group_tests in zip(heavy_partitions, heavy_unknown):
+            partition.extend(group_tests)
+    consume_queue(timed, heap)
+    consume_queue(partial, heap)
     # Assign groups with entirely unknown times in round robin fashion to
     # the partitions.
-    for partition, group_id in zip(itertools.cycle(partitions), unknown):
-        partition.extend(group_ids[group_id])
+    for partition, group_tests in zip(itertools.cycle(partitions[:workers]), unknown):
+        partition.extend(group_tests)
     if randomize:
         out_parts = []
         for partition in partitions:
@@ -119,10 +230,657 @@ def partition_tests(test_ids, concurrency, repository, group_callback, randomize
             random.shuffle(temp_part)
             out_parts.append(list(temp_part))
         return out_parts
+    elif longest_first:
+        return [
+            order_longest_first(partition, timed_tests, group_callback)
+            for partition in partitions
+        ]
     else:
         return partitions
 
 
+def select_shard(
+    test_ids, index, total, repository, group_callback=None, estimator="last"
+):
+    """Select one of total shards of test_ids with the same predicted time.
+
+    The tests are partitioned into total shards with :func:`partition_tests`,
+    filling every shard even when the worker startup time would leave some
+    empty. The tests are sorted first so that the shards only depend on the
+    set of test ids and the timing data in the repository: separate jobs
+    which select every shard of the same tests with the same repository
+    contents run each test exactly once.
+
+    :param list test_ids: The list of test_ids to shard
+    :param int index: The 1 based index of the shard to select
+    :param int total: The total number of shards
+    :param repository: A repository object used for looking up timing data
+    :param group_callback: An optional callback returning the group id of a
+        test, the tests of a group are always in the same shard.
+    :param str estimator: The estimator used for test durations, see
+        :meth:`stestr.repository.abstract.AbstractRepository.get_test_times`
+
+    :return: The list of test ids in the shard, in their original order.
+    """
+    partitions = partition_tests(
+        sorted(test_ids),
+        total,
+        repository,
+        group_callback,
+        estimator=estimator,
+        fill_all=True,
+    )
+    shard = set(partitions[index - 1])
+    return [x for x in test_ids if x in shard]
+
+
+def _memory_heavy_groups(test_ids, repository, group_callback, memory_limit, workers):
+    """Find the groups which can't all be run at the same time.
+
+    As long as every worker is running a test which uses less than
+    memory_limit / workers, the limit can't be exceeded. Groups containing a
+    test which uses more than that are heavy. They are confined to the most
+    workers which can run the heaviest of them at the same time, while every
+    other worker runs the heaviest of the light tests, without going over the
+    limit. When even the heaviest group on its own is over the limit they are
+    all put on a single worker.
+
+    :return: A tuple of the set of heavy group ids and how many workers they
+        may be run on.
+    """
+    share = memory_limit / workers
+    group_memory = {}
+    light_memory = 0
+    for test_id, memory in repository.get_test_memory(test_ids).items():
+        if memory <= share:
+            light_memory = max(memory, light_memory)
+            continue
+        group_id = (group_callback and group_callback(test_id)) or test_id
+        group_memory[group_id] = max(memory, group_memory.get(group_id, 0))
+    heavy_workers = 1
+    used = 0
+    for count, memory in enumerate(sorted(group_memory.values(), reverse=True), 1):
+        used += memory
+        if count > workers or used + (workers - count) * light_memory > memory_limit:
+            break
+        heavy_workers = count
+    return frozenset(group_memory), heavy_workers
+
+
+def order_longest_first(test_ids, test_times, group_callback=None):
+    """Order test ids so the slowest tests run first.
+
+    A long test started at the end of a run leaves its worker running on its
+    own after the others have finished, starting it first lets the short
+    tests fill in around it instead.
+
+    The tests of a group (or without a group_callback, of a class) are kept
+    together, as are the groups of a module, so that class and module
+    fixtures are only set up once. Modules are ordered by their total time,
+    then the groups in each module and then the tests in each group, all
+    longest first. Tests with no known time are assumed to take the mean time
+    of the tests that are known.
+
+    :param list test_ids: The test ids to order
+    :param dict test_times: A dict mapping test ids to their duration
+    :param group_callback: An optional function which returns the group id
+        for a test id, as for :func:`partition_tests`.
+    :return: A new list of the test ids.
+    """
+    known = [test_times[x] for x in test_ids if x in test_times]
+    default = sum(known) / len(known) if known else 0.0
+
+    def duration(test_id):
+        return test_times.get(test_id, default)
+
+    groups = collections.OrderedDict()
+    for test_id in test_ids:
+        group_id = None
+        if group_callback is not None:
+            group_id = group_callback(test_id)
+        if group_id is None:
+            group_id = utils.get_parent_id(test_id) or test_id
+        groups.setdefault(group_id, []).append(test_id)
+    module_times = collections.defaultdict(float)
+    ordered = []
+    for group_tests in groups.values():
+        group_tests.sort(key=duration, reverse=True)
+        group_time = sum(map(duration, group_tests))
+        parents = utils.get_parent_ids(group_tests[0], 2)
+        module = parents[-1] if parents else ""
+        module_times[module] += group_time
+        ordered.append((module, group_time, group_tests))
+    # Sorting by the module name as well keeps modules with the same total
+    # time from being interleaved.
+    ordered.sort(key=lambda x: (module_times[x[0]], x[0], x[1]), reverse=True)
+    return [test_id for _, _, group_tests in ordered for test_id in group_tests]
+
+
+class DispatchQueue:
+    """A thread safe queue of test ids to hand out to workers in batches.
+
+    This is used for dynamic scheduling where instead of partitioning the
+    tests up front workers request a new batch of tests each time they run
+    out of work. Groups are handed out longest first (based on the timing
+    data in the repository) and the size of each batch shrinks as the queue
+    empties so that the end of the run is made up of small batches which keep
+    every worker busy until the end.
+
+    :param list test_ids: The list of test_ids to be dispatched
+    :param int concurrency: The number of workers which will be requesting
+        batches from the queue.
+    :param repository: A repository object that will be used for looking up
+        timing data. This is optional.
+    :param group_callback: A callback function that is used as a scheduler
+        hint to group test_ids together and treat them as a single unit for
+        scheduling. This function expects a single test_id parameter and it
+        will return a group identifier. Tests_ids that have the same group
+        identifier will always be part of the same batch.
+    :param bool randomize: If true the test order in each batch will be
+        randomized
+    :param str estimator: The estimator used for test durations, see
+        :meth:`stestr.repository.abstract.AbstractRepository.get_test_times`
+    :param dict estimates: An optional dict which will be updated with the
+        estimated duration of every test which was scheduled using the
+        durations of its relatives.
+    :param bool speculate: If true, once the queue is empty idle workers are
+        given copies of the tests still waiting to run on the worker with the
+        most predicted work left, see :meth:`get_batch`. The progress of the
+        run has to be reported with :meth:`test_started` and
+        :meth:`test_finished`.
+    """
+
+    # The number of batches each worker is expected to request for an evenly
+    # sized queue. Larger values balance better but cost a round trip each.
+    batches_per_worker = 4
+
+    def __init__(
+        self,
+        test_ids,
+        concurrency,
+        repository=None,
+        group_callback=None,
+        randomize=False,
+        estimator="last",
+        estimates=None,
+        speculate=False,
+    ):
+        self.concurrency = max(concurrency, 1)
+        self.randomize = randomize
+        self.speculate = speculate
+        timed_tests = {}
+        if repository:
+            timed_tests = repository.get_test_times(test_ids, estimator)["known"]
+        # Use the mean known duration as a stand in for tests with no timing
+        # data or known relatives so that unknown groups still get a sensible
+        # batch size.
+        if timed_tests:
+            default = sum(timed_tests.values()) / len(timed_tests)
+        else:
+            default = 1.0
+        estimated = _estimate_unknown_times(test_ids, timed_tests)
+        if estimates is not None:
+            estimates.update(estimated)
+        if estimated:
+            timed_tests = {**timed_tests, **estimated}
+        fixture_times = {}
+        if timed_tests and group_callback is None:
+            total_time = sum(timed_tests.get(x, default) for x in test_ids)
+            group_callback, fixture_times = _fixture_groups(
+                test_ids, timed_tests, repository, total_time, self.concurrency
+            )
+        group_ids = _group_test_ids(test_ids, group_callback)
+        groups = []
+        for group_id, group_tests in group_ids.items():
+            duration = sum(timed_tests.get(x, default) for x in group_tests)
+            duration += fixture_times.get(group_id, 0.0)
+            groups.append((duration, group_tests))
+        groups.sort(key=operator.itemgetter(0), reverse=True)
+        self._groups = collections.deque(groups)
+        self._remaining = sum(x[0] for x in groups)
+        self._lock = threading.Lock()
+        self._durations = {x: timed_tests.get(x, default) for x in test_ids}
+        self._in_flight = {}
+        self._started = set()
+        self._finished = set()
+        self._duplicated = set()
+        #: The number of workers worth starting for this queue, this is
+        #: limited by the number of groups and, if the worker startup time is
+        #: known, the predicted makespan, see :func:`_worker_limit`.
+        self.max_workers = min(self.concurrency, len(groups))
+        startup_time = repository and repository.get_startup_time()
+        if timed_tests and startup_time:
+            self.max_workers = _worker_limit(
+                startup_time, self._remaining, groups[0][0], self.max_workers
+            )
+
+    def __len__(self):
+        return len(self._groups)
+
+    def get_batch(self, worker=None):
+        """Get the next batch of test ids to run.
+
+        When speculating and the queue is empty the batch is instead a copy
+        of the tests which haven't started yet on the other worker with the
+        most predicted work left, along with the test it is running if that
+        is marked idempotent (see :func:`is_idempotent`). Each test is only
+        copied once, and whichever copy finishes first is the result.
+
+        :param worker: An identifier of the worker requesting the batch, used
+            to track which tests each worker has when speculating.
+        :return: A list of test ids, an empty list indicates that there are no
+            more tests to run.
+        """
+        with self._lock:
+            target = self._remaining / (self.concurrency * self.batches_per_worker)
+            batch = []
+            batch_time = 0.0
+            while self._groups and (not batch or batch_time < target):
+                duration, group_tests = self._groups.popleft()
+                batch.extend(group_tests)
+                batch_time += duration
+            self._remaining -= batch_time
+            if self.speculate and worker is not None:
+                if not batch:
+                    batch = self._speculative_batch(worker)
+                self._in_flight[worker] = batch
+        if self.randomize:
+            random.shuffle(batch)
+        return batch
+
+    def _speculative_batch(self, worker):
+        best_time = None
+        best = []
+        for other, batch in self._in_flight.items():
+            if other == worker:
+                continue
+            unfinished = [x for x in batch if x not in self._finished]
+            copy = [
+                x
+                for x in unfinished
+                if x not in self._duplicated
+                and (x not in self._started or is_idempotent(x))
+            ]
+            if not copy:
+                continue
+            remaining = sum(self._durations.get(x, 0.0) for x in unfinished)
+            if best_time is None or remaining > best_time:
+                best_time = remaining
+                best = copy
+        self._duplicated.update(best)
+        return best
+
+    def test_started(self, test_id):
+        """Record that a test has started running on a worker."""
+        with self._lock:
+            self._started.add(test_id)
+
+    def test_finished(self, test_id):
+        """Record that a test has a result.
+
+        :return: True if every test in the queue now has a result.
+        """
+        with self._lock:
+            if test_id in self._durations:
+                self._finished.add(test_id)
+            return len(self._finished) == len(self._durations)
+
+
+class PipelineQueue(DispatchQueue):
+    """A DispatchQueue which test ids are added to while it is being used.
+
+    This lets workers start running tests while the rest of the tests are
+    still being listed. Each time test ids are added their groups are merged
+    into the queue, which is kept longest first, so the timing data decides
+    which of the tests listed so far go first. :meth:`get_batch` waits for
+    more tests while the queue is empty until :meth:`close` is called.
+
+    Groups are only formed from the test ids added together, and the
+    durations of tests without timing data are estimated from the other
+    tests added with them. Unlike DispatchQueue, classes aren't kept
+    together for their fixture costs, as that needs all of the tests.
+
+    The parameters are the same as DispatchQueue's, except that there are no
+    test ids to start with.
+    """
+
+    def __init__(
+        self,
+        concurrency,
+        repository=None,
+        group_callback=None,
+        randomize=False,
+        estimator="last",
+        estimates=None,
+        speculate=False,
+    ):
+        super().__init__(
+            [],
+            concurrency,
+            repository,
+            group_callback,
+            randomize,
+            estimator,
+            estimates,
+            speculate,
+        )
+        self.repository = repository
+        self.group_callback = group_callback
+        self.estimator = estimator
+        self.estimates = estimates
+        # Nothing is known about the tests yet, so there is no reason to
+        # start fewer workers.
+        self.max_workers = self.concurrency
+        self._closed = False
+        # The ids of every test added, including those still being added.
+        self._test_ids = set()
+        self._lock = threading.RLock()
+        self._added = threading.Condition(self._lock)
+
+    def add(self, test_ids):
+        """Add test ids to the queue.
+
+        :param test_ids: The test ids to add, ids already in the queue are
+            ignored.
+        """
+        # Claim the ids before looking up their timing data, so that tests
+        # added again while this runs are still ignored.
+        with self._lock:
+            test_ids = [x for x in dict.fromkeys(test_ids) if x not in self._test_ids]
+            self._test_ids.update(test_ids)
+        if not test_ids:
+            return
+        timed_tests = {}
+        if self.repository:
+            timed_tests = self.repository.get_test_times(test_ids, self.estimator)[
+                "known"
+            ]
+        if timed_tests:
+            default = sum(timed_tests.values()) / len(timed_tests)
+        else:
+            default = 1.0
+        estimated = _estimate_unknown_times(test_ids, timed_tests)
+        if self.estimates is not None:
+            self.estimates.update(estimated)
+        timed_tests = {**timed_tests, **estimated}
+        groups = []
+        for group_tests in _group_test_ids(test_ids, self.group_callback).values():
+            duration = sum(timed_tests.get(x, default) for x in group_tests)
+            groups.append((duration, group_tests))
+        with self._added:
+            groups.extend(self._groups)
+            groups.sort(key=operator.itemgetter(0), reverse=True)
+            self._groups = collections.deque(groups)
+            self._remaining = sum(x[0] for x in groups)
+            self._durations.update((x, timed_tests.get(x, default)) for x in test_ids)
+            self._added.notify_all()
+
+    def close(self):
+        """Mark that no more tests will be added."""
+        with self._added:
+            self._closed = True
+            self._added.notify_all()
+
+    def get_batch(self, worker=None):
+        """Get the next batch of test ids to run.
+
+        This waits for tests to be added while the queue is empty and hasn't
+        been closed, see :meth:`DispatchQueue.get_batch`.
+        """
+        with self._added:
+            while not self._groups and not self._closed:
+                self._added.wait()
+            return super().get_batch(worker)
+
+    def test_finished(self, test_id):
+        """Record that a test has a result.
+
+        :return: True if the queue is closed and every test in it now has a
+            result.
+        """
+        with self._lock:
+            return super().test_finished(test_id) and self._closed
+
+
+def is_idempotent(test_id):
+    """Check if a test is marked as safe to run more than once at a time.
+
+    Tests are marked with an ``idempotent`` attribute, which testtools'
+    ``attr`` decorator appends to the test id like ``test_foo[idempotent]``.
+    """
+    if not test_id.endswith("]"):
+        return False
+    attrs = test_id[test_id.rfind("[") + 1 : -1]
+    return "idempotent" in (x.strip() for x in attrs.split(","))
+
+
+def _fixture_groups(test_ids, test_times, repository, total_time, workers):
+    """Find the test classes which should be kept on a single worker.
+
+    Splitting a class across workers makes each of them pay for its class
+    fixtures again (and its module fixtures, if no other tests from the
+    module end up on that worker). So a class with a measured fixture cost is
+    kept together when all of it, including the fixture cost, fits in a
+    single worker's share of the run.
+
+    :param test_ids: The test ids being scheduled
+    :param dict test_times: The known or estimated duration of each test
+    :param repository: The repository to look up fixture costs in
+    :param float total_time: The expected run time of all the tests
+    :param int workers: The number of workers the tests will be split between
+    :return: A tuple of a group callback and a dict mapping class id to
+        fixture cost for the classes to keep together. If there are none the
+        group callback is None.
+    """
+    fixture_times = repository.get_fixture_times()
+    if not fixture_times:
+        return None, {}
+    get_parent_id = utils.get_parent_id
+    classes = {}
+    modules = {}
+    for test_id in test_ids:
+        test_class = get_parent_id(test_id)
+        if test_class is not None:
+            classes[test_id] = test_class
+            if test_class not in modules:
+                modules[test_class] = get_parent_id(test_class)
+    class_times = {}
+    for test_class, module in modules.items():
+        # A class which was the first in its module has its cost recorded
+        # against the module, see timing.measure_fixture_times()
+        cost = fixture_times.get(test_class, fixture_times.get(module, 0.0))
+        if cost >= MIN_FIXTURE_TIME:
+            class_times[test_class] = cost
+    fixture_costs = dict(class_times)
+    for test_id, test_class in classes.items():
+        if test_class in class_times:
+            class_times[test_class] += test_times.get(test_id, 0.0)
+    target = (total_time + sum(fixture_costs.values())) / workers
+    keep = {
+        test_class: fixture_costs[test_class]
+        for test_class, class_time in class_times.items()
+        if class_time <= target
+    }
+    if not keep:
+        return None, {}
+
+    def group_callback(test_id):
+        test_class = classes.get(test_id)
+        if test_class in keep:
+            return test_class
+
+    return group_callback, keep
+
+
+#: How much longer than the shortest predicted makespan the run chosen by
+#: :func:`choose_concurrency` may take, to use fewer workers.
+CONCURRENCY_TOLERANCE = 0.05
+
+#: The worker count chosen by :func:`choose_concurrency`, the predicted
+#: makespan in seconds (None without any timing data) and why it was chosen.
+Concurrency = collections.namedtuple("Concurrency", ["workers", "makespan", "reason"])
+
+
+def choose_concurrency(
+    test_ids, repository, max_workers, group_callback=None, estimator="last"
+):
+    """Choose how many workers to run test_ids on.
+
+    The makespan - the time until the last worker finishes - is predicted for
+    each number of workers from 1 up to max_workers (or the number of tests
+    or groups, if that is less) with :func:`_predict_makespans`. The fewest
+    workers whose makespan is within CONCURRENCY_TOLERANCE of the shortest
+    predicted one are chosen, as a worker which barely shortens the run isn't
+    worth starting. This is never more than :func:`_worker_limit` allows, so
+    :func:`partition_tests` fills every partition for the chosen count.
+
+    :param list test_ids: The test ids which will be run
+    :param repository: The repository to get timing data from
+    :param int max_workers: The most workers to use, usually the CPU count
+    :param group_callback: An optional function which returns the group id
+        for a test id, as for :func:`partition_tests`.
+    :param str estimator: The estimator used for test durations, see
+        :meth:`stestr.repository.abstract.AbstractRepository.get_test_times`
+    :return: A Concurrency tuple
+    """
+    max_workers = max(max_workers, 1)
+    timed_tests = {}
+    if repository:
+        timed_tests = repository.get_test_times(test_ids, estimator)["known"]
+    if not timed_tests:
+        return Concurrency(
+            max_workers, None, "there is no timing data, one worker per CPU"
+        )
+    timed_tests = {**timed_tests, **_estimate_unknown_times(test_ids, timed_tests)}
+    mean = sum(timed_tests.values()) / len(timed_tests)
+    group_times = collections.defaultdict(float)
+    for test_id in test_ids:
+        group_id = (group_callback and group_callback(test_id)) or test_id
+        group_times[group_id] += timed_tests.get(test_id, mean)
+    total_time = sum(group_times.values())
+    longest = max(group_times.values())
+    startup_time = repository.get_startup_time() or 0.0
+    most_workers = min(max_workers, len(group_times))
+    makespans = _predict_makespans(startup_time, total_time, longest, most_workers)
+    shortest = min(makespans)
+    for index, makespan in enumerate(makespans):
+        if makespan <= shortest * (1 + CONCURRENCY_TOLERANCE):
+            workers = index + 1
+            break
+    if makespan > shortest:
+        reason = "more workers would finish less than %d%% sooner" % (
+            CONCURRENCY_TOLERANCE * 100
+        )
+        if startup_time:
+            reason += ", each takes %.3fs to start" % startup_time
+    elif workers == max_workers:
+        reason = "one worker per CPU"
+    elif workers == len(group_times):
+        reason = "there are only %d tests or groups to run" % len(group_times)
+    else:
+        reason = (
+            "the longest test or group takes %.3fs, more workers would "
+            "not finish any sooner" % longest
+        )
+    return Concurrency(workers, makespan, reason)
+
+
+def _predict_makespans(startup_time, total_time, longest, max_workers):
+    """Predict the makespan of a run on each number of workers.
+
+    The makespan - the time until the last worker finishes - is the worker
+    startup time plus the longer of an even share of the total test time and
+    the longest test or group, as the workers start at the same time and none
+    can finish before the longest group does.
+
+    :return: A list of max_workers makespans, the makespan for n workers is at
+        index n - 1.
+    """
+    return [
+        startup_time + max(total_time / n, longest) for n in range(1, max_workers + 1)
+    ]
+
+
+def _worker_limit(startup_time, total_time, longest, max_workers):
+    """Return how many workers are worth starting for total_time of tests.
+
+    This is the fewest workers with the shortest makespan predicted by
+    :func:`_predict_makespans`, up to max_workers.
+    """
+    makespans = _predict_makespans(startup_time, total_time, longest, max_workers)
+    return makespans.index(min(makespans)) + 1
+
+
+def _estimate_unknown_times(test_ids, timed_tests, levels=3):
+    """Estimate durations for the tests with no timing data.
+
+    The estimate for a test is the mean duration of the known tests in the
+    same class, failing that the same module and then the same package, as
+    found by :func:`stestr.utils.get_parent_id`. Only the known tests which
+    share a parent with an unknown test are summed, and a module or package
+    is only looked at for the unknown tests still without an estimate.
+
+    :return: A dict mapping test id to estimated duration, tests without
+        any known relatives are not included.
+    """
+    if not timed_tests:
+        return {}
+    # Map each unknown test to its parent at the current level.
+    pending = {x: x for x in test_ids if x not in timed_tests}
+    if not pending:
+        return {}
+    get_parent_id = utils.get_parent_id
+    result = {}
+    # The parents of the known tests, and a mapping of those parents to
+    # their ancestor at the current level.
+    parents = None
+    ancestors = None
+    for _ in range(levels):
+        pending = {
+            test_id: parent
+            for test_id, parent in zip(pending, map(get_parent_id, pending.values()))
+            if parent is not None
+        }
+        if not pending:
+            break
+        needed = set(pending.values())
+        if parents is None:
+            parents = list(map(get_parent_id, timed_tests))
+            ancestor_ids = parents
+        else:
+            if ancestors is None:
+                ancestors = {x: x for x in parents if x is not None}
+            ancestors = {
+                parent: ancestor and get_parent_id(ancestor)
+                for parent, ancestor in ancestors.items()
+            }
+            ancestor_ids = map(ancestors.get, parents)
+        totals = dict.fromkeys(needed, 0.0)
+        counts = dict.fromkeys(needed, 0)
+        for ancestor, duration in zip(ancestor_ids, timed_tests.values()):
+            if ancestor in needed:
+                totals[ancestor] += duration
+                counts[ancestor] += 1
+        unresolved = {}
+        for test_id, parent in pending.items():
+            count = counts[parent]
+            if count:
+                result[test_id] = totals[parent] / count
+            else:
+                unresolved[test_id] = parent
+        pending = unresolved
+    return result
+
+
+def _group_test_ids(test_ids, group_callback):
+    """Generate an ordered mapping of group_id -> test_ids."""
+    group_ids = collections.defaultdict(list)
+    for test_id in test_ids:
+        group_id = (group_callback and group_callback(test_id)) or test_id
+        group_ids[group_id].append(test_id)
+    return group_ids
+
+
 def local_concurrency():
     """Get the number of available CPUs on the system.
 
@@ -137,10 +895,24 @@ def local_concurrency():
 
 
 def generate_worker_partitions(
-    ids, worker_path, repository=None, group_callback=None, randomize=False
+    ids,
+    worker_path,
+    repository=None,
+    group_callback=None,
+    randomize=False,
+    estimator="last",
+    estimates=None,
+    longest_first=False,
+    memory_limit=None,
 ):
     """Parse a worker yaml file and generate test groups
 
+    Each entry in the file gets the tests matching its regexes, split between
+    concurrency workers if it has that field. If any entry has a weight field
+    (a relative speed) all the workers declared in the file are instead
+    scheduled together, see :func:`_partition_weighted_workers`, and the
+    memory_limit is not used.
+
     :param list ids: A list of test ids too be partitioned
     :param path worker_path: The path to a worker file
     :param repository: A repository object that will be used for looking up
@@ -156,32 +928,174 @@ def generate_worker_partitions(
     :param bool randomize: If true each partition's test order will be
         randomized. This is optional and also will only be used for scheduling
         if there is a count field on a worker.
+    :param str estimator: The estimator used for test durations, see
+        :meth:`stestr.repository.abstract.AbstractRepository.get_test_times`
+    :param dict estimates: An optional dict which will be updated with the
+        estimated duration of every test which was scheduled using the
+        durations of its relatives.
+    :param bool longest_first: If true the tests of each worker with a count
+        field are ordered longest first, see :func:`order_longest_first`.
+    :param int memory_limit: An optional limit in bytes on the memory used by
+        the tests running at the same time on each worker with a count field.
 
     :returns: A list where each element is a distinct subset of test_ids.
     """
-    with open(worker_path) as worker_file:
-        workers_desc = yaml.safe_load(worker_file.read())
+    workers_desc = _load_worker_file(worker_path)
+    if any("weight" in worker for worker in workers_desc):
+        return _partition_weighted_workers(
+            ids,
+            workers_desc,
+            repository,
+            group_callback,
+            randomize,
+            estimator,
+            estimates,
+            longest_first,
+        )
     worker_groups = []
     for worker in workers_desc:
-        if isinstance(worker, dict) and "worker" in worker.keys():
-            if isinstance(worker["worker"], list):
-                local_worker_list = selection.filter_tests(worker["worker"], ids)
-
-                if "concurrency" in worker.keys() and worker["concurrency"] > 1:
-                    partitioned_tests = partition_tests(
-                        local_worker_list,
-                        worker["concurrency"],
-                        repository,
-                        group_callback,
-                        randomize,
-                    )
-                    worker_groups.extend(partitioned_tests)
-                else:
-                    # If a worker partition is empty don't add it to the output
-                    if local_worker_list:
-                        worker_groups.append(local_worker_list)
-            else:
-                raise TypeError("The input yaml is the incorrect format")
+        local_worker_list = selection.filter_tests(worker["worker"], ids)
+
+        if "concurrency" in worker.keys() and worker["concurrency"] > 1:
+            partitioned_tests = partition_tests(
+                local_worker_list,
+                worker["concurrency"],
+                repository,
+                group_callback,
+                randomize,
+                estimator,
+                estimates,
+                longest_first,
+                memory_limit,
+            )
+            worker_groups.extend(partitioned_tests)
         else:
-            raise TypeError("The input yaml is the incorrect format")
+            # If a worker partition is empty don't add it to the output
+            if local_worker_list:
+                worker_groups.append(local_worker_list)
     return worker_groups
+
+
+def _load_worker_file(worker_path):
+    """Load and validate the worker entries of a worker yaml file."""
+    with open(worker_path) as worker_file:
+        workers_desc = yaml.safe_load(worker_file.read())
+    if not isinstance(workers_desc, list):
+        raise TypeError("The input yaml is the incorrect format")
+    for worker in workers_desc:
+        if not isinstance(worker, dict) or not isinstance(worker.get("worker"), list):
+            raise TypeError("The input yaml is the incorrect format")
+        weight = worker.get("weight", 1)
+        if (
+            isinstance(weight, bool)
+            or not isinstance(weight, (int, float))
+            or weight <= 0
+        ):
+            raise TypeError(
+                "The weight of a worker must be a positive number, not %r" % weight
+            )
+        concurrency = worker.get("concurrency", 1)
+        if (
+            isinstance(concurrency, bool)
+            or not isinstance(concurrency, int)
+            or concurrency <= 0
+        ):
+            raise TypeError(
+                "The concurrency of a worker must be a positive integer, not %r"
+                % concurrency
+            )
+    return workers_desc
+
+
+def get_worker_weights(worker_path):
+    """Get the weight of each partition generated from a worker yaml file.
+
+    :param path worker_path: The path to a worker file
+    :returns: A list with the weight of each partition returned by
+        :func:`generate_worker_partitions` for the file, or None if no worker
+        in the file has a weight field.
+    """
+    workers_desc = _load_worker_file(worker_path)
+    if not any("weight" in worker for worker in workers_desc):
+        return None
+    weights = []
+    for worker in workers_desc:
+        weights.extend([worker.get("weight", 1)] * worker.get("concurrency", 1))
+    return weights
+
+
+def _partition_weighted_workers(
+    ids,
+    workers_desc,
+    repository,
+    group_callback,
+    randomize,
+    estimator,
+    estimates,
+    longest_first,
+):
+    """Partition tests between all the workers of a weighted worker file.
+
+    Every worker entry provides concurrency workers, each with the entry's
+    weight (a relative speed, defaulting to 1). Unlike unweighted worker
+    files the entries are not split on their own, each test runs once and
+    the groups are allocated longest first to the worker matching them with
+    the earliest predicted finish time, which is its load divided by its
+    weight. Tests with no timing data or estimate count as the mean duration
+    of the known tests, or as 1 if there are none, so they are spread in
+    proportion to the worker weights.
+
+    :returns: A list with one element for each worker, in file order. Some
+        elements may be empty.
+    """
+    # The entries each test matches, tests matching none aren't run.
+    eligible = collections.defaultdict(list)
+    for index, worker in enumerate(workers_desc):
+        for test_id in selection.filter_tests(worker["worker"], ids):
+            eligible[test_id].append(index)
+    test_ids = [x for x in ids if x in eligible]
+    timed_tests = {}
+    if repository:
+        timed_tests = repository.get_test_times(test_ids, estimator)["known"]
+    estimated = _estimate_unknown_times(test_ids, timed_tests)
+    if estimates is not None:
+        estimates.update(estimated)
+    timed_tests = {**timed_tests, **estimated}
+    default_time = 1.0
+    if timed_tests:
+        default_time = sum(timed_tests.values()) / len(timed_tests)
+
+    weights = []
+    entry_workers = []
+    for worker in workers_desc:
+        first = len(weights)
+        weights.extend([worker.get("weight", 1)] * worker.get("concurrency", 1))
+        entry_workers.append(range(first, len(weights)))
+    partitions = [list() for _ in weights]
+    loads = [0.0] * len(weights)
+
+    # Only tests in a group which match the same entries are kept together,
+    # as the rest can't all be run on the same worker.
+    groups = collections.defaultdict(list)
+    for test_id in test_ids:
+        group_id = (group_callback and group_callback(test_id)) or test_id
+        groups[(group_id, tuple(eligible[test_id]))].append(test_id)
+    group_times = {
+        key: sum(timed_tests.get(x, default_time) for x in group_tests)
+        for key, group_tests in groups.items()
+    }
+    for key in sorted(groups, key=group_times.__getitem__, reverse=True):
+        duration = group_times[key]
+        candidates = itertools.chain.from_iterable(entry_workers[x] for x in key[1])
+        worker = min(candidates, key=lambda x: (loads[x] + duration) / weights[x])
+        loads[worker] += duration
+        partitions[worker].extend(groups[key])
+    if randomize:
+        for partition in partitions:
+            random.shuffle(partition)
+    elif longest_first:
+        partitions = [
+            order_longest_first(partition, timed_tests, group_callback)
+            for partition in partitions
+        ]
+    return partitions
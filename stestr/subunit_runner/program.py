@@ -14,10 +14,16 @@
 # under the License.
 
 import functools
+import gc
 import os
 import sys
+import traceback
 import unittest
 
+from stestr import discovery
+from stestr import dispatcher
+from stestr import pool
+
 
 def filter_by_ids(suite_or_case, test_ids):
     """Remove tests from suite_or_case where their id is not in test_ids.
@@ -75,6 +81,56 @@ def filter_by_ids(suite_or_case, test_ids):
     return suite_or_case
 
 
+def order_by_ids(suite_or_case, test_ids):
+    """Return a flat test suite of the tests in test_ids, in that order.
+
+    Unlike filter_by_ids any suite structure is discarded, which means custom
+    suites (like testresources' OptimisingTestSuite) lose their behaviour.
+    Class and module fixtures are still handled by unittest.TestSuite as long
+    as the tests of a class (and module) are listed together.
+
+    :param suite_or_case: A test suite or test case.
+    :param test_ids: A sequence of test ids, ids which are not in
+        suite_or_case are ignored.
+    :return: a unittest.TestSuite
+    """
+    tests = {}
+    for test in iterate_tests(suite_or_case):
+        tests.setdefault(test.id(), test)
+    return unittest.TestSuite([tests[x] for x in test_ids if x in tests])
+
+
+class UnknownTest(unittest.TestCase):
+    """A test which fails because its id matches no loaded test.
+
+    This stands in for a test id a worker was asked to run but doesn't have,
+    so that the test fails instead of silently not running.
+    """
+
+    def __init__(self, test_id):
+        super().__init__()
+        self._test_id = test_id
+
+    def id(self):
+        return self._test_id
+
+    def runTest(self):
+        self.fail("%s does not match any test found by this runner" % self._test_id)
+
+
+def batch_suite(tests, test_ids):
+    """Return a flat test suite of the tests in test_ids, in that order.
+
+    :param dict tests: A mapping of test id to test case.
+    :param list test_ids: The ids of the tests to run. Ids which are not in
+        tests are run as an :class:`UnknownTest`, after the other tests.
+    :return: a unittest.TestSuite
+    """
+    known = [tests[x] for x in test_ids if x in tests]
+    unknown = [UnknownTest(x) for x in test_ids if x not in tests]
+    return unittest.TestSuite(known + unknown)
+
+
 def iterate_tests(test_suite_or_case):
     """Iterate through all of the test cases in 'test_suite_or_case'."""
     try:
@@ -173,6 +229,13 @@ class TestProgram(unittest.TestProgram):
         # XXX: Local edit (see http://bugs.python.org/issue22860)
         self.listtests = False
         self.load_list = None
+        self.preserve_order = False
+        self.dispatch = None
+        self.pool = None
+        self.fork_workers = None
+        self.modules = None
+        self.targeted_load = False
+        self.record_memory = False
         self.testRunner = testRunner
         self.testLoader = testLoader
         self.progName = os.path.basename(argv[0])
@@ -183,15 +246,21 @@ class TestProgram(unittest.TestProgram):
             # does in OptimisingTestSuite.add, but with a standard protocol).
             # This is needed because the load_tests hook allows arbitrary
             # suites, even if that is rarely used.
-            source = open(self.load_list, "rb")
-            try:
-                lines = source.readlines()
-            finally:
-                source.close()
-            test_ids = {line.strip().decode("utf-8") for line in lines}
-            self.test = filter_by_ids(self.test, test_ids)
+            lines = self._read_load_list()
+            if self.preserve_order:
+                test_ids = [line.strip().decode("utf-8") for line in lines]
+                self.test = order_by_ids(self.test, test_ids)
+            else:
+                test_ids = {line.strip().decode("utf-8") for line in lines}
+                self.test = filter_by_ids(self.test, test_ids)
         # XXX: Local edit (see http://bugs.python.org/issue22860)
-        if not self.listtests:
+        if self.dispatch:
+            self.runDispatchedTests()
+        elif self.pool:
+            self.runPoolTests()
+        elif self.fork_workers:
+            self.runForkedTests()
+        elif not self.listtests:
             self.runTests()
         else:
             runner = self._get_runner()
@@ -222,13 +291,103 @@ class TestProgram(unittest.TestProgram):
             help="Specifies a file containing test ids, only tests matching "
             "those ids are executed",
         )
+        parser.add_argument(
+            "--preserve-order",
+            dest="preserve_order",
+            default=False,
+            action="store_true",
+            help="Run the tests from --load-list in the order they are "
+            "listed instead of the order they were discovered in",
+        )
+        parser.add_argument(
+            "--dispatch",
+            dest="dispatch",
+            default=None,
+            help="The address of a stestr dispatcher to request batches of "
+            "test ids to execute from, instead of running all the tests",
+        )
+        parser.add_argument(
+            "--pool",
+            dest="pool",
+            default=None,
+            help="The address of a stestr worker pool to join, the batches of "
+            "test ids it sends are run until it is closed",
+        )
+        parser.add_argument(
+            "--fork-workers",
+            dest="fork_workers",
+            default=None,
+            help="A comma separated list of FD:LIST_FILE pairs. A worker is "
+            "forked for each pair after discovery, which runs the tests in "
+            "LIST_FILE writing the results to the inherited file descriptor FD. "
+            "The return code of every worker is written to stdout at the end",
+        )
+        parser.add_argument(
+            "--modules",
+            dest="modules",
+            default=None,
+            help="A comma separated list of modules to load the tests from "
+            "instead of discovering every test module under the start "
+            "directory. The tests in packages are discovered",
+        )
+        parser.add_argument(
+            "--targeted-load",
+            dest="targeted_load",
+            default=False,
+            action="store_true",
+            help="Only load the test modules with the tests in --load-list "
+            "instead of discovering every test module, unless that could "
+            "find different tests, like when a load_tests function is used",
+        )
+        parser.add_argument(
+            "--record-memory",
+            dest="record_memory",
+            default=False,
+            action="store_true",
+            help="Attach the peak memory use of each test to its result",
+        )
         return parser
 
+    def _read_load_list(self):
+        with open(self.load_list, "rb") as source:
+            return source.readlines()
+
+    def createTests(self, from_discovery=False, Loader=None):
+        if not from_discovery:
+            return super().createTests(from_discovery, Loader)
+        top = os.path.abspath(self.top if self.top is not None else self.start)
+        modules = self.modules.split(",") if self.modules else None
+        if modules is None and self.targeted_load and self.load_list:
+            lines = self._read_load_list()
+            test_ids = [x.strip().decode("utf-8") for x in lines if x.strip()]
+            modules = discovery.find_modules(top, self.start, test_ids)
+        if modules is None:
+            return super().createTests(from_discovery, Loader)
+        if top not in sys.path:
+            sys.path.insert(0, top)
+        loader = self.testLoader if Loader is None else Loader()
+        tests = []
+        for name in modules:
+            path = os.path.join(top, *name.split("."))
+            if os.path.isdir(path):
+                tests.append(loader.discover(path, self.pattern, top))
+                continue
+            # XXX: Load the module the way discovery loads each module, so
+            # that import errors are reported just like discovery reports
+            # them.
+            loader._top_level_dir = top
+            test, _ = loader._find_test_path(path + ".py", self.pattern)
+            if test is not None:
+                tests.append(test)
+        self.test = loader.suiteClass(tests)
+
     def _get_runner(self):
         testRunner = self.testRunner
         try:
             testRunner = self.testRunner(
-                failfast=self.failfast, tb_locals=self.tb_locals
+                failfast=self.failfast,
+                tb_locals=self.tb_locals,
+                record_memory=self.record_memory,
             )
         except TypeError:
             testRunner = self.testRunner()
@@ -243,3 +402,92 @@ class TestProgram(unittest.TestProgram):
             unittest.installHandler()
         testRunner = self._get_runner()
         self.result = testRunner.run(self.test)
+
+    def runDispatchedTests(self):
+        if self.catchbreak:
+            unittest.installHandler()
+        authkey = bytes.fromhex(os.environ[dispatcher.AUTHKEY_ENV])
+        # Build the id -> test mapping once, every batch is run from it as a
+        # flat suite. unittest.TestSuite still handles class and module
+        # fixtures for a flat list of tests.
+        tests = {}
+        for test in iterate_tests(self.test):
+            tests.setdefault(test.id(), test)
+        testRunner = self._get_runner()
+        for batch in dispatcher.iter_batches(self.dispatch, authkey):
+            self.result = testRunner.run(batch_suite(tests, batch))
+
+    def runPoolTests(self):
+        if self.catchbreak:
+            unittest.installHandler()
+        authkey = bytes.fromhex(os.environ[dispatcher.AUTHKEY_ENV])
+        tests = {}
+        for test in iterate_tests(self.test):
+            tests.setdefault(test.id(), test)
+
+        def run_batch(batch, stream):
+            testRunner = self.testRunner(
+                failfast=self.failfast,
+                tb_locals=self.tb_locals,
+                stdout=stream,
+                record_memory=self.record_memory,
+            )
+            # Like --load-list the tests are run in the order they were
+            # discovered in, not the order of the batch.
+            batch = set(batch)
+            suite = unittest.TestSuite([y for x, y in tests.items() if x in batch])
+            self.result = testRunner.run(suite)
+
+        pool.run_worker(self.pool, authkey, run_batch)
+
+    def runForkedTests(self):
+        workers = []
+        for spec in self.fork_workers.split(","):
+            fd, list_path = spec.split(":", 1)
+            workers.append((int(fd), list_path))
+        # Everything imported so far is shared with the workers, keep the
+        # garbage collector from touching (and so copying) those pages.
+        gc.collect()
+        gc.freeze()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pids = {}
+        for index, (fd, list_path) in enumerate(workers):
+            pid = os.fork()
+            if not pid:
+                self._runForkedWorker(fd, list_path, [x[0] for x in workers])
+            pids[pid] = index
+        for fd, _ in workers:
+            os.close(fd)
+        returncodes = [0] * len(workers)
+        while pids:
+            pid, status = os.wait()
+            if pid in pids:
+                returncodes[pids.pop(pid)] = os.waitstatus_to_exitcode(status)
+        sys.stdout.write(" ".join(str(x) for x in returncodes) + "\n")
+        sys.stdout.flush()
+
+    def _runForkedWorker(self, fd, list_path, fds):
+        returncode = 0
+        try:
+            # The worker's stdout is its own pipe, just like a worker process
+            # started with a load list.
+            os.dup2(fd, 1)
+            for other in fds:
+                os.close(other)
+            with open(list_path, "rb") as source:
+                lines = source.readlines()
+            if self.preserve_order:
+                test_ids = [line.strip().decode("utf-8") for line in lines]
+                self.test = order_by_ids(self.test, test_ids)
+            else:
+                test_ids = {line.strip().decode("utf-8") for line in lines}
+                self.test = filter_by_ids(self.test, test_ids)
+            self.runTests()
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode)
@@ -14,22 +14,118 @@
 # under the License.
 
 from functools import partial
+import os
 import sys
 
 from subunit import StreamResultToBytes
 from subunit.test_results import AutoTimingTestResultDecorator
 from testtools import ExtendedToStreamDecorator
 
+from stestr.repository import timing
 from stestr.subunit_runner import program
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, memory use isn't recorded there.
+    resource = None
+
+_FINAL_STATES = frozenset(
+    ["success", "fail", "skip", "xfail", "uxsuccess", "exists", "unknown"]
+)
+
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    if sys.platform != "darwin":
+        peak *= 1024
+    return peak
+
+
+def _start_measuring():
+    """Start measuring the memory a test uses.
+
+    Where the peak resident set size of the process can be reset (Linux) it
+    is, and the baseline is the resident set size now. Otherwise the peak
+    can only grow, and the baseline is the peak so far, so that a test is
+    only charged with the memory it used if it raised the peak.
+
+    :return: A (baseline, reset) tuple, reset is True if the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "wb") as clear_refs:
+            clear_refs.write(b"5")
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"), True
+    except (OSError, ValueError, IndexError):
+        return _peak_rss(), False
+
+
+def _stop_measuring(baseline, reset):
+    """Return the memory a test used since _start_measuring() returned."""
+    if reset:
+        with open("/proc/self/status", "rb") as status:
+            for line in status:
+                if line.startswith(b"VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+                    break
+            else:
+                peak = baseline
+    else:
+        peak = _peak_rss()
+    return max(peak - baseline, 0)
+
+
+class MemoryStreamResult:
+    """Attach the peak memory use of each test to its result.
+
+    The memory use is how far the peak resident set size of the process rose
+    during the test above the resident set size when the test started, as an
+    attachment named stestr.repository.timing.MEMORY_ATTACHMENT. Where the
+    peak can't be reset before each test it is how far the test raised the
+    peak of the process instead, see _start_measuring().
+
+    :param target: The StreamResult to forward events to.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self._baselines = {}
+
+    def startTestRun(self):
+        self.target.startTestRun()
+
+    def stopTestRun(self):
+        self.target.stopTestRun()
+
+    def status(self, test_id=None, test_status=None, **kwargs):
+        if test_status == "inprogress":
+            self._baselines[test_id] = _start_measuring()
+        elif test_status in _FINAL_STATES and test_id in self._baselines:
+            memory = _stop_measuring(*self._baselines.pop(test_id))
+            self.target.status(
+                test_id=test_id,
+                file_name=timing.MEMORY_ATTACHMENT,
+                file_bytes=str(memory).encode("ascii"),
+                mime_type="text/plain;charset=utf8",
+                eof=True,
+                timestamp=kwargs.get("timestamp"),
+            )
+        self.target.status(test_id=test_id, test_status=test_status, **kwargs)
+
 
 class SubunitTestRunner(object):
-    def __init__(self, failfast=False, tb_locals=False, stdout=sys.stdout):
+    def __init__(
+        self, failfast=False, tb_locals=False, stdout=sys.stdout, record_memory=False
+    ):
         """Create a Test Runner.
 
         :param failfast: Stop running tests at the first failure.
         :param stdout: Output stream parameter, defaults to sys.stdout
         :param tb_locals: If set true local variables will be shown
+        :param record_memory: If set true the memory use of each test is
+            attached to its result, see MemoryStreamResult.
 
         Either stream or stdout can be supplied, and stream will take
         precedence.
@@ -37,10 +133,13 @@ class SubunitTestRunner(object):
         self.failfast = failfast
         self.stream = stdout
         self.tb_locals = tb_locals
+        self.record_memory = record_memory
 
     def run(self, test):
         "Run the given test case or test suite."
         result, _ = self._list(test)
+        if self.record_memory and resource is not None:
+            result = MemoryStreamResult(result)
         result = ExtendedToStreamDecorator(result)
         result = AutoTimingTestResultDecorator(result)
         if self.failfast is not None:
@@ -26,6 +26,7 @@ import testtools
 
 from stestr import __version__
 from stestr import colorizer
+from stestr.repository import timing
 from stestr import results
 
 # NOTE(mtreinish) on python3 anydbm was renamed dbm and the python2 dbm module
@@ -116,6 +117,9 @@ def print_attachments(stream, test, all_channels=False, show_binary_attachments=
         # NOTE(sdague): the subunit names are a little crazy, and actually
         # are in the form pythonlogging:'' (with the colon and quotes)
         name = name.split(":")[0]
+        if name == timing.MEMORY_ATTACHMENT:
+            # Recorded for the scheduler, not something to show the user.
+            continue
         if detail.content_type.type == "test":
             detail.content_type.type = "text"
         if all_channels or name in channels:
@@ -10,17 +10,29 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+from concurrent import futures
+import datetime
+import functools
 import io
 import os
+import random
 import re
+import shutil
 import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import traceback
 
 import fixtures
 from subunit import v2
 
+from stestr import agent
+from stestr import ast_discovery
+from stestr import discovery
+from stestr import dispatcher
 from stestr import results
 from stestr import scheduler
 from stestr import selection
@@ -67,15 +79,93 @@ class TestProcessorFixture(fixtures.Fixture):
     :param path worker_path: Optional path of a manual worker grouping file
         to use for the run
     :param int concurrency: How many processes to use. The default (0)
-        autodetects your CPU count and uses that.
+        autodetects your CPU count and uses that. If this is ``auto`` the
+        number of processes is chosen from the timing data in the repository
+        with :func:`stestr.scheduler.choose_concurrency`, up to the CPU count,
+        and the choice is stored in ``concurrency_choice``.
     :param path exclude_list: Path to an exclusion list file, this file
         contains a separate regex exclude on each newline.
     :param path include_list: Path to an inclusion list file, this file
          contains a separate regex on each newline.
     :param boolean randomize: Randomize the test order after they are
         partitioned into separate workers
+    :param bool dynamic: Instead of partitioning the tests up front, start
+        the workers and have them request batches of tests as they become
+        idle. This requires dispatchoption to be set.
+    :param dispatchoption: Option to substitute into IDOPTION to have a
+        worker request test ids from a dispatcher. Any $DISPATCH in it will be
+        replaced with the address of the dispatcher.
+    :param str time_estimator: How the duration of each test is estimated
+        from its timing history when scheduling, one of ``last``, ``mean``,
+        ``ewma``, ``p50`` or ``p90``.
+    :param bool longest_first: Order the tests given to each worker so the
+        slowest run first, see :func:`stestr.scheduler.order_longest_first`.
+        The idoption must make the worker run the tests in the order they
+        are listed for this to have any effect. This is ignored if randomize
+        is set.
+    :param int memory_limit: An optional limit in bytes on the total memory
+        recorded for the tests running at the same time, see
+        :func:`stestr.scheduler.partition_tests`. This is not supported with
+        dynamic scheduling.
+    :param list agents: An optional list of ``stestr agent`` addresses, each
+        of which is sent a partition of the tests to run alongside the local
+        workers, see :mod:`stestr.agent`.
+    :param tuple shard: An optional (index, total) tuple, if set only the
+        tests in that shard of the selected tests are used, see
+        :func:`stestr.scheduler.select_shard`. The number of tests before
+        sharding is recorded in ``unsharded_count``.
+    :param bool speculate: With dynamic scheduling, give idle workers copies
+        of the tests still waiting to run on the busiest worker once there
+        is nothing else left to run, see
+        :class:`stestr.scheduler.DispatchQueue`. The results of the run must
+        be loaded through :meth:`decorate_result`.
+    :param bool failfast: Stop every worker as soon as any test fails. The
+        results of the run must be loaded through :meth:`decorate_result`.
+    :param pool: An optional :class:`stestr.pool.WorkerPool` to run the
+        tests on instead of starting new workers, this is used to run tests
+        many times without discovering them again each time.
+    :param str pooloption: The option which makes the test command join a
+        worker pool, $POOL is replaced with the pool address.
+    :param bool fork_server: Discover and import the tests in a single
+        process which then forks a worker for each partition, instead of
+        starting a process for each partition. This requires os.fork.
+    :param str forkoption: The option which makes the test command fork the
+        workers, $WORKERS is replaced with the list of workers.
+    :param bool cache_discovery: Store the listed test ids in the
+        repository and reuse them while the test files are unchanged, see
+        :mod:`stestr.discovery`. This requires top_dir, test_path and
+        moduleoption to be set.
+    :param str top_dir: The top level directory of the test discovery.
+    :param str test_path: The directory test discovery starts in.
+    :param str moduleoption: The option which makes the list command only
+        list the tests in some modules, $MODULES is replaced with a comma
+        separated list of module names.
+    :param bool parallel_discovery: List the tests in each package in
+        test_path with a separate process, running up to concurrency of them
+        at the same time, see :func:`stestr.discovery.split_packages`. This
+        requires top_dir, test_path and moduleoption to be set.
+    :param bool static_discovery: Find the tests by parsing the test modules
+        instead of importing them, importing only the modules whose tests
+        can't be found that way, see :mod:`stestr.ast_discovery`. This
+        requires top_dir, test_path and moduleoption to be set.
+    :param bool pipeline: With dynamic scheduling, start the workers before
+        the tests are listed and hand them the tests while they are still
+        being listed, see :class:`stestr.scheduler.PipelineQueue`. The
+        packages in test_path are listed one at a time, or concurrently if
+        parallel_discovery is set, and the tests of each are queued as soon
+        as it has been listed. This is ignored if the concurrency is 1 or
+        chosen automatically, or if test_ids, worker_path, agents, shard or
+        pool are set.
+    :param bool isolated: Run each test in a new test runner, up to
+        concurrency of them at the same time. The test runners of each worker
+        run one after another, and their output makes up the worker's
+        stream. The slowest tests are started first, or the tests are
+        started in a random order if randomize is set. With a pool each test
+        is run as a batch of its own on one of concurrency pool workers.
     """
 
+    variable_regex = r"\$(IDOPTION|IDFILE|IDLIST|LISTOPT)"
+
     def __init__(
         self,
         test_ids,
@@ -94,6 +184,27 @@ class TestProcessorFixture(fixtures.Fixture):
         exclude_regex=None,
         include_list=None,
         randomize=False,
+        dynamic=False,
+        dispatchoption=None,
+        time_estimator="last",
+        longest_first=False,
+        memory_limit=None,
+        agents=None,
+        shard=None,
+        speculate=False,
+        failfast=False,
+        pool=None,
+        pooloption=None,
+        fork_server=False,
+        forkoption=None,
+        cache_discovery=False,
+        top_dir=None,
+        test_path=None,
+        moduleoption=None,
+        parallel_discovery=False,
+        static_discovery=False,
+        pipeline=False,
+        isolated=False,
     ):
         """Create a TestProcessorFixture."""
 
@@ -115,10 +226,38 @@ class TestProcessorFixture(fixtures.Fixture):
         self.include_list = include_list
         self.exclude_regex = exclude_regex
         self.randomize = randomize
+        self.dynamic = dynamic
+        self.dispatchoption = dispatchoption
+        self.time_estimator = time_estimator
+        self.longest_first = longest_first
+        self.memory_limit = memory_limit
+        self.agents = agents or []
+        self.shard = shard
+        self.unsharded_count = None
+        self.speculate = speculate
+        self.failfast = failfast
+        self.pool = pool
+        self.pooloption = pooloption
+        self.fork_server = fork_server
+        self.forkoption = forkoption
+        self.cache_discovery = cache_discovery
+        self.top_dir = top_dir
+        self.test_path = test_path
+        self.moduleoption = moduleoption
+        self.parallel_discovery = parallel_discovery
+        self.static_discovery = static_discovery
+        self.pipeline = pipeline
+        self.isolated = isolated
+        self._pipelined = False
+        self._queue = None
+        self._procs = None
+        self.concurrency_choice = None
+        self.spawn_time = None
+        self.estimated_times = {}
 
     def setUp(self):
         super().setUp()
-        variable_regex = r"\$(IDOPTION|IDFILE|IDLIST|LISTOPT)"
+        variable_regex = self.variable_regex
         variables = {}
         list_variables = {"LISTOPT": self.listopt}
         cmd = self.template
@@ -135,23 +274,52 @@ class TestProcessorFixture(fixtures.Fixture):
             or self.include_list
             or self.exclude_regex
         )
+        auto_concurrency = False
         if nonparallel:
             self.concurrency = 1
         else:
             self.concurrency = None
-            if self.concurrency_value:
+            if self.concurrency_value == "auto":
+                auto_concurrency = True
+            elif self.concurrency_value:
                 self.concurrency = int(self.concurrency_value)
             if not self.concurrency:
                 self.concurrency = scheduler.local_concurrency()
             if not self.concurrency:
                 self.concurrency = 1
-        if self.test_ids is None:
+            if auto_concurrency and self.concurrency == 1:
+                self.concurrency_choice = scheduler.Concurrency(
+                    1, None, "there is only one CPU"
+                )
+        self._pipelined = bool(
+            self.pipeline
+            and self.test_ids is None
+            and self.dynamic
+            and self.dispatchoption
+            and self.concurrency > 1
+            and not auto_concurrency
+            and not self.worker_path
+            and not self.agents
+            and not self.shard
+            and self.pool is None
+            and not self.isolated
+        )
+        if self.test_ids is None and not self._pipelined:
             if self.concurrency == 1:
                 if default_idstr:
                     self.test_ids = default_idstr.split()
-            if self.concurrency != 1 or selection_logic or self.worker_path:
+            if (
+                self.concurrency != 1
+                or selection_logic
+                or self.worker_path
+                or self.longest_first
+                or self.agents
+                or self.shard
+                or self.pool is not None
+                or self.isolated
+            ):
                 # Have to be able to tell each worker what to run / filter
-                # tests.
+                # tests, or the order to run them in.
                 self.test_ids = self.list_tests()
         if self.test_ids is None:
             # No test ids to supply to the program.
@@ -159,13 +327,28 @@ class TestProcessorFixture(fixtures.Fixture):
             name = ""
             idlist = ""
         else:
-            self.test_ids = selection.construct_list(
-                self.test_ids,
-                exclude_list=self.exclude_list,
-                include_list=self.include_list,
-                regexes=self.test_filters,
-                exclude_regex=self.exclude_regex,
-            )
+            self.test_ids = self._select_tests(self.test_ids)
+            if self.shard:
+                self.unsharded_count = len(self.test_ids)
+                self.test_ids = scheduler.select_shard(
+                    self.test_ids,
+                    self.shard[0],
+                    self.shard[1],
+                    self.repository,
+                    self._group_callback,
+                    self.time_estimator,
+                )
+            if auto_concurrency and self.concurrency > 1:
+                self.concurrency_choice = scheduler.choose_concurrency(
+                    self.test_ids,
+                    self.repository,
+                    self.concurrency,
+                    self._group_callback,
+                    self.time_estimator,
+                )
+                self.concurrency = self.concurrency_choice.workers
+            if self.concurrency == 1 and self.longest_first and not self.randomize:
+                self.test_ids = self._order_longest_first(self.test_ids)
             name = self.make_listfile()
             variables["IDFILE"] = name
             idlist = " ".join(self.test_ids)
@@ -182,6 +365,24 @@ class TestProcessorFixture(fixtures.Fixture):
             variables["IDOPTION"] = idoption
         self.cmd = re.sub(variable_regex, subst, cmd)
 
+    def _select_tests(self, test_ids):
+        return selection.construct_list(
+            test_ids,
+            exclude_list=self.exclude_list,
+            include_list=self.include_list,
+            # construct_list extends the list of regexes it is given.
+            regexes=list(self.test_filters) if self.test_filters else None,
+            exclude_regex=self.exclude_regex,
+        )
+
+    def _order_longest_first(self, test_ids):
+        test_times = {}
+        if self.repository:
+            test_times = self.repository.get_test_times(test_ids, self.time_estimator)[
+                "known"
+            ]
+        return scheduler.order_longest_first(test_ids, test_times, self._group_callback)
+
     def make_listfile(self):
         name = None
         try:
@@ -205,40 +406,112 @@ class TestProcessorFixture(fixtures.Fixture):
         """Clear SIGPIPE : child processes expect the default handler."""
         signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
-    def _start_process(self, cmd):
+    def _start_process(
+        self, cmd, env=None, cancellable=False, stdout=subprocess.PIPE, pass_fds=()
+    ):
         # NOTE(claudiub): Windows does not support passing in a preexec_fn
         # argument.
         preexec_fn = None if sys.platform == "win32" else self._clear_SIGPIPE
+        if cancellable and sys.platform != "win32":
+            # Make the test runner replace the shell, so that it is the
+            # process which is stopped if the worker is cancelled.
+            cmd = "exec " + cmd
         return subprocess.Popen(
             cmd,
             shell=True,
-            stdout=subprocess.PIPE,
+            stdout=stdout,
             stdin=subprocess.PIPE,
             preexec_fn=preexec_fn,
+            env=env,
+            pass_fds=pass_fds,
+        )
+
+    def _discovery_paths_known(self):
+        # Shell variables in the paths are only expanded by the shell running
+        # the list command.
+        return (
+            self.top_dir is not None
+            and self.test_path is not None
+            and "$" not in self.top_dir + self.test_path
         )
 
     def list_tests(self):
         """List the tests returned by list_cmd.
 
+        If static_discovery is set the test modules are parsed instead of
+        imported where possible. Otherwise if cache_discovery is set the ids
+        cached in the repository are used while the test files are unchanged.
+        If parallel_discovery is set the packages in test_path are listed by
+        separate processes, up to concurrency at a time.
+
         :return: A list of test ids.
         """
-        run_proc = self._start_process(self.list_cmd)
+        if self.static_discovery and self._discovery_paths_known():
+            return ast_discovery.list_tests(
+                self.top_dir, self.test_path, self._list_tests
+            )
+        if (
+            self.cache_discovery
+            and self.repository is not None
+            and self._discovery_paths_known()
+        ):
+            key = [self.list_cmd, os.environ.get("PYTHON")]
+            return discovery.list_tests(
+                self.repository, key, self.top_dir, self.test_path, self._list_tests
+            )
+        return self._list_tests()
+
+    def _list_cmd(self, modules):
+        if modules is None:
+            return self.list_cmd
+        listopt = self.listopt + " " + self.moduleoption
+        listopt = listopt.replace("$MODULES", ",".join(modules))
+        return re.sub(
+            self.variable_regex,
+            lambda match: listopt if match.group(1) == "LISTOPT" else "",
+            self.template,
+        )
+
+    def _list_group(self, modules):
+        run_proc = self._start_process(self._list_cmd(modules))
         out, err = run_proc.communicate()
-        if run_proc.returncode != 0:
+        return run_proc.returncode, out, err
+
+    def _list_tests(self, modules=None):
+        groups = None
+        if (
+            modules is None
+            and self.parallel_discovery
+            and self.concurrency > 1
+            and self._discovery_paths_known()
+            and os.path.isdir(self.test_path)
+        ):
+            groups = discovery.split_packages(self.top_dir, self.test_path)
+        if groups is None:
+            listed = [self._list_group(modules)]
+        else:
+            with futures.ThreadPoolExecutor(self.concurrency) as executor:
+                listed = list(executor.map(self._list_group, groups))
+        failed = [x for x in listed if x[0] != 0]
+        if failed:
             sys.stdout.write(
                 "\n=========================\n"
                 "Failures during discovery"
                 "\n=========================\n"
             )
+            # The import errors of every process are written as one file,
+            # like a single process lists them.
             new_out = io.BytesIO()
-            v2.ByteStreamToStreamResult(io.BytesIO(out), "stdout").run(
-                results.CatFiles(new_out)
-            )
+            cat_files = results.CatFiles(new_out)
+            for _, out, err in failed:
+                if new_out.tell():
+                    new_out.write(b"\n")
+                v2.ByteStreamToStreamResult(io.BytesIO(out), "stdout").run(cat_files)
+                if err:
+                    sys.stderr.write(err.decode("utf8"))
             out = new_out.getvalue()
             if out:
                 sys.stdout.write(out.decode("utf8"))
-            if err:
-                sys.stderr.write(err.decode("utf8"))
             sys.stdout.write(
                 "\n" + "=" * 80 + "\n"
                 "The above traceback was encountered during "
@@ -246,20 +519,44 @@ class TestProcessorFixture(fixtures.Fixture):
                 " modules in the specified test_path.\n"
             )
             exit(100)
-        ids = testlist.parse_enumeration(out)
+        ids = []
+        for _, out, _ in listed:
+            ids.extend(testlist.parse_enumeration(out))
         return ids
 
     def run_tests(self):
         """Run the tests defined by the command
 
+        The time the processes were started is recorded in ``spawn_time``
+        and the durations estimated for tests without any timing data are
+        recorded in ``estimated_times``.
+
         :return: A list of spawned processes.
         """
+        self._queue = None
+        self._procs = None
+        procs = self._run_tests()
+        if self.failfast or self._queue is not None:
+            procs = [_CancellableProcess(x) for x in procs]
+            self._procs = procs
+        return procs
+
+    def _run_tests(self):
         result = []
         test_ids = self.test_ids
+        self.estimated_times = {}
+        if self.isolated:
+            return self._run_isolated_tests()
         # Handle the single worker case (this is also run recursively per
         # worker in the parallel case)
-        if self.concurrency == 1 and (test_ids is None or test_ids):
-            run_proc = self._start_process(self.cmd)
+        if (
+            self.concurrency == 1
+            and not self.agents
+            and self.pool is None
+            and (test_ids is None or test_ids)
+        ):
+            self.spawn_time = _now()
+            run_proc = self._start_process(self.cmd, cancellable=self.failfast)
             # Prevent processes stalling if they read from stdin; we could
             # pass this through in future, but there is no point doing that
             # until we have a working can-run-debugger-inline story.
@@ -273,13 +570,39 @@ class TestProcessorFixture(fixtures.Fixture):
                 self.repository,
                 self._group_callback,
                 self.randomize,
+                self.time_estimator,
+                self.estimated_times,
+                self.longest_first,
+                self.memory_limit,
             )
+        elif self.dynamic and self.dispatchoption:
+            return self._run_dispatched_tests()
         # If we have multiple workers partition the tests and recursively
         # create single worker TestProcessorFixtures for each worker
         else:
             test_id_groups = scheduler.partition_tests(
-                test_ids, self.concurrency, self.repository, self._group_callback
+                test_ids,
+                self.concurrency + len(self.agents),
+                self.repository,
+                self._group_callback,
+                estimator=self.time_estimator,
+                estimates=self.estimated_times,
+                longest_first=self.longest_first,
+                memory_limit=self.memory_limit,
             )
+        if self.pool is not None:
+            # The workers are already running, so this run says nothing
+            # about their startup time.
+            self.spawn_time = None
+            return self.pool.run_batches(test_id_groups, self._start_pool_worker)
+        if self.fork_server:
+            return self._run_forked_tests(test_id_groups)
+        self.spawn_time = _now()
+        if self.agents:
+            # The first partitions are the ones filled when there is too
+            # little work for every worker, give those to the agents.
+            result = self._start_agents(test_id_groups[: len(self.agents)])
+            test_id_groups = test_id_groups[len(self.agents) :]
         for test_ids in test_id_groups:
             if not test_ids:
                 # No tests in this partition
@@ -292,7 +615,475 @@ class TestProcessorFixture(fixtures.Fixture):
                     self.idoption,
                     self.repository,
                     parallel=False,
+                    failfast=self.failfast,
                 )
             )
-            result.extend(fixture.run_tests())
+            result.extend(fixture._run_tests())
+        return result
+
+    def _start_agents(self, test_id_groups):
+        """Send a partition of the tests to each agent.
+
+        :return: A list of agent.AgentProcess objects.
+        :raises agent.AgentError: If an agent can't be connected to, any
+            batches already sent to other agents are abandoned.
+        """
+        authkey = agent.get_authkey()
+        procs = []
+        try:
+            for address, test_ids in zip(self.agents, test_id_groups):
+                if test_ids:
+                    procs.append(agent.AgentProcess(address, authkey, test_ids))
+        except agent.AgentError:
+            for proc in procs:
+                proc.close()
+            raise
+        return procs
+
+    def _run_forked_tests(self, test_id_groups):
+        """Start a fork server which forks a worker for each partition.
+
+        :return: A list of objects with the stdout and wait() parts of the
+            subprocess.Popen interface, one for each worker.
+        """
+        test_id_groups = [x for x in test_id_groups if x]
+        if not test_id_groups:
+            return []
+        specs = []
+        pipes = []
+        try:
+            for test_ids in test_id_groups:
+                fd, name = tempfile.mkstemp()
+                self.addCleanup(os.unlink, name)
+                with os.fdopen(fd, "wb") as stream:
+                    testlist.write_list(stream, test_ids)
+                pipes.append(os.pipe())
+                specs.append("%d:%s" % (pipes[-1][1], name))
+            forkoption = self.forkoption.replace("$WORKERS", '"%s"' % ",".join(specs))
+            variables = {"IDOPTION": forkoption}
+
+            def subst(match):
+                return variables.get(match.groups(1)[0], "")
+
+            cmd = re.sub(self.variable_regex, subst, self.template)
+            self.spawn_time = _now()
+            server = self._start_process(cmd, pass_fds=[x[1] for x in pipes])
+        except BaseException:
+            for read_fd, _ in pipes:
+                os.close(read_fd)
+            raise
+        finally:
+            # Only the workers write to the pipes, so that they are closed
+            # once every worker has exited.
+            for _, write_fd in pipes:
+                os.close(write_fd)
+        server.stdin.close()
+        fork_server = _ForkServer(server, len(pipes))
+        return [
+            _ForkedWorker(fork_server, index, os.fdopen(read_fd, "rb"))
+            for index, (read_fd, _) in enumerate(pipes)
+        ]
+
+    def _run_isolated_tests(self):
+        """Start workers which run each test in a new test runner.
+
+        :return: A list of objects with the stdout, poll(), terminate() and
+            wait() parts of the subprocess.Popen interface, one for each
+            worker.
+        """
+        test_ids = list(self.test_ids)
+        if self.randomize:
+            random.shuffle(test_ids)
+        elif self.repository:
+            test_times = self.repository.get_test_times(test_ids, self.time_estimator)[
+                "known"
+            ]
+            # Each test gets a test runner of its own, so unlike
+            # order_longest_first() there are no classes or modules to keep
+            # together. Tests with no known time are assumed to take the mean.
+            known = list(test_times.values())
+            default = sum(known) / len(known) if known else 0.0
+            test_ids.sort(key=lambda x: test_times.get(x, default), reverse=True)
+        test_ids = collections.deque(test_ids)
+        # Every test pays for starting its test runner, there is no time the
+        # workers were all started at.
+        self.spawn_time = None
+        result = []
+        workers = min(self.concurrency, len(test_ids))
+        if self.pool is not None:
+            for conn in self.pool.connections(workers, self._start_pool_worker):
+                start_test = functools.partial(_PoolTest, conn)
+                result.append(_IsolatedWorker(start_test, test_ids))
+            return result
+        for _ in range(workers):
+            fd, name = tempfile.mkstemp()
+            os.close(fd)
+            self.addCleanup(os.unlink, name)
+            start_test = functools.partial(self._start_isolated_test, name)
+            result.append(_IsolatedWorker(start_test, test_ids))
+        return result
+
+    def _start_isolated_test(self, list_file, test_id, stdout):
+        # The worker's previous test has finished, so its list file can be
+        # written again.
+        with open(list_file, "wb") as stream:
+            testlist.write_list(stream, [test_id])
+        variables = {"IDFILE": list_file, "IDLIST": test_id}
+
+        def subst(match):
+            return variables.get(match.groups(1)[0], "")
+
+        variables["IDOPTION"] = re.sub(self.variable_regex, subst, self.idoption)
+        cmd = re.sub(self.variable_regex, subst, self.template)
+        run_proc = self._start_process(cmd, cancellable=True, stdout=stdout)
+        run_proc.stdin.close()
+        return run_proc
+
+    def _start_pool_worker(self):
+        pooloption = self.pooloption.replace("$POOL", '"%s"' % self.pool.address)
+        variables = {"IDOPTION": pooloption}
+
+        def subst(match):
+            return variables.get(match.groups(1)[0], "")
+
+        cmd = re.sub(self.variable_regex, subst, self.template)
+        env = dict(os.environ)
+        env[dispatcher.AUTHKEY_ENV] = self.pool.authkey.hex()
+        # The results are sent over the pool connection, anything the tests
+        # write to stdout goes to stderr to keep it out of subunit output.
+        run_proc = self._start_process(cmd, env=env, stdout=sys.__stderr__)
+        run_proc.stdin.close()
+        return run_proc
+
+    def _run_dispatched_tests(self):
+        """Start workers which request their tests from a dispatcher.
+
+        :return: A list of spawned processes. For a pipelined run the last
+            one stands for the listing of the tests, and fails if listing
+            them does.
+        """
+        if self._pipelined:
+            queue = scheduler.PipelineQueue(
+                self.concurrency,
+                self.repository,
+                self._group_callback,
+                self.randomize,
+                self.time_estimator,
+                self.estimated_times,
+                self.speculate,
+            )
+        else:
+            queue = scheduler.DispatchQueue(
+                self.test_ids,
+                self.concurrency,
+                self.repository,
+                self._group_callback,
+                self.randomize,
+                self.time_estimator,
+                self.estimated_times,
+                self.speculate,
+            )
+        workers = min(self.concurrency, queue.max_workers)
+        if not workers:
+            return []
+        dispatch = dispatcher.Dispatcher(queue, workers)
+        self.addCleanup(dispatch.close)
+        dispatch.start()
+        idoption = self.dispatchoption.replace("$DISPATCH", '"%s"' % dispatch.address)
+        variables = {"IDOPTION": idoption}
+
+        def subst(match):
+            return variables.get(match.groups(1)[0], "")
+
+        cmd = re.sub(self.variable_regex, subst, self.template)
+        env = dict(os.environ)
+        env[dispatcher.AUTHKEY_ENV] = dispatch.authkey.hex()
+        result = []
+        # A pipelined worker waits for the tests to be listed before it runs
+        # any, which says nothing about its startup time.
+        self.spawn_time = None if self._pipelined else _now()
+        for _ in range(workers):
+            run_proc = self._start_process(
+                cmd, env=env, cancellable=self.speculate or self.failfast
+            )
+            run_proc.stdin.close()
+            result.append(run_proc)
+        if self._pipelined:
+            # The streams are routed by their index, so the listing goes
+            # after the workers.
+            result.append(_ListingProcess(functools.partial(self._queue_tests, queue)))
+        if self.speculate:
+            self._queue = queue
         return result
+
+    def _queue_tests(self, queue):
+        """List the tests of a pipelined run, adding them to queue.
+
+        The packages in test_path are listed separately where possible, so
+        that the workers get the tests of the first packages while the rest
+        are still being listed.
+        """
+        try:
+            groups = None
+            if (
+                not self.static_discovery
+                and not self.cache_discovery
+                and self._discovery_paths_known()
+                and os.path.isdir(self.test_path)
+            ):
+                groups = discovery.split_packages(self.top_dir, self.test_path)
+            if groups is None:
+                queue.add(self._select_tests(self.list_tests()))
+            elif self.parallel_discovery:
+                with futures.ThreadPoolExecutor(self.concurrency) as executor:
+                    listing = [executor.submit(self._list_tests, x) for x in groups]
+                    for listed in futures.as_completed(listing):
+                        queue.add(self._select_tests(listed.result()))
+            else:
+                for group in groups:
+                    queue.add(self._select_tests(self._list_tests(group)))
+        finally:
+            queue.close()
+
+    def decorate_result(self, result):
+        """Decorate the result the output of run_tests() is loaded into.
+
+        When speculating only the first result of each test is kept, and the
+        workers still running once every test has a result are stopped as
+        they are only running copies. With failfast every worker is stopped
+        once a test fails, the results of the tests which finished before
+        that are kept. Otherwise result is returned as is.
+
+        :param result: The StreamResult the run is loaded into
+        :return: The StreamResult to send the output of the workers to
+        """
+        if self._procs is None:
+            return result
+        queue, procs = self._queue, self._procs
+
+        def stop_workers():
+            # The streams are loaded in the order the workers were started,
+            # so a worker's index is its route.
+            for index, proc in enumerate(procs):
+                if not proc.cancelled and proc.poll() is None:
+                    proc.cancel()
+                    first_results.drop_route(str(index))
+
+        def observe(test_id, test_status, route):
+            if test_id is None or test_status is None:
+                return
+            if test_status == "fail" and self.failfast:
+                stop_workers()
+            elif queue is None:
+                return
+            elif test_status == "inprogress":
+                queue.test_started(test_id)
+            elif test_status not in results.INTERIM_STATES:
+                if queue.test_finished(test_id):
+                    stop_workers()
+
+        first_results = results.FirstResultWins(result, observe)
+        return first_results
+
+
+class _ForkServer:
+    """A fork server process and the return codes of the workers it forks."""
+
+    def __init__(self, proc, workers):
+        self.proc = proc
+        self.workers = workers
+        self._returncodes = None
+        self._lock = threading.Lock()
+
+    def get_returncode(self, index):
+        with self._lock:
+            if self._returncodes is None:
+                out = self.proc.stdout.read().split()
+                returncode = self.proc.wait()
+                if returncode or len(out) != self.workers:
+                    # The server itself failed, so did every worker.
+                    self._returncodes = [returncode or 1] * self.workers
+                else:
+                    self._returncodes = [int(x) for x in out]
+        return self._returncodes[index]
+
+
+class _ForkedWorker:
+    """A worker forked by a fork server."""
+
+    def __init__(self, server, index, stdout):
+        self.server = server
+        self.index = index
+        self.stdout = stdout
+
+    def wait(self):
+        return self.server.get_returncode(self.index)
+
+
+class _ListingProcess:
+    """The listing of the tests of a pipelined run, run as a process.
+
+    The listing is run in a thread. Its stdout is a subunit stream which
+    ends once the tests are listed, if listing them fails that is reported
+    as a failed test.
+
+    :param list_func: A callable which lists the tests, any error in
+        discovery it reports by exiting.
+    """
+
+    def __init__(self, list_func):
+        read_fd, write_fd = os.pipe()
+        self.stdout = os.fdopen(read_fd, "rb")
+        self.returncode = None
+        self._thread = threading.Thread(
+            target=self._list, args=(list_func, write_fd), daemon=True
+        )
+        self._thread.start()
+
+    def _list(self, list_func, write_fd):
+        with os.fdopen(write_fd, "wb") as stream:
+            returncode = 0
+            try:
+                list_func()
+            except SystemExit as e:
+                returncode = e.code
+                message = "Test discovery failed with exit code %s" % e.code
+            except Exception:
+                returncode = 1
+                message = traceback.format_exc()
+            if returncode:
+                v2.StreamResultToBytes(stream).status(
+                    test_id="test-discovery",
+                    test_status="fail",
+                    file_name="traceback",
+                    mime_type="text/plain;charset=utf8",
+                    file_bytes=message.encode("utf8"),
+                )
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        # Listing can't be stopped part way, the tests listed after the
+        # workers were stopped are never run.
+        pass
+
+    def wait(self):
+        self._thread.join()
+        return self.returncode
+
+
+class _IsolatedWorker:
+    """A worker which runs each of its tests in a new test runner.
+
+    The worker takes one test at a time from a queue shared with the other
+    workers and waits for its test runner to exit before taking the next,
+    in a thread. The test runners write to the same pipe, so stdout is a
+    subunit stream of every test the worker ran.
+
+    :param start_test: A callable which takes a test id and the file
+        descriptor to write the output to, and returns the
+        subprocess.Popen object of the test runner it starts for the test.
+    :param test_ids: A collections.deque of the test ids still to run.
+    """
+
+    def __init__(self, start_test, test_ids):
+        read_fd, write_fd = os.pipe()
+        self.stdout = os.fdopen(read_fd, "rb")
+        self.returncode = None
+        self._proc = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, args=(start_test, test_ids, write_fd), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, start_test, test_ids, write_fd):
+        returncode = 1
+        try:
+            failed = 0
+            while True:
+                with self._lock:
+                    if self._stopped:
+                        break
+                    try:
+                        test_id = test_ids.popleft()
+                    except IndexError:
+                        break
+                    self._proc = start_test(test_id, write_fd)
+                # The next test runner must not start before this one has
+                # exited, even once a test runner has failed.
+                proc_returncode = self._proc.wait()
+                failed = failed or proc_returncode
+            returncode = failed
+        finally:
+            os.close(write_fd)
+            self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        with self._lock:
+            self._stopped = True
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.terminate()
+
+    def wait(self):
+        self._thread.join()
+        return self.returncode
+
+
+class _PoolTest:
+    """Run a test as a batch of its own on a pool worker.
+
+    This has the parts of the subprocess.Popen interface used by
+    :class:`_IsolatedWorker`, waiting copies the output of the batch to the
+    worker's pipe.
+
+    :param conn: The connection to the pool worker, see
+        :meth:`stestr.pool.WorkerPool.connections`.
+    :param str test_id: The test to run
+    :param int stdout: The file descriptor to write the output to
+    """
+
+    def __init__(self, conn, test_id, stdout):
+        self._batch = agent.BatchProcess(conn, [test_id], keep_open=True)
+        self._stdout = stdout
+
+    def poll(self):
+        return self._batch.returncode
+
+    def terminate(self):
+        self._batch.close()
+
+    def wait(self):
+        with open(self._stdout, "wb", closefd=False) as stdout:
+            shutil.copyfileobj(self._batch.stdout, stdout)
+        return self._batch.wait()
+
+
+class _CancellableProcess:
+    """A worker process which can be stopped without failing the run."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.stdout = proc.stdout
+        self.cancelled = False
+
+    def poll(self):
+        return self.proc.poll()
+
+    def cancel(self):
+        self.cancelled = True
+        self.proc.terminate()
+
+    def wait(self):
+        returncode = self.proc.wait()
+        return 0 if self.cancelled else returncode
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
@@ -12,15 +12,19 @@
 
 """Tests for the file repository implementation."""
 
+import datetime
+from dbm import dumb as my_dbm
 import os.path
 import shutil
 import tempfile
 
 import fixtures
+from subunit import iso8601
 import testtools
 from testtools import matchers
 
 from stestr.repository import file
+from stestr.repository import timing
 from stestr.tests import base
 
 
@@ -210,3 +214,94 @@ class TestFileRepository(base.TestCase):
         result.startTestRun()
         result.stopTestRun()
         self.assertRaises(KeyError, repo.remove_run_id, "3")
+
+    def test_startup_time(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        self.assertIsNone(repo.get_startup_time())
+        repo.set_startup_time(0.25)
+        self.assertEqual(0.25, file.Repository(repo.base).get_startup_time())
+
+    def test_discovery_cache(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        self.assertIsNone(repo.get_discovery_cache())
+        repo.set_discovery_cache({"key": ["a"], "modules": {"b": ["c"]}})
+        self.assertEqual(
+            {"key": ["a"], "modules": {"b": ["c"]}},
+            file.Repository(repo.base).get_discovery_cache(),
+        )
+
+    def test_get_test_times_estimator(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        with repo._get_times_store() as store:
+            store.add({"a": 1.0})
+            store.add({"a": 3.0})
+        self.assertEqual({"a": 3.0}, repo.get_test_times(["a"])["known"])
+        self.assertEqual({"a": 2.0}, repo.get_test_times(["a"], "mean")["known"])
+        self.assertRaises(ValueError, repo.get_test_times, ["a"], "max")
+
+    def test_times_dbm_migration(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        db = my_dbm.open(os.path.join(repo.base, "times.dbm"), "c")
+        db["a"] = "1.5"
+        db.close()
+        self.assertEqual(
+            dict(known={"a": 1.5}, unknown={"b"}),
+            repo.get_test_times(["a", "b"]),
+        )
+        self.assertFalse(os.path.exists(os.path.join(repo.base, "times.dbm.dat")))
+        self.assertTrue(os.path.exists(os.path.join(repo.base, "times.db")))
+
+    def test_inserter_records_fixture_times(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        result = repo.get_inserter()
+        start = datetime.datetime(2020, 1, 1, tzinfo=iso8601.UTC)
+        result.startTestRun()
+        for test_id, offset in (
+            ("mod.TestA.test_1", 0),
+            ("mod.TestB.test_1", 3),
+        ):
+            timestamp = start + datetime.timedelta(seconds=offset)
+            result.status(
+                test_id=test_id,
+                test_status="inprogress",
+                test_tags={"worker-0"},
+                timestamp=timestamp,
+            )
+            result.status(
+                test_id=test_id,
+                test_status="success",
+                test_tags={"worker-0"},
+                timestamp=timestamp + datetime.timedelta(seconds=1),
+            )
+        result.stopTestRun()
+        self.assertEqual({"mod.TestB": 2.0}, repo.get_fixture_times())
+        self.assertEqual({}, repo.get_fixture_times(["mod.TestA"]))
+
+    def test_inserter_records_memory(self):
+        repo = self.useFixture(FileRepositoryFixture()).repo
+        start = datetime.datetime(2020, 1, 1, tzinfo=iso8601.UTC)
+        for memory in (b"2048", b"1024"):
+            result = repo.get_inserter()
+            result.startTestRun()
+            result.status(
+                test_id="mod.TestA.test_1", test_status="inprogress", timestamp=start
+            )
+            result.status(
+                test_id="mod.TestA.test_1",
+                file_name=timing.MEMORY_ATTACHMENT,
+                file_bytes=memory,
+                mime_type="text/plain;charset=utf8",
+                eof=True,
+            )
+            result.status(
+                test_id="mod.TestA.test_1",
+                test_status="success",
+                timestamp=start + datetime.timedelta(seconds=1),
+            )
+            result.stopTestRun()
+        # The peak of the recent runs is used
+        self.assertEqual({"mod.TestA.test_1": 2048}, repo.get_test_memory())
+        self.assertEqual(
+            {"mod.TestA.test_1[id]": 2048},
+            repo.get_test_memory(["mod.TestA.test_1[id]", "mod.TestB.test_1"]),
+        )
@@ -0,0 +1,167 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the per test timing statistics."""
+
+import datetime
+import os
+import shutil
+import statistics
+import tempfile
+from unittest import mock
+
+from testtools import content
+
+from stestr.repository import timing
+from stestr.tests import base
+
+
+class TestTimingStats(base.TestCase):
+    def _stats(self, durations):
+        stats = timing.TimingStats.from_duration(durations[0])
+        for duration in durations[1:]:
+            stats = stats.add(duration)
+        return stats
+
+    def test_single_duration(self):
+        stats = timing.TimingStats.from_duration(2.0)
+        for estimator in timing.ESTIMATORS:
+            self.assertEqual(2.0, stats.estimate(estimator))
+        self.assertEqual(0.0, stats.variance)
+
+    def test_mean_and_variance(self):
+        durations = [1.0, 2.0, 4.0, 8.0, 1.5]
+        stats = self._stats(durations)
+        self.assertEqual(5, stats.count)
+        self.assertAlmostEqual(statistics.mean(durations), stats.mean)
+        self.assertAlmostEqual(statistics.variance(durations), stats.variance)
+        self.assertEqual(1.5, stats.last)
+
+    def test_outlier(self):
+        stats = self._stats([1.0] * 9 + [30.0])
+        self.assertEqual(30.0, stats.estimate("last"))
+        self.assertEqual(1.0, stats.estimate("p50"))
+        self.assertEqual(1.0, stats.estimate("p90"))
+        self.assertLess(stats.estimate("ewma"), 10.0)
+
+    def test_history_is_bounded(self):
+        stats = self._stats([float(x) for x in range(100)])
+        self.assertEqual(timing.HISTORY_SIZE, len(stats.history))
+        self.assertEqual(100, stats.count)
+        self.assertEqual(97.0, stats.estimate("p90"))
+
+    def test_peak(self):
+        self.assertEqual(3.0, self._stats([1.0, 3.0, 2.0]).peak)
+
+    def test_unknown_estimator(self):
+        stats = timing.TimingStats.from_duration(1.0)
+        self.assertRaises(ValueError, stats.estimate, "max")
+
+
+class TestMeasureFixtureTimes(base.TestCase):
+    def _runs(self, worker, tests):
+        base_time = datetime.datetime(2020, 1, 1)
+        runs = []
+        for test_id, start, stop in tests:
+            runs.append(
+                (
+                    worker,
+                    base_time + datetime.timedelta(seconds=start),
+                    base_time + datetime.timedelta(seconds=stop),
+                    test_id,
+                )
+            )
+        return runs
+
+    def test_class_and_module_gaps(self):
+        runs = self._runs(
+            "worker-0",
+            [
+                ("mod_a.TestA.test_1", 0, 1),
+                ("mod_a.TestA.test_2", 1, 2),
+                ("mod_a.TestB.test_1", 4, 5),
+                ("mod_b.TestC.test_1", 8, 9),
+            ],
+        )
+        self.assertEqual(
+            {"mod_a.TestB": 2.0, "mod_b": 3.0}, timing.measure_fixture_times(runs)
+        )
+
+    def test_workers_are_separate(self):
+        runs = self._runs(
+            "worker-0",
+            [("mod_a.TestA.test_1", 0, 1), ("mod_a.TestB.test_1", 2, 3)],
+        )
+        runs += self._runs("worker-1", [("mod_a.TestC.test_1", 1.5, 2)])
+        # The tests are interleaved in time but the gap is only measured
+        # between tests on the same worker
+        self.assertEqual({"mod_a.TestB": 1.0}, timing.measure_fixture_times(runs))
+
+
+class TestFindMemory(base.TestCase):
+    def test_find_memory(self):
+        details = {
+            timing.MEMORY_ATTACHMENT: content.text_content("1024"),
+            "stdout": content.text_content("output"),
+        }
+        self.assertEqual(1024, timing.find_memory(details))
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(timing.find_memory({}))
+        details = {timing.MEMORY_ATTACHMENT: content.text_content("lots")}
+        self.assertIsNone(timing.find_memory(details))
+
+
+class TestTimingStore(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, "times.db")
+
+    def test_add_and_get(self):
+        with timing.TimingStore(self.path) as store:
+            store.add({"a": 1.0, "b": 2.0})
+            store.add({"a": 3.0})
+        with timing.TimingStore(self.path) as store:
+            self.assertEqual(
+                {"a": 3.0, "b": 2.0}, store.get_estimates(["a", "b", "c"], "last")
+            )
+            self.assertEqual({"a": 2.0}, store.get_estimates(["a"], "mean"))
+            self.assertEqual({"a": 3.0}, store.get_estimates(["a"], "p90"))
+            stats = store.get_stats(["a"])["a"]
+        self.assertEqual(2, stats.count)
+        self.assertEqual((1.0, 3.0), stats.history)
+
+    def test_unknown_estimator(self):
+        with timing.TimingStore(self.path) as store:
+            self.assertRaises(ValueError, store.get_estimates, ["a"], "max")
+
+    @mock.patch.object(timing, "QUERY_CHUNK_SIZE", 2)
+    def test_get_in_chunks(self):
+        with timing.TimingStore(self.path) as store:
+            store.add({"a": 1.0, "b": 2.0, "c": 3.0, "d": 4.0})
+            store.add({"a": 3.0, "c": 1.0, "e": 5.0})
+            self.assertEqual(
+                {"a": 3.0, "c": 1.0, "d": 4.0, "e": 5.0},
+                store.get_estimates(["a", "c", "x", "d", "e", "a"], "last"),
+            )
+            stats = store.get_stats(["c", "e", "y"])
+        self.assertEqual(["c", "e"], sorted(stats))
+        self.assertEqual((3.0, 1.0), stats["c"].history)
+
+    def test_fixtures_table(self):
+        with timing.TimingStore(self.path) as store:
+            store.add({"a": 1.0}, "fixtures")
+            self.assertEqual({}, store.get_estimates(None, "last"))
+            self.assertEqual({"a": 1.0}, store.get_estimates(None, "ewma", "fixtures"))
+            self.assertRaises(ValueError, store.get_stats, ["a"], "bad")
@@ -0,0 +1,91 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from multiprocessing import connection
+import threading
+
+import fixtures
+
+from stestr import agent
+from stestr import dispatcher
+from stestr.tests import base
+
+
+class TestAgent(base.TestCase):
+    def _start_server(self, run_batch, authkey=b"key"):
+        server = agent.AgentServer("127.0.0.1:0", authkey, run_batch)
+        self.addCleanup(server.close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_run_batch(self):
+        batches = []
+
+        def run_batch(test_ids, write):
+            batches.append(test_ids)
+            write(b"first ")
+            write(b"second")
+            return 3
+
+        server = self._start_server(run_batch)
+        proc = agent.AgentProcess(server.address, b"key", ["a", "b"])
+        self.assertEqual(b"first second", proc.stdout.read())
+        self.assertEqual(3, proc.wait())
+        self.assertEqual([["a", "b"]], batches)
+
+    def test_concurrent_batches(self):
+        started = threading.Barrier(2, timeout=10)
+
+        def run_batch(test_ids, write):
+            # Both batches have to be running at the same time to get past
+            # the barrier.
+            started.wait()
+            write(test_ids[0].encode("utf8"))
+            return 0
+
+        server = self._start_server(run_batch)
+        procs = [agent.AgentProcess(server.address, b"key", [x]) for x in "ab"]
+        self.assertEqual([b"a", b"b"], [x.stdout.read() for x in procs])
+        self.assertEqual([0, 0], [x.wait() for x in procs])
+
+    def test_wrong_authkey(self):
+        server = self._start_server(lambda test_ids, write: 0)
+        self.assertRaises(
+            agent.AgentError, agent.AgentProcess, server.address, b"other", ["a"]
+        )
+
+    def test_no_agent(self):
+        listener = connection.Listener(("127.0.0.1", 0))
+        address = dispatcher.format_address(listener.address)
+        listener.close()
+        self.assertRaises(agent.AgentError, agent.AgentProcess, address, b"k", ["a"])
+
+    def test_lost_agent(self):
+        listener = connection.Listener(("127.0.0.1", 0), authkey=b"key")
+        self.addCleanup(listener.close)
+
+        def serve():
+            with listener.accept() as conn:
+                conn.recv_bytes()
+                conn.send_bytes(b"partial")
+
+        threading.Thread(target=serve, daemon=True).start()
+        address = dispatcher.format_address(listener.address)
+        proc = agent.AgentProcess(address, b"key", ["a"])
+        self.assertEqual(b"partial", proc.stdout.read())
+        self.assertEqual(agent.LOST_AGENT_RETURNCODE, proc.wait())
+
+    def test_get_authkey(self):
+        self.useFixture(fixtures.EnvironmentVariable(agent.AUTHKEY_ENV, "secret"))
+        self.assertEqual(b"secret", agent.get_authkey())
+        self.useFixture(fixtures.EnvironmentVariable(agent.AUTHKEY_ENV))
+        self.assertIsNone(agent.get_authkey())
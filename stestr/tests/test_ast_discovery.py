@@ -0,0 +1,209 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import fixtures
+
+from stestr import ast_discovery
+from stestr import testlist
+from stestr.tests import base
+
+
+class TestListTests(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.top_dir = self.useFixture(fixtures.TempDir()).path
+        self.start_dir = os.path.join(self.top_dir, "tests")
+        self.listed = []
+        self._write("tests/__init__.py", "")
+        self._write(
+            "tests/base.py",
+            """
+            import unittest
+
+            class TestCase(unittest.TestCase):
+                pass
+
+            class Mixin:
+                def test_mixin(self):
+                    pass
+            """,
+        )
+
+    def _write(self, path, content):
+        path = os.path.join(self.top_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fd:
+            fd.write(textwrap.dedent(content))
+
+    def _discover(self, modules=None):
+        cmd = [
+            sys.executable,
+            "-m",
+            "stestr.subunit_runner.run",
+            "discover",
+            "-t",
+            self.top_dir,
+            self.start_dir,
+            "--list",
+        ]
+        if modules is not None:
+            cmd.extend(["--modules", ",".join(modules)])
+        out = subprocess.run(
+            cmd, cwd=self.top_dir, stdout=subprocess.PIPE, check=True
+        ).stdout
+        return testlist.parse_enumeration(out)
+
+    def _list_modules(self, modules):
+        self.listed.append(modules)
+        return self._discover(modules)
+
+    def _list(self):
+        return ast_discovery.list_tests(
+            self.top_dir, self.start_dir, self._list_modules
+        )
+
+    def test_matches_discovery(self):
+        self._write(
+            "tests/test_a.py",
+            """
+            import unittest
+
+            import testtools
+
+            from tests import base
+            from . import base as relative_base
+
+            class TestA(base.TestCase):
+                def test_2(self):
+                    pass
+
+                def test_1(self):
+                    pass
+
+                def helper(self):
+                    pass
+
+            class TestB(TestA, relative_base.Mixin):
+                async def test_3(self):
+                    pass
+
+            @unittest.skip("skipped")
+            class TestC(testtools.TestCase):
+                def test_1(self):
+                    pass
+
+            class TestRunTest(unittest.TestCase):
+                def runTest(self):
+                    pass
+
+            class NotATest(base.Mixin):
+                pass
+            """,
+        )
+        self._write(
+            "tests/test_b.py",
+            """
+            from tests.test_a import TestA
+            from tests.test_a import TestC as Renamed
+
+            del TestA
+            """,
+        )
+        self._write("tests/sub/__init__.py", "from tests.base import TestCase")
+        self._write(
+            "tests/sub/test_c.py",
+            """
+            from tests.test_a import *
+
+            class TestD(TestB):
+                test_1 = None
+            """,
+        )
+        # Not a package, so discovery doesn't look in it.
+        self._write("tests/data/test_e.py", "this isn't python")
+        expected = self._discover()
+        self.assertIn("tests.test_a.TestB.test_mixin", expected)
+        self.assertIn("tests.test_a.TestRunTest.runTest", expected)
+        self.assertEqual(expected, self._list())
+        # Assigning to a test name in the class body can only be followed by
+        # importing the module.
+        self.assertEqual([["tests.sub.test_c"]], self.listed)
+
+    def test_imports_dynamic_modules(self):
+        self._write(
+            "tests/test_a.py",
+            """
+            from tests import base
+
+            class TestA(base.TestCase):
+                def test_1(self):
+                    pass
+            """,
+        )
+        self._write(
+            "tests/test_b.py",
+            """
+            from tests import base
+
+            def load_tests(loader, tests, pattern):
+                return tests
+            """,
+        )
+        self._write(
+            "tests/test_c.py",
+            """
+            from tests import base
+
+            class TestC(base.TestCase):
+                for i in range(2):
+                    locals()["test_%d" % i] = lambda self: None
+            """,
+        )
+        self._write(
+            "tests/test_d.py",
+            """
+            import ddt
+
+            from tests import base
+
+            @ddt.ddt
+            class TestD(base.TestCase):
+                def test_1(self):
+                    pass
+            """,
+        )
+        self._write(
+            "tests/test_e.py",
+            """
+            class Helper:
+                def test_1(self):
+                    pass
+            """,
+        )
+        self._write(
+            "tests/sub/__init__.py",
+            """
+            def load_tests(loader, tests, pattern):
+                return tests
+            """,
+        )
+        self._write("tests/sub/test_f.py", "")
+        self.assertEqual(self._discover(), self._list())
+        self.assertEqual(
+            [["tests.sub", "tests.test_b", "tests.test_c", "tests.test_d"]],
+            self.listed,
+        )
@@ -127,30 +127,74 @@ class FakeFailedMultiWorkerTestRunWithTags(FakeTestRun):
         self.id = 2
 
 
+class FakeLongTestRun(FakeTestRun):
+    def __init__(self, failure=True):
+        # Generate a subunit stream of 12 tests before each failure
+        stream_buf = io.BytesIO()
+        stream = subunit.StreamResultToBytes(stream_buf)
+        for worker, failure in enumerate(("test_y", "test_z")):
+            tags = ["worker-%d" % worker]
+            for i in range(12):
+                test_id = "test_%02d" % i
+                stream.status(test_id=test_id, test_status="inprogress", test_tags=tags)
+                stream.status(test_id=test_id, test_status="success", test_tags=tags)
+            stream.status(test_id=failure, test_status="inprogress", test_tags=tags)
+            stream.status(test_id=failure, test_status="fail", test_tags=tags)
+        stream_buf.seek(0)
+        self._content = stream_buf.getvalue()
+        self.id = 2
+
+
 class TestBisectTests(base.TestCase):
     def setUp(self):
         super().setUp()
         self.repo_mock = mock.create_autospec("stestr.repository.file.Repository")
         self.conf_mock = mock.create_autospec("stestr.config_file.TestrConf")
-        self.run_func_mock = mock.MagicMock()
         self.latest_run_mock = mock.MagicMock()
 
     def test_bisect_no_failures_provided(self):
         bisector = bisect_tests.IsolationAnalyzer(
-            self.latest_run_mock, self.conf_mock, self.run_func_mock, self.repo_mock
+            self.latest_run_mock, self.conf_mock, repo=self.repo_mock
         )
         self.assertRaises(ValueError, bisector.bisect_tests, [])
 
+    def test_run_probe_with_run_func(self):
+        stream = io.BytesIO()
+        result = subunit.StreamResultToBytes(stream)
+        result.status(test_id="test_b", test_status="fail")
+        stream.seek(0)
+        repo = mock.Mock()
+        repo.get_failing.return_value.get_test.return_value = (
+            subunit.ByteStreamToStreamResult(stream)
+        )
+        self.conf_mock.get_run_command = mock.MagicMock()
+        cmd = self.conf_mock.get_run_command.return_value
+        run_func = mock.Mock()
+        bisector = bisect_tests.IsolationAnalyzer(
+            self.latest_run_mock,
+            self.conf_mock,
+            run_func,
+            repo,
+            repo_url="url",
+            concurrency=4,
+        )
+        self.assertEqual({"test_b"}, bisector._run_probe(["test_a", "test_b"]))
+        run_func.assert_called_once_with(cmd, False, pretty_out=False, repo_url="url")
+        cmd.run_tests.assert_not_called()
+        # The probes read their failures back from the repository, so they
+        # are run one at a time.
+        self.assertEqual(1, bisector._workers())
+
     def test_prior_tests_invlaid_test_id(self):
         bisector = bisect_tests.IsolationAnalyzer(
-            self.latest_run_mock, self.conf_mock, self.run_func_mock, self.repo_mock
+            self.latest_run_mock, self.conf_mock, repo=self.repo_mock
         )
         run = FakeFailedTestRunNoTags()
         self.assertRaises(KeyError, bisector._prior_tests, run, "bad_test_id")
 
     def test_get_prior_tests_no_tags(self):
         bisector = bisect_tests.IsolationAnalyzer(
-            self.latest_run_mock, self.conf_mock, self.run_func_mock, self.repo_mock
+            self.latest_run_mock, self.conf_mock, repo=self.repo_mock
         )
         run = FakeFailedTestRunNoTags()
         prior_tests = bisector._prior_tests(run, "test_c")
@@ -158,24 +202,38 @@ class TestBisectTests(base.TestCase):
 
     def test_get_prior_tests_with_tags(self):
         bisector = bisect_tests.IsolationAnalyzer(
-            self.latest_run_mock, self.conf_mock, self.run_func_mock, self.repo_mock
+            self.latest_run_mock, self.conf_mock, repo=self.repo_mock
         )
         run = FakeFailedTestRunWithTags()
         prior_tests = bisector._prior_tests(run, "test_c")
         self.assertEqual(["test_a"], prior_tests)
 
-    @mock.patch("stestr.output.output_table")
-    def test_bisect_tests_isolated_failure(self, table_mock):
-        run = FakeFailedTestRunWithTags()
-        self.conf_mock.get_run_command = mock.MagicMock()
-
-        def get_failures(*args, **kwargs):
-            return FakeNoFailing()
+    def _bisector(self, run, failing_with, concurrency=1):
+        """Make an IsolationAnalyzer whose probes fail failing_with.
 
-        self.repo_mock.get_failing = get_failures
+        :param dict failing_with: A dict mapping failing test ids to a list
+            of the tests which make them fail together.
+        """
         bisector = bisect_tests.IsolationAnalyzer(
-            run, self.conf_mock, self.run_func_mock, self.repo_mock
+            run, self.conf_mock, repo=self.repo_mock, concurrency=concurrency
         )
+        probes = []
+
+        def run_probe(test_ids):
+            probes.append(test_ids)
+            return {
+                x
+                for x in test_ids
+                if x in failing_with and set(failing_with[x]) <= set(test_ids)
+            }
+
+        bisector._run_probe = run_probe
+        return bisector, probes
+
+    @mock.patch("stestr.output.output_table")
+    def test_bisect_tests_isolated_failure(self, table_mock):
+        run = FakeFailedTestRunWithTags()
+        bisector, _ = self._bisector(run, {})
         return_code = bisector.bisect_tests(["test_c"])
         expected_issue = [
             ("failing test", "caused by test"),
@@ -187,15 +245,7 @@ class TestBisectTests(base.TestCase):
     @mock.patch("stestr.output.output_table")
     def test_bisect_tests_not_isolated_failure(self, table_mock):
         run = FakeFailedTestRunWithTags()
-        self.conf_mock.get_run_command = mock.MagicMock()
-
-        def get_failures(*args, **kwargs):
-            return FakeFailingWithTags()
-
-        self.repo_mock.get_failing = get_failures
-        bisector = bisect_tests.IsolationAnalyzer(
-            run, self.conf_mock, self.run_func_mock, self.repo_mock
-        )
+        bisector, _ = self._bisector(run, {"test_c": ["test_a"]})
         return_code = bisector.bisect_tests(["test_c"])
         expected_issue = [("failing test", "caused by test"), ("test_c", "test_a")]
         table_mock.assert_called_once_with(expected_issue)
@@ -204,15 +254,7 @@ class TestBisectTests(base.TestCase):
     @mock.patch("stestr.output.output_table")
     def test_bisect_tests_not_isolated_multiworker_failures(self, table_mock):
         run = FakeFailedMultiWorkerTestRunWithTags()
-        self.conf_mock.get_run_command = mock.MagicMock()
-
-        def get_failures(*args, **kwargs):
-            return FakeFailingWithTags()
-
-        self.repo_mock.get_failing = get_failures
-        bisector = bisect_tests.IsolationAnalyzer(
-            run, self.conf_mock, self.run_func_mock, self.repo_mock
-        )
+        bisector, _ = self._bisector(run, {"test_c": ["test_a"]})
         return_code = bisector.bisect_tests(["test_b", "test_c"])
         expected_issue = [
             ("failing test", "caused by test"),
@@ -221,3 +263,80 @@ class TestBisectTests(base.TestCase):
         ]
         table_mock.assert_called_once_with(expected_issue)
         self.assertEqual(3, return_code)
+
+    @mock.patch("stestr.output.output_table")
+    def test_bisect_tests_k_ary(self, table_mock):
+        run = FakeLongTestRun()
+        bisector, probes = self._bisector(
+            run, {"test_z": ["test_07"], "test_y": ["test_02"]}, concurrency=8
+        )
+        return_code = bisector.bisect_tests(["test_z", "test_y"])
+        expected_issue = [
+            ("failing test", "caused by test"),
+            ("test_y", "test_02"),
+            ("test_z", "test_07"),
+        ]
+        table_mock.assert_called_once_with(expected_issue)
+        self.assertEqual(3, return_code)
+        # Each failure gets half of the 8 workers, so its 12 prior tests are
+        # split into 4 slices of 3 in the first round and the 3 tests of the
+        # slice it failed with are run one each in the second.
+        self.assertEqual(14, len(probes))
+        self.assertIn(["test_00", "test_01", "test_02", "test_y"], probes)
+        self.assertIn(["test_06", "test_07", "test_08", "test_z"], probes)
+        self.assertIn(["test_07", "test_z"], probes)
+
+    def test_run_probe(self):
+        stream = io.BytesIO()
+        result = subunit.StreamResultToBytes(stream)
+        result.status(test_id="test_a", test_status="success")
+        result.status(test_id="test_b", test_status="fail")
+        stream.seek(0)
+        proc = mock.Mock(stdout=stream)
+        self.conf_mock.get_run_command = mock.MagicMock()
+        cmd = self.conf_mock.get_run_command.return_value
+        cmd.run_tests.return_value = [proc]
+        bisector = bisect_tests.IsolationAnalyzer(
+            self.latest_run_mock, self.conf_mock, repo=self.repo_mock, concurrency=4
+        )
+        self.assertEqual({"test_b"}, bisector._run_probe(["test_a", "test_b"]))
+        # Each probe runs in a single test runner
+        self.assertTrue(self.conf_mock.get_run_command.call_args[1]["serial"])
+        proc.wait.assert_called_once_with()
+        cmd.cleanUp.assert_called_once_with()
+
+    @mock.patch("stestr.output.output_table")
+    def test_bisect_tests_interaction(self, table_mock):
+        run = FakeLongTestRun()
+        bisector, _ = self._bisector(
+            run, {"test_z": ["test_02", "test_09"]}, concurrency=4
+        )
+        return_code = bisector.bisect_tests(["test_z"])
+        expected_issue = [
+            ("failing test", "caused by test"),
+            ("test_z", "test_02"),
+            ("", "test_09"),
+        ]
+        table_mock.assert_called_once_with(expected_issue)
+        self.assertEqual(3, return_code)
+
+    def test_minimize_tests(self):
+        run = FakeLongTestRun()
+        bisector, probes = self._bisector(
+            run, {"test_z": ["test_01", "test_05", "test_06"]}, concurrency=4
+        )
+        candidate_causes = bisector._prior_tests(run, "test_z")
+        self.assertEqual(
+            ["test_01", "test_05", "test_06"],
+            bisector.minimize_tests("test_z", candidate_causes),
+        )
+        # The failure is checked with all of the prior tests first.
+        self.assertEqual(candidate_causes + ["test_z"], probes[0])
+
+    def test_minimize_tests_not_reproduced(self):
+        run = FakeLongTestRun()
+        bisector, probes = self._bisector(run, {}, concurrency=4)
+        candidate_causes = bisector._prior_tests(run, "test_z")
+        self.assertIsNone(bisector.minimize_tests("test_z", candidate_causes))
+        self.assertEqual([candidate_causes + ["test_z"]], probes)
+        self.assertIsNone(bisector.minimize_tests("test_z", []))
@@ -80,6 +80,27 @@ class TestTestrConf(base.TestCase):
             serial=False,
             include_list=None,
             worker_path=None,
+            dynamic=False,
+            dispatchoption="--dispatch $DISPATCH",
+            time_estimator="last",
+            longest_first=False,
+            memory_limit=None,
+            agents=None,
+            shard=None,
+            speculate=False,
+            failfast=False,
+            pool=None,
+            pooloption="--pool $POOL",
+            fork_server=False,
+            forkoption="--fork-workers $WORKERS",
+            cache_discovery=False,
+            top_dir="fake_top_dir",
+            test_path="fake_test_path",
+            moduleoption="--modules $MODULES",
+            parallel_discovery=False,
+            static_discovery=False,
+            pipeline=False,
+            isolated=False,
         )
 
     @mock.patch.object(config_file, "sys")
@@ -0,0 +1,227 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+
+from stestr import discovery
+from stestr.repository import memory
+from stestr.tests import base
+
+
+class TestListTests(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.top_dir = self.useFixture(fixtures.TempDir()).path
+        self.repo = memory.RepositoryFactory().initialise("memory:")
+        self.mtime = 0
+        self.tests = {}
+        self.listed = []
+        self._write("tests/__init__.py", "")
+        self._write("tests/base.py", "")
+        self._write("tests/test_a.py", "", ["tests.test_a.A.test_1"])
+        self._write("tests/sub/__init__.py", "")
+        self._write("tests/sub/test_b.py", "", ["tests.sub.test_b.B.test_1"])
+        # Not a package, so discovery doesn't look in it.
+        self._write("tests/data/test_c.py", "", ["tests.data.test_c.C.test_1"])
+
+    def _write(self, path, content, test_ids=None):
+        path = os.path.join(self.top_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fd:
+            fd.write(content)
+        # Give every write a new mtime, however coarse the filesystem's.
+        self.mtime += 10**9
+        os.utime(path, ns=(self.mtime, self.mtime))
+        if test_ids is not None:
+            self.tests[path] = test_ids
+
+    def _list_modules(self, modules):
+        self.listed.append(modules)
+        test_ids = []
+        for path, ids in sorted(self.tests.items()):
+            if not os.path.exists(path) or "data" in path:
+                continue
+            name = os.path.relpath(path, self.top_dir)[:-3].replace(os.sep, ".")
+            if modules is None or name in modules:
+                test_ids.extend(ids)
+        return test_ids
+
+    def _list(self, key=("cmd",)):
+        return discovery.list_tests(
+            self.repo,
+            list(key),
+            self.top_dir,
+            os.path.join(self.top_dir, "tests"),
+            self._list_modules,
+        )
+
+    def test_unchanged(self):
+        expected = ["tests.sub.test_b.B.test_1", "tests.test_a.A.test_1"]
+        self.assertEqual(expected, self._list())
+        self.assertEqual(expected, self._list())
+        self.assertEqual([None], self.listed)
+
+    def test_touched(self):
+        self._list()
+        self._write("tests/test_a.py", "")
+        self._list()
+        self.assertEqual([None], self.listed)
+
+    def test_changed_module(self):
+        self._list()
+        self._write("tests/sub/test_b.py", "#", ["tests.sub.test_b.B.test_2"])
+        self.assertEqual(
+            ["tests.sub.test_b.B.test_2", "tests.test_a.A.test_1"], self._list()
+        )
+        self.assertEqual([None, ["tests.sub.test_b"]], self.listed)
+
+    def test_new_and_removed_modules(self):
+        self._list()
+        self._write("tests/sub/test_0.py", "#", ["tests.sub.test_0.Z.test_1"])
+        os.unlink(os.path.join(self.top_dir, "tests/test_a.py"))
+        self.assertEqual(
+            ["tests.sub.test_0.Z.test_1", "tests.sub.test_b.B.test_1"], self._list()
+        )
+        self.assertEqual([None, ["tests.sub.test_0"]], self.listed)
+
+    def test_changed_helper(self):
+        self._list()
+        self._write("tests/base.py", "#")
+        self._list()
+        self.assertEqual([None, None], self.listed)
+
+    def test_changed_key(self):
+        self._list()
+        self._list(key=("other",))
+        self.assertEqual([None, None], self.listed)
+
+    def test_not_a_package(self):
+        self._list()
+        self._write("tests/data/test_c.py", "#")
+        self._list()
+        self.assertEqual([None], self.listed)
+
+    def test_unattributed_ids(self):
+        self.tests["extra"] = ["tests.base.Mixin.test_1"]
+        self._write("tests/test_a.py", "", ["tests.base.Mixin.test_1"])
+        self._list()
+        self._write("tests/sub/test_b.py", "#")
+        self._list()
+        self.assertEqual([None, None], self.listed)
+
+    def test_package_load_tests(self):
+        self._write("tests/sub/__init__.py", "def load_tests(): pass")
+        self._list()
+        self._write("tests/sub/test_b.py", "#")
+        self._list()
+        self.assertEqual([None, None], self.listed)
+
+
+class TestSplitPackages(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.top_dir = self.useFixture(fixtures.TempDir()).path
+        self.start_dir = os.path.join(self.top_dir, "tests")
+        for path in [
+            "__init__.py",
+            "base.py",
+            "test_a.py",
+            "test_b.py",
+            "test_d.py",
+            "c/__init__.py",
+            "c/test_c.py",
+            "unit/__init__.py",
+            "data/test_f.py",
+        ]:
+            path = os.path.join(self.start_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+
+    def test_split_packages(self):
+        self.assertEqual(
+            [
+                ["tests.c"],
+                ["tests.test_a", "tests.test_b", "tests.test_d"],
+                ["tests.unit"],
+            ],
+            discovery.split_packages(self.top_dir, self.start_dir),
+        )
+
+    def test_load_tests(self):
+        with open(os.path.join(self.start_dir, "__init__.py"), "w") as fd:
+            fd.write("def load_tests(loader, tests, pattern):\n    return tests\n")
+        self.assertIsNone(discovery.split_packages(self.top_dir, self.start_dir))
+
+    def test_nothing_to_split(self):
+        start_dir = os.path.join(self.start_dir, "c")
+        self.assertIsNone(discovery.split_packages(self.top_dir, start_dir))
+
+
+class TestFindModules(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.top_dir = self.useFixture(fixtures.TempDir()).path
+        self.start_dir = os.path.join(self.top_dir, "tests")
+        for path in [
+            "__init__.py",
+            "base.py",
+            "test_a.py",
+            "test_b.py",
+            "sub/__init__.py",
+            "sub/test_c.py",
+            "data/test_d.py",
+        ]:
+            self._write(path, "")
+
+    def _write(self, path, content):
+        path = os.path.join(self.start_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fd:
+            fd.write(content)
+
+    def _find(self, test_ids):
+        return discovery.find_modules(self.top_dir, self.start_dir, test_ids)
+
+    def test_find_modules(self):
+        self.assertEqual(
+            ["tests.sub.test_c", "tests.test_b"],
+            self._find(
+                [
+                    "tests.test_b.B.test_1",
+                    "tests.sub.test_c.C.test_1",
+                    "tests.test_b.B.test_2(a.b)",
+                ]
+            ),
+        )
+
+    def test_no_tests(self):
+        self.assertEqual([], self._find([]))
+
+    def test_not_a_test_module(self):
+        self.assertIsNone(self._find(["tests.base.Base.test_1"]))
+        self.assertIsNone(self._find(["tests.data.test_d.D.test_1"]))
+        self.assertIsNone(self._find(["tests.Scenario.test_1"]))
+
+    def test_outside_start_dir(self):
+        start_dir = os.path.join(self.start_dir, "sub")
+        self.assertIsNone(
+            discovery.find_modules(self.top_dir, start_dir, ["tests.test_a.A.test_1"])
+        )
+
+    def test_load_tests(self):
+        self._write("sub/__init__.py", "def load_tests(loader, tests, pattern):")
+        self.assertEqual(["tests.test_a"], self._find(["tests.test_a.A.test_1"]))
+        self.assertIsNone(self._find(["tests.sub.test_c.C.test_1"]))
+        self._write("test_a.py", "def load_tests(loader, tests, pattern):")
+        self.assertIsNone(self._find(["tests.test_a.A.test_1"]))
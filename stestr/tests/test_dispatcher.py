@@ -0,0 +1,56 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from multiprocessing import connection
+
+from stestr import dispatcher
+from stestr import scheduler
+from stestr.tests import base
+
+
+class TestDispatcher(base.TestCase):
+    def test_address_round_trip_tcp(self):
+        address = dispatcher.format_address(("127.0.0.1", 4242))
+        self.assertEqual("127.0.0.1:4242", address)
+        self.assertEqual(("127.0.0.1", 4242), dispatcher.parse_address(address))
+
+    def test_address_round_trip_path(self):
+        self.assertEqual("/tmp/a:1", dispatcher.parse_address("/tmp/a:1"))
+        self.assertEqual(r"\\.\pipe\pyc-1", dispatcher.parse_address(r"\\.\pipe\pyc-1"))
+
+    def test_encode_decode_ids(self):
+        test_ids = ["a.b.c", "d.e[tag]"]
+        encoded = dispatcher.encode_ids(test_ids)
+        self.assertEqual(test_ids, dispatcher.decode_ids(encoded))
+        self.assertEqual([], dispatcher.decode_ids(dispatcher.encode_ids([])))
+
+    def test_iter_batches(self):
+        queue = scheduler.DispatchQueue(["a", "b", "c"], 1)
+        dispatch = dispatcher.Dispatcher(queue, 1, family="AF_INET")
+        self.addCleanup(dispatch.close)
+        dispatch.start()
+        batches = list(dispatcher.iter_batches(dispatch.address, dispatch.authkey))
+        self.assertEqual(["a", "b", "c"], sum(batches, []))
+
+    def test_bad_authkey(self):
+        queue = scheduler.DispatchQueue(["a"], 1)
+        dispatch = dispatcher.Dispatcher(queue, 1, family="AF_INET")
+        self.addCleanup(dispatch.close)
+        dispatch.start()
+        self.assertRaises(
+            connection.AuthenticationError,
+            list,
+            dispatcher.iter_batches(dispatch.address, b"not the key"),
+        )
+        # The real worker can still connect after a failed attempt
+        batches = list(dispatcher.iter_batches(dispatch.address, dispatch.authkey))
+        self.assertEqual([["a"]], batches)
@@ -10,9 +10,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
 import io
+from unittest import mock
+
+from subunit import iso8601
+from subunit import v2
 
 from stestr.commands import load
+from stestr.repository import memory
 from stestr.tests import base
 
 
@@ -24,3 +30,27 @@ class TestLoadCommand(base.TestCase):
             in_streams=[("subunit", stream)], pretty_out=True, stdout=output
         )
         self.assertEqual(1, res)
+
+    def test_spawn_time_updates_startup_time(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        spawn_time = datetime.datetime(2020, 1, 1, tzinfo=iso8601.UTC)
+        stream = io.BytesIO()
+        result = v2.StreamResultToBytes(stream)
+        result.status(
+            test_id="test_a",
+            test_status="inprogress",
+            timestamp=spawn_time + datetime.timedelta(seconds=2),
+        )
+        result.status(
+            test_id="test_a",
+            test_status="success",
+            timestamp=spawn_time + datetime.timedelta(seconds=3),
+        )
+        stream.seek(0)
+        with mock.patch("stestr.repository.util.get_repo_open", return_value=repo):
+            load.load(
+                in_streams=[("subunit", stream)],
+                stdout=io.StringIO(),
+                spawn_time=spawn_time,
+            )
+        self.assertEqual(2.0, repo.get_startup_time())
@@ -0,0 +1,52 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from stestr.commands import plan
+from stestr.tests import base
+
+
+class TestPlan(base.TestCase):
+    def test_predict_loads(self):
+        partitions = [
+            ["mod.TestA.test_1", "mod.TestA.test_2"],
+            ["mod.TestA.test_3", "mod.TestB.test_1", "new"],
+            [],
+        ]
+        test_times = {
+            "mod.TestA.test_1": 1.0,
+            "mod.TestA.test_2": 2.0,
+            "mod.TestA.test_3": 1.0,
+            "mod.TestB.test_1": 1.0,
+        }
+        fixture_times = {"mod.TestA": 0.5, "mod": 0.25}
+        self.assertEqual(
+            [4.75, 3.75, None],
+            plan.predict_loads(partitions, test_times, fixture_times, 1.0),
+        )
+        # Only the time running tests is scaled by the worker's weight.
+        self.assertEqual(
+            [2.875, 6.5, None],
+            plan.predict_loads(
+                partitions, test_times, fixture_times, 1.0, weights=[2, 0.5, 1]
+            ),
+        )
+
+    def test_summarize_loads(self):
+        self.assertEqual((3.0, 1.5), plan.summarize_loads([1.0, 3.0, None, 2.0]))
+        self.assertEqual((0.0, 1.0), plan.summarize_loads([None]))
+        self.assertEqual((0.0, 1.0), plan.summarize_loads([0.0, 0.0]))
+
+    def test_stops_improving(self):
+        self.assertEqual((3, 2.0), plan.stops_improving([6.0, 3.0, 2.0, 2.0, 2.5]))
+        # Makespans which print the same count as the same.
+        self.assertEqual((2, 3.0), plan.stops_improving([6.0, 3.0, 2.9999]))
+        self.assertEqual((1, 1.0), plan.stops_improving([1.0]))
@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+import sys
+
+import testtools
+
+from stestr import pool
+from stestr.tests import base
+
+# A worker which writes the ids it is sent, along with how many batches the
+# process it runs them in has seen.
+WORKER = """
+import sys
+from stestr import pool
+seen = []
+def run_batch(test_ids, stream):
+    seen.append(test_ids)
+    if test_ids == ["die"]:
+        raise RuntimeError("died")
+    stream.write(("%d " % len(seen) + " ".join(test_ids)).encode("utf8"))
+    stream.flush()
+pool.run_worker(sys.argv[1], bytes.fromhex(sys.argv[2]), run_batch)
+"""
+
+
+class TestWorkerPool(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = pool.WorkerPool()
+        self.addCleanup(self.pool.close)
+        self.started = []
+
+    def _start_worker(self, script=WORKER):
+        proc = subprocess.Popen(
+            [sys.executable, "-c", script, self.pool.address, self.pool.authkey.hex()]
+        )
+        self.started.append(proc)
+        return proc
+
+    def _run(self, test_id_groups):
+        procs = self.pool.run_batches(test_id_groups, self._start_worker)
+        return [(x.stdout.read(), x.wait()) for x in procs]
+
+    def test_workers_are_reused(self):
+        self.assertEqual(
+            [(b"1 a b", 0), (b"1 c", 0)], self._run([["a", "b"], [], ["c"]])
+        )
+        self.assertEqual(2, len(self.started))
+        self.assertEqual([b"1 d"], [x[0] for x in self._run([["d"]])])
+        self.assertEqual(2, len(self.started))
+        self.pool.close()
+        self.assertEqual([0, 0], [x.wait() for x in self.started])
+
+    def test_pool_grows(self):
+        self._run([["a"]])
+        self._run([["b"], ["c"], ["d"]])
+        self.assertEqual(3, len(self.started))
+        self.assertEqual(3, len(self.pool))
+
+    def test_connections(self):
+        self._run([["a"]])
+        conns = self.pool.connections(2, self._start_worker)
+        self.assertEqual(2, len(conns))
+        self.assertEqual(2, len(self.started))
+        self.assertEqual(conns[:1], self.pool.connections(1, self._start_worker))
+        self.assertEqual(2, len(self.started))
+
+    @testtools.skipUnless(hasattr(os, "fork"), "Batches only fork with os.fork")
+    def test_batches_are_isolated(self):
+        # Each batch runs in a fresh fork of the worker, so none of them see
+        # the batches before.
+        self.assertEqual([b"1 a"], [x[0] for x in self._run([["a"]])])
+        self.assertEqual([b"1 b"], [x[0] for x in self._run([["b"]])])
+
+    @testtools.skipUnless(hasattr(os, "fork"), "Batches only fork with os.fork")
+    def test_failed_batch(self):
+        self.assertEqual([(b"", 1)], self._run([["die"]]))
+        self.assertEqual([(b"1 a", 0)], self._run([["a"]]))
+        self.assertEqual(1, len(self.started))
+
+    def test_worker_exits_before_connecting(self):
+        self.assertRaises(
+            pool.PoolError,
+            self.pool.run_batches,
+            [["a"]],
+            lambda: self._start_worker("import sys; sys.exit(2)"),
+        )
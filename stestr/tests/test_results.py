@@ -0,0 +1,81 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from testtools import testresult
+
+from stestr import results
+from stestr.tests import base
+
+
+class TestFirstResultWins(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.target = testresult.StreamToDict(self._on_test)
+        self.tests = []
+        self.result = results.FirstResultWins(self.target)
+        self.result.startTestRun()
+
+    def _on_test(self, test):
+        self.tests.append((test["id"], test["status"], test["tags"]))
+
+    def _run(self, test_id, status, route):
+        self.result.status(
+            test_id=test_id,
+            test_status="inprogress",
+            test_tags={route},
+            route_code=route,
+        )
+        self.result.status(
+            test_id=test_id, test_status=status, test_tags={route}, route_code=route
+        )
+
+    def test_first_finished_copy_wins(self):
+        self.result.status(test_id="a", test_status="inprogress", route_code="0")
+        self._run("a", "fail", "1")
+        self.result.status(test_id="a", test_status="success", route_code="0")
+        self.result.stopTestRun()
+        self.assertEqual([("a", "fail", {"1"})], self.tests)
+
+    def test_unfinished_copies_are_forwarded_once(self):
+        self._run("b", "success", "0")
+        self.result.status(test_id="a", test_status="inprogress", route_code="0")
+        self.result.status(test_id="a", test_status="inprogress", route_code="1")
+        self.result.stopTestRun()
+        self.assertEqual(
+            [("b", "success", {"0"}), ("a", "inprogress", set())], self.tests
+        )
+
+    def test_drop_route(self):
+        self.result.drop_route("1")
+        self._run("a", "success", "1/0")
+        self._run("b", "success", "0")
+        self.result.stopTestRun()
+        self.assertEqual([("b", "success", {"0"})], self.tests)
+
+    def test_drop_route_drops_unfinished_tests(self):
+        self.result.status(test_id="a", test_status="inprogress", route_code="1")
+        self.result.drop_route("1")
+        self.result.stopTestRun()
+        self.assertEqual([], self.tests)
+
+    def test_observer(self):
+        events = []
+        result = results.FirstResultWins(
+            testresult.StreamResult(), lambda *args: events.append(args)
+        )
+        result.status(test_id="a", test_status="inprogress", route_code="0/1")
+        result.status(test_id="a", test_status="success", route_code="0/1")
+        result.status(file_name="stdout", file_bytes=b"", route_code="2")
+        self.assertEqual(
+            [("a", "inprogress", "0"), ("a", "success", "0"), (None, None, "2")],
+            events,
+        )
@@ -131,6 +131,177 @@ class TestReturnCodes(base.TestCase):
     def test_parallel_passing(self):
         self.assertRunExit("stestr run passing", 0)
 
+    def test_parallel_passing_dynamic(self):
+        self.assertRunExit("stestr run --dynamic passing", 0)
+
+    def test_parallel_fails_dynamic(self):
+        self.assertRunExit("stestr run --dynamic", 1)
+
+    def test_parallel_speculate(self):
+        self.assertRunExit("stestr run --dynamic --speculate passing", 0)
+        self.assertRunExit("stestr run --dynamic --speculate", 1)
+
+    def test_parallel_pipeline(self):
+        self.assertRunExit("stestr run --dynamic --pipeline passing", 0)
+        self.assertRunExit("stestr run --dynamic --pipeline --concurrency 2", 1)
+
+    def test_pipeline_without_dynamic(self):
+        self.assertRunExit("stestr run --pipeline passing", 2)
+
+    def test_speculate_without_dynamic(self):
+        self.assertRunExit("stestr run --speculate passing", 2)
+
+    def test_failfast(self):
+        self.assertRunExit("stestr run --failfast passing", 0)
+        self.assertRunExit("stestr run --failfast", 1)
+        self.assertRunExit("stestr run --dynamic --failfast", 1)
+        self.assertRunExit("stestr run --isolated --failfast", 1)
+
+    def test_parallel_isolated(self):
+        self.assertRunExit("stestr run --isolated --concurrency 2 passing", 0)
+        self.assertRunExit("stestr run --isolated --concurrency 2", 1)
+        # Each command stored a single run with every test in it.
+        self.assertEqual(
+            sorted(self.assertRunExit("stestr list", 0)[0].splitlines()),
+            sorted(
+                self.assertRunExit(
+                    "stestr last --subunit | subunit-ls --exists || true", 0
+                )[0].splitlines()
+            ),
+        )
+        with open(os.path.join(".stestr", "next-stream")) as next_stream:
+            self.assertEqual("2", next_stream.read().strip())
+
+    def test_failfast_invalid(self):
+        self.assertRunExit("stestr run --failfast --analyze-isolation", 2)
+
+    def test_warm_pool(self):
+        self.assertRunExit("stestr run --isolated --warm-pool", 1)
+        # Every test of the isolated run is stored in a single run.
+        self.assertEqual(
+            sorted(self.assertRunExit("stestr list", 0)[0].splitlines()),
+            sorted(
+                self.assertRunExit(
+                    "stestr last --subunit | subunit-ls --exists || true", 0
+                )[0].splitlines()
+            ),
+        )
+        with open(os.path.join(".stestr", "next-stream")) as next_stream:
+            self.assertEqual("1", next_stream.read().strip())
+        self.assertRunExit("stestr run --until-failure --warm-pool", 1)
+        # The failing tests fail on their own
+        self.assertRunExit("stestr run --analyze-isolation --warm-pool", 0)
+
+    def test_fork_server(self):
+        self.assertRunExit("stestr run --fork-server passing", 0)
+        self.assertRunExit("stestr run --fork-server --concurrency 2", 1)
+
+    def test_targeted_load(self):
+        sub_dir = os.path.join(self.test_dir, "sub")
+        os.mkdir(sub_dir)
+        shutil.copy(self.init_file, sub_dir)
+        shutil.copy(self.passing_file, sub_dir)
+        self.assertRunExit("stestr run --targeted-load passing", 0)
+        self.assertRunExit("stestr run --targeted-load --isolated", 1)
+        self.assertRunExit("stestr run --targeted-load --concurrency 2", 1)
+        self.assertEqual(
+            sorted(self.assertRunExit("stestr list", 0)[0].splitlines()),
+            sorted(
+                self.assertRunExit(
+                    "stestr last --subunit | subunit-ls --exists || true", 0
+                )[0].splitlines()
+            ),
+        )
+
+    def test_fork_server_invalid(self):
+        self.assertRunExit("stestr run --fork-server --dynamic passing", 2)
+
+    def test_warm_pool_invalid(self):
+        self.assertRunExit("stestr run --warm-pool passing", 2)
+        self.assertRunExit("stestr run --isolated --warm-pool --dynamic", 2)
+
+    def test_parallel_passing_time_estimator(self):
+        self.assertRunExit("stestr run passing", 0)
+        self.assertRunExit("stestr run --time-estimator p90 passing", 0)
+
+    def test_parallel_passing_longest_first(self):
+        self.assertRunExit("stestr run passing", 0)
+        self.assertRunExit("stestr run --longest-first passing", 0)
+        self.assertRunExit("stestr run --serial --longest-first passing", 0)
+
+    def test_random_longest_first_exclusive(self):
+        self.assertRunExit("stestr run --random --longest-first passing", 2)
+
+    def test_parallel_passing_memory_limit(self):
+        self.assertRunExit("stestr run --record-memory passing", 0)
+        self.assertRunExit("stestr run --memory-limit 1G passing", 0)
+
+    def test_memory_limit_invalid(self):
+        self.assertRunExit("stestr run --memory-limit lots passing", 2)
+        self.assertRunExit("stestr run --dynamic --memory-limit 1G passing", 2)
+
+    def test_parallel_passing_auto_concurrency(self):
+        self.assertRunExit("stestr run passing", 0)
+        out, err = self.assertRunExit("stestr run --concurrency auto passing", 0)
+        self.assertIn(b"Running with", out)
+
+    def test_invalid_concurrency(self):
+        self.assertRunExit("stestr run --concurrency lots passing", 2)
+
+    def test_plan(self):
+        self.assertRunExit("stestr run passing", 0)
+        out, err = self.assertRunExit("stestr plan --max-concurrency 3 passing", 0)
+        self.assertIn(b"Predicted makespan", out)
+        self.assertIn(b"Adding workers stops reducing", out)
+        self.assertIn(b"--concurrency auto would use", out)
+
+    def test_agent(self):
+        self.useFixture(fixtures.EnvironmentVariable("STESTR_AGENT_AUTHKEY", "key"))
+        proc = subprocess.Popen(
+            ["stestr", "agent", "--listen", "127.0.0.1:0"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.terminate)
+        address = proc.stdout.readline().decode("utf8").split()[-1]
+        out, err = self.assertRunExit(
+            "stestr run --concurrency 1 --agent %s --agent %s passing"
+            % (address, address),
+            0,
+        )
+        self.assertIn(b"Totals", out)
+        self.assertRunExit("stestr run --concurrency 1 --agent %s failing" % address, 1)
+
+    def test_agent_errors(self):
+        self.useFixture(fixtures.EnvironmentVariable("STESTR_AGENT_AUTHKEY"))
+        self.assertRunExit("stestr run --agent 127.0.0.1:1 passing", 2)
+        self.useFixture(fixtures.EnvironmentVariable("STESTR_AGENT_AUTHKEY", "key"))
+        self.assertRunExit("stestr run --serial --agent 127.0.0.1:1 passing", 2)
+        out, err = self.assertRunExit("stestr run --agent 127.0.0.1:1 passing", 1)
+        self.assertIn(b"Could not connect to the agent", out)
+
+    def test_shard(self):
+        self.assertRunExit("stestr run passing", 0)
+        out, err = self.assertRunExit("stestr list passing", 0)
+        shards = []
+        for index in (1, 2):
+            out_shard, err = self.assertRunExit(
+                "stestr list --shard %d/2 passing" % index, 0
+            )
+            shards.append(set(out_shard.splitlines()))
+            self.assertRunExit("stestr run --shard %d/2 passing" % index, 0)
+        self.assertEqual(set(), shards[0] & shards[1])
+        self.assertEqual(set(out.splitlines()), shards[0] | shards[1])
+
+    def test_shard_invalid(self):
+        self.assertRunExit("stestr run --shard 3/2 passing", 2)
+        self.assertRunExit("stestr list --shard 1 passing", 2)
+        self.assertRunExit("stestr run --shard 1/2 --isolated passing", 2)
+
+    def test_plan_bad_regex(self):
+        self.assertRunExit("stestr plan bad.regex.foobar", 1)
+
     def test_parallel_passing_bad_regex(self):
         self.assertRunExit("stestr run bad.regex.foobar", 1)
 
@@ -253,6 +424,41 @@ class TestReturnCodes(base.TestCase):
     def test_list(self):
         self.assertRunExit("stestr list", 0)
 
+    def test_list_discovery_cache(self):
+        out, _ = self.assertRunExit("stestr list", 0)
+        self.assertEqual(out, self.assertRunExit("stestr list --discovery-cache", 0)[0])
+        self.assertEqual(out, self.assertRunExit("stestr list --discovery-cache", 0)[0])
+        with open(self.passing_file, "a") as fd:
+            fd.write("\n\nclass NewTestClass(testtools.TestCase):\n")
+            fd.write("    def test_new(self):\n        pass\n")
+        out, _ = self.assertRunExit("stestr list --discovery-cache", 0)
+        self.assertIn(b"tests.test_passing.NewTestClass.test_new", out.splitlines())
+        self.assertRunExit("stestr run --discovery-cache NewTestClass", 0)
+
+    def test_parallel_discovery(self):
+        sub_dir = os.path.join(self.test_dir, "sub")
+        os.mkdir(sub_dir)
+        shutil.copy(self.init_file, sub_dir)
+        shutil.copy(self.passing_file, sub_dir)
+        out, _ = self.assertRunExit("stestr list", 0)
+        self.assertIn(b"tests.sub.test_passing.FakeTestClass.test_pass", out)
+        self.assertRunExit("stestr run --parallel-discovery --concurrency 2", 1)
+        self.assertEqual(
+            sorted(out.splitlines()),
+            sorted(
+                self.assertRunExit(
+                    "stestr last --subunit | subunit-ls --exists || true", 0
+                )[0].splitlines()
+            ),
+        )
+
+    def test_list_static_discovery(self):
+        out, _ = self.assertRunExit("stestr list", 0)
+        self.assertEqual(
+            out, self.assertRunExit("stestr list --static-discovery", 0)[0]
+        )
+        self.assertRunExit("stestr run --static-discovery passing", 0)
+
     def _get_cmd_stdout(self, cmd):
         p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
         out = p.communicate()
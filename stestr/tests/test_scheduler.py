@@ -12,6 +12,7 @@
 
 import datetime
 import re
+import threading
 from unittest import mock
 
 from subunit import iso8601
@@ -29,6 +30,10 @@ class TestScheduler(base.TestCase):
         timestamp = start + datetime.timedelta(seconds=duration)
         result.status(test_id=id, test_status="success", timestamp=timestamp)
 
+    def _set_times(self, repo, durations):
+        for test_id, duration in durations.items():
+            repo._add_test_time(test_id, duration)
+
     def test_partition_tests(self):
         repo = memory.RepositoryFactory().initialise("memory:")
         result = repo.get_inserter()
@@ -50,6 +55,26 @@ class TestScheduler(base.TestCase):
         self.assertEqual(3, len(partitions[0]))
         self.assertEqual(4, len(partitions[1]))
 
+    def test_partition_tests_lpt_balance(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        durations = {}
+        for i in range(200):
+            durations["test_%d" % i] = (i * 7919 % 97) / 10.0
+        self._set_times(repo, durations)
+        partitions = scheduler.partition_tests(list(durations), 16, repo, None)
+        self.assertEqual(16, len(partitions))
+        self.assertEqual(
+            sorted(durations), sorted(x for part in partitions for x in part)
+        )
+        loads = [sum(durations[x] for x in part) for part in partitions]
+        # With the LPT rule no partition can exceed another by more than the
+        # largest single duration.
+        self.assertLessEqual(max(loads) - min(loads), max(durations.values()))
+        # Each partition is filled longest first
+        for part in partitions:
+            part_times = [durations[x] for x in part]
+            self.assertEqual(sorted(part_times, reverse=True), part_times)
+
     def test_random_partitions(self):
         repo = memory.RepositoryFactory().initialise("memory:")
         test_ids = frozenset(["a_test", "b_test", "c_test", "d_test"])
@@ -110,12 +135,13 @@ class TestScheduler(base.TestCase):
                 return match.group(0)
 
         partitions = scheduler.partition_tests(test_ids, 2, repo, group_id)
-        # Timed groups are deterministic:
-        self.assertTrue("TestCase2.fast1" in partitions[0])
-        self.assertTrue("TestCase2.fast2" in partitions[0])
-        self.assertTrue("TestCase1.slow" in partitions[1])
-        self.assertTrue("TestCase1.fast" in partitions[1])
-        self.assertTrue("TestCase1.fast2" in partitions[1])
+        # Timed groups are deterministic, the untimed tests in TestCase1 are
+        # estimated from TestCase1.slow which makes it the longest group:
+        self.assertTrue("TestCase1.slow" in partitions[0])
+        self.assertTrue("TestCase1.fast" in partitions[0])
+        self.assertTrue("TestCase1.fast2" in partitions[0])
+        self.assertTrue("TestCase2.fast1" in partitions[1])
+        self.assertTrue("TestCase2.fast2" in partitions[1])
         # Untimed groups just need to be in the same partition:
         if "TestCase3.test1" in partitions[0]:
             self.assertTrue("TestCase3.test2" in partitions[0])
@@ -124,6 +150,465 @@ class TestScheduler(base.TestCase):
         if "testdir.testfile.TestCase5.test" not in partitions[0]:
             self.assertTrue("testdir.testfile.TestCase5.test" in partitions[1])
 
+    def test_partition_tests_with_startup_time(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 3.0, "b": 1.0, "c": 1.0, "d": 1.0})
+        repo.set_startup_time(1.5)
+        test_ids = ["a", "b", "c", "d", "unknown"]
+        partitions = scheduler.partition_tests(test_ids, 4, repo, None)
+        # 7.5 seconds of tests can't finish before the 3 second test, which
+        # 3 workers already manage, so a 4th would only add a startup.
+        self.assertEqual(4, len(partitions))
+        self.assertEqual([], partitions[3])
+        self.assertEqual(sorted(test_ids), sorted(sum(partitions, [])))
+
+    def test_partition_tests_with_slow_startup(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 0.1, "b": 0.1, "c": 0.1})
+        repo.set_startup_time(10.0)
+        partitions = scheduler.partition_tests(["a", "b", "c"], 3, repo, None)
+        # The workers start at the same time, so each one still shortens the
+        # run however long that takes.
+        self.assertEqual([["a"], ["b"], ["c"]], partitions)
+
+    def test_partition_tests_startup_time_boundary(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test%d.test" % i for i in range(9)]
+        self._set_times(repo, dict.fromkeys(test_ids, 9.999 / 9))
+        repo.set_startup_time(5.0)
+        partitions = scheduler.partition_tests(test_ids, 4, repo, None)
+        self.assertEqual([3, 2, 2, 2], [len(x) for x in partitions])
+
+    def test_partition_tests_fill_all(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 1.0, "b": 0.1, "c": 0.1})
+        repo.set_startup_time(10.0)
+        partitions = scheduler.partition_tests(["a", "b", "c"], 3, repo, None)
+        self.assertEqual([["a"], ["b", "c"], []], partitions)
+        partitions = scheduler.partition_tests(
+            ["a", "b", "c"], 3, repo, None, fill_all=True
+        )
+        self.assertEqual([["a"], ["b"], ["c"]], partitions)
+
+    def test_select_shard(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 4.0, "b": 3.0, "c": 2.0, "d": 2.0, "e": 1.0})
+        repo.set_startup_time(10.0)
+        test_ids = ["e", "c", "a", "d", "b", "new"]
+        shards = [scheduler.select_shard(test_ids, x, 2, repo) for x in (1, 2)]
+        # Every shard is used despite the startup time, the tests keep their
+        # order and the shards don't depend on it.
+        self.assertEqual([["a", "d", "new"], ["e", "c", "b"]], shards)
+        reordered = sorted(test_ids, reverse=True)
+        self.assertEqual(
+            [sorted(x) for x in shards],
+            [sorted(scheduler.select_shard(reordered, x, 2, repo)) for x in (1, 2)],
+        )
+
+    def test_partition_tests_with_estimates(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(
+            repo,
+            {
+                "pkg.test_a.TestA.test_1": 4.0,
+                "pkg.test_a.TestA.test_2": 6.0,
+                "pkg.test_b.TestB.test_1": 2.0,
+            },
+        )
+        test_ids = [
+            "pkg.test_a.TestA.test_1",
+            "pkg.test_a.TestA.test_2",
+            "pkg.test_a.TestA.test_new",
+            "pkg.test_b.TestB.test_1",
+            "pkg.test_b.TestNew.test_1",
+            "pkg.test_c.TestNew.test_1",
+            "other.test_d.TestD.test_1",
+        ]
+        estimates = {}
+        partitions = scheduler.partition_tests(
+            test_ids, 2, repo, None, estimates=estimates
+        )
+        self.assertEqual(
+            {
+                # Same class
+                "pkg.test_a.TestA.test_new": 5.0,
+                # Same module
+                "pkg.test_b.TestNew.test_1": 2.0,
+                # Same package
+                "pkg.test_c.TestNew.test_1": 4.0,
+            },
+            estimates,
+        )
+        # The estimated 5 second test is balanced against the known ones
+        self.assertIn("pkg.test_a.TestA.test_new", partitions[1])
+        self.assertEqual(sorted(test_ids), sorted(sum(partitions, [])))
+
+    def test_estimate_unknown_times_strips_attributes(self):
+        estimates = scheduler._estimate_unknown_times(
+            ["mod.Test.test_a[smoke]", "mod.Test.test_b(scenario.x)"],
+            {"mod.Test.test_a[smoke]": 2.0},
+        )
+        self.assertEqual({"mod.Test.test_b(scenario.x)": 2.0}, estimates)
+
+    def test_estimate_unknown_times_only_as_needed(self):
+        timed_tests = {"mod.TestA.test_a": 2.0, "mod.TestB.test_a": 4.0}
+        with mock.patch.object(
+            scheduler.utils, "get_parent_id", wraps=scheduler.utils.get_parent_id
+        ) as get_parent_id:
+            # Nothing is looked up when every test has timing data
+            self.assertEqual(
+                {}, scheduler._estimate_unknown_times(list(timed_tests), timed_tests)
+            )
+            get_parent_id.assert_not_called()
+            # The modules aren't looked at when every class has timing data
+            self.assertEqual(
+                {"mod.TestA.test_b": 2.0},
+                scheduler._estimate_unknown_times(
+                    list(timed_tests) + ["mod.TestA.test_b"], timed_tests
+                ),
+            )
+            self.assertEqual(3, get_parent_id.call_count)
+
+    def test_partition_tests_with_fixture_times(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = []
+        durations = {}
+        for test_class in ("TestA", "TestB"):
+            for i in range(4):
+                test_id = "pkg.test_mod.%s.test_%d" % (test_class, i)
+                test_ids.append(test_id)
+                durations[test_id] = 1.0
+        self._set_times(repo, durations)
+        # Without any fixture costs the classes are split between workers
+        partitions = scheduler.partition_tests(test_ids, 2, repo, None)
+        self.assertEqual({"TestA", "TestB"}, {x.split(".")[2] for x in partitions[0]})
+        repo._add_test_time("pkg.test_mod.TestA", 0.5, repo._fixture_times)
+        repo._add_test_time("pkg.test_mod", 0.5, repo._fixture_times)
+        partitions = scheduler.partition_tests(test_ids, 2, repo, None)
+        self.assertEqual(
+            [{"TestA"}, {"TestB"}],
+            sorted({x.split(".")[2] for x in part} for part in partitions),
+        )
+
+    def test_partition_tests_with_fixture_times_large_class(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["pkg.test_mod.TestA.test_%d" % i for i in range(4)]
+        test_ids.append("pkg.test_mod.TestB.test_1")
+        self._set_times(repo, dict.fromkeys(test_ids, 1.0))
+        repo._add_test_time("pkg.test_mod.TestA", 0.5, repo._fixture_times)
+        # TestA is more than half of the run so splitting it is still better
+        partitions = scheduler.partition_tests(test_ids, 2, repo, None)
+        self.assertEqual([2, 3], sorted(len(x) for x in partitions))
+
+    def test_partition_tests_with_memory_limit(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test.test_%d" % i for i in range(8)]
+        self._set_times(repo, dict.fromkeys(test_ids, 1.0))
+        heavy = test_ids[:3]
+        for test_id in test_ids:
+            test_memory = 3 * 1024**3 if test_id in heavy else 1024**3
+            repo._add_test_time(test_id, test_memory, repo._test_memory)
+        # Without a limit the heavy tests are spread over the workers
+        partitions = scheduler.partition_tests(test_ids, 4, repo, None)
+        self.assertEqual(3, len([x for x in partitions if set(x) & set(heavy)]))
+        # With 8G two 3G tests fit alongside two workers running the 1G
+        # tests, three don't.
+        partitions = scheduler.partition_tests(
+            test_ids, 4, repo, None, memory_limit=8 * 1024**3
+        )
+        self.assertEqual(2, len([x for x in partitions if set(x) & set(heavy)]))
+        self.assertEqual(sorted(test_ids), sorted(sum(partitions, [])))
+        # Everything else still fills in around them
+        self.assertEqual([2, 2, 2, 2], sorted(len(x) for x in partitions))
+
+    def test_partition_tests_with_memory_limit_too_small(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.TestA.test_1", "mod.TestB.test_1", "mod.TestC.test_1"]
+        for test_id in test_ids:
+            repo._add_test_time(test_id, 4096, repo._test_memory)
+        # Without any timing data the heavy tests are dealt out to the
+        # single worker allowed them
+        partitions = scheduler.partition_tests(
+            test_ids, 3, repo, None, memory_limit=1024
+        )
+        self.assertEqual([test_ids, [], []], partitions)
+
+    def test_choose_concurrency_without_times(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        choice = scheduler.choose_concurrency(["a", "b"], repo, 8)
+        self.assertEqual(8, choice.workers)
+        self.assertIsNone(choice.makespan)
+
+    def test_choose_concurrency(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test%d.test" % i for i in range(20)]
+        self._set_times(repo, dict.fromkeys(test_ids, 1.0))
+        # Evenly spread tests use every CPU
+        choice = scheduler.choose_concurrency(test_ids, repo, 4)
+        self.assertEqual((4, 5.0), choice[:2])
+        # but no more workers than there are tests
+        choice = scheduler.choose_concurrency(test_ids[:3], repo, 4)
+        self.assertEqual((3, 1.0), choice[:2])
+        # or groups
+        choice = scheduler.choose_concurrency(
+            test_ids, repo, 4, lambda x: x.split(".")[1][-1]
+        )
+        self.assertEqual((4, 5.0), choice[:2])
+        choice = scheduler.choose_concurrency(test_ids, repo, 4, lambda x: "mod")
+        self.assertEqual((1, 20.0), choice[:2])
+        self.assertIn("only 1 tests or groups", choice.reason)
+
+    def test_choose_concurrency_long_test(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        durations = {"mod.Test%d.test" % i: 1.0 for i in range(10)}
+        durations["mod.TestSlow.test"] = 10.0
+        self._set_times(repo, durations)
+        choice = scheduler.choose_concurrency(list(durations), repo, 8)
+        self.assertEqual((2, 10.0), choice[:2])
+        self.assertIn("longest", choice.reason)
+
+    def test_choose_concurrency_with_startup_time(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test%d.test" % i for i in range(20)]
+        self._set_times(repo, dict.fromkeys(test_ids, 0.5))
+        repo.set_startup_time(2.5)
+        choice = scheduler.choose_concurrency(test_ids, repo, 8)
+        # 8 workers are predicted to take 3.75s and 7 less than 5% longer.
+        self.assertEqual((7, 2.5 + 10.0 / 7), choice[:2])
+        self.assertIn("less than 5% sooner", choice.reason)
+        self.assertIn("start", choice.reason)
+        partitions = scheduler.partition_tests(test_ids, choice.workers, repo, None)
+        self.assertEqual([3, 3, 3, 3, 3, 3, 2], [len(x) for x in partitions])
+
+    def test_choose_concurrency_slow_startup(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test%d.test" % i for i in range(100)]
+        self._set_times(repo, dict.fromkeys(test_ids, 0.1))
+        repo.set_startup_time(5.0)
+        choice = scheduler.choose_concurrency(test_ids, repo, 8)
+        # Starting a worker takes half as long as all the tests, but each
+        # worker started at the same time still shortens the run: 1 worker
+        # is predicted to take 15s and 8 workers 6.25s.
+        self.assertEqual(7, choice.workers)
+        self.assertAlmostEqual(5.0 + 10.0 / 7, choice.makespan)
+        # The run uses every one of the workers chosen.
+        partitions = scheduler.partition_tests(test_ids, choice.workers, repo, None)
+        self.assertEqual([15, 15, 14, 14, 14, 14, 14], [len(x) for x in partitions])
+
+    def test_order_longest_first(self):
+        test_times = {
+            "pkg.test_a.TestA.test_fast": 1.0,
+            "pkg.test_a.TestA.test_slow": 2.0,
+            "pkg.test_a.TestB.test_slow": 4.0,
+            "pkg.test_b.TestC.test_slow": 10.0,
+        }
+        test_ids = sorted(test_times) + ["pkg.test_a.TestB.test_new"]
+        # test_new is assumed to take the mean time of 4.25s, which makes
+        # test_a the slowest module and TestB its slowest class.
+        self.assertEqual(
+            [
+                "pkg.test_a.TestB.test_new",
+                "pkg.test_a.TestB.test_slow",
+                "pkg.test_a.TestA.test_slow",
+                "pkg.test_a.TestA.test_fast",
+                "pkg.test_b.TestC.test_slow",
+            ],
+            scheduler.order_longest_first(test_ids, test_times),
+        )
+
+    def test_order_longest_first_keeps_groups_together(self):
+        test_times = {
+            "pkg.test_a.TestA.test_1": 1.0,
+            "pkg.test_a.TestB.test_1": 3.0,
+            "pkg.test_a.TestC.test_1": 2.5,
+        }
+
+        def group_callback(test_id):
+            if test_id.split(".")[2] in ("TestA", "TestC"):
+                return "AC"
+
+        self.assertEqual(
+            [
+                "pkg.test_a.TestC.test_1",
+                "pkg.test_a.TestA.test_1",
+                "pkg.test_a.TestB.test_1",
+            ],
+            scheduler.order_longest_first(
+                sorted(test_times), test_times, group_callback
+            ),
+        )
+
+    def test_partition_tests_longest_first(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        durations = {"mod.Test%d.test" % i: float(i) for i in range(1, 7)}
+        self._set_times(repo, durations)
+        partitions = scheduler.partition_tests(
+            sorted(durations), 2, repo, None, longest_first=True
+        )
+        for partition in partitions:
+            self.assertEqual(
+                sorted(partition, key=durations.__getitem__, reverse=True),
+                partition,
+            )
+        # Randomize takes precedence
+        with mock.patch("random.shuffle") as shuffle:
+            scheduler.partition_tests(
+                sorted(durations), 2, repo, None, True, longest_first=True
+            )
+        self.assertEqual(2, shuffle.call_count)
+
+    def test_dispatch_queue(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        result = repo.get_inserter()
+        result.startTestRun()
+        self._add_timed_test("slow", 3, result)
+        self._add_timed_test("fast1", 1, result)
+        self._add_timed_test("fast2", 1, result)
+        result.stopTestRun()
+        test_ids = ["fast1", "slow", "fast2", "unknown1"]
+        queue = scheduler.DispatchQueue(test_ids, 2, repo)
+        batches = []
+        batch = queue.get_batch()
+        while batch:
+            batches.append(batch)
+            batch = queue.get_batch()
+        # The slowest test is always dispatched first
+        self.assertEqual(["slow"], batches[0])
+        self.assertEqual(sorted(test_ids), sorted(sum(batches, [])))
+        self.assertEqual([], queue.get_batch())
+
+    def test_dispatch_queue_with_startup_time(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 1.0, "b": 1.0, "c": 1.0, "d": 1.0})
+        queue = scheduler.DispatchQueue(["a", "b", "c", "d"], 4, repo)
+        self.assertEqual(4, queue.max_workers)
+        repo.set_startup_time(2.0)
+        queue = scheduler.DispatchQueue(["a", "b", "c", "d"], 4, repo)
+        self.assertEqual(4, queue.max_workers)
+        self._set_times(repo, {"a": 3.0})
+        queue = scheduler.DispatchQueue(["a", "b", "c", "d"], 4, repo)
+        # Nothing finishes before the 3 second test, which 2 workers manage.
+        self.assertEqual(2, queue.max_workers)
+
+    def test_dispatch_queue_with_grouping(self):
+        test_ids = ["TestCase1.a", "TestCase2.a", "TestCase1.b", "TestCase2.b"]
+
+        def group_id(test_id):
+            return test_id.split(".")[0]
+
+        queue = scheduler.DispatchQueue(test_ids, 4, None, group_id)
+        self.assertEqual(2, len(queue))
+        self.assertEqual(["TestCase1.a", "TestCase1.b"], queue.get_batch())
+        self.assertEqual(["TestCase2.a", "TestCase2.b"], queue.get_batch())
+        self.assertEqual([], queue.get_batch())
+
+    def test_dispatch_queue_speculate(self):
+        test_ids = ["a.1", "a.2", "a.3[idempotent]", "b.1"]
+
+        def group_id(test_id):
+            return test_id.split(".")[0]
+
+        queue = scheduler.DispatchQueue(test_ids, 2, None, group_id, speculate=True)
+        self.assertEqual(["a.1", "a.2", "a.3[idempotent]"], queue.get_batch(0))
+        self.assertEqual(["b.1"], queue.get_batch(1))
+        queue.test_started("b.1")
+        self.assertFalse(queue.test_finished("b.1"))
+        queue.test_started("a.1")
+        queue.test_started("a.2")
+        # Worker 1 is idle, it gets the idempotent test still running on
+        # worker 0 but not the one which isn't.
+        self.assertEqual(["a.3[idempotent]"], queue.get_batch(1))
+        # Tests are only copied once
+        self.assertEqual([], queue.get_batch(1))
+        self.assertFalse(queue.test_finished("a.1"))
+        self.assertFalse(queue.test_finished("a.2"))
+        self.assertTrue(queue.test_finished("a.3[idempotent]"))
+
+    def test_dispatch_queue_speculate_most_work_left(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 5.0, "b": 1.0, "c": 1.0})
+        queue = scheduler.DispatchQueue(
+            ["a", "b", "c"], 3, repo, lambda x: x, speculate=True
+        )
+        self.assertEqual(["a"], queue.get_batch(0))
+        self.assertEqual(["b"], queue.get_batch(1))
+        self.assertEqual(["c"], queue.get_batch(2))
+        queue.test_finished("c")
+        self.assertEqual(["a"], queue.get_batch(2))
+        self.assertEqual(["b"], queue.get_batch(2))
+
+    def test_dispatch_queue_without_speculate(self):
+        queue = scheduler.DispatchQueue(["a", "b"], 2)
+        self.assertEqual(["a", "b"], sorted(queue.get_batch(0) + queue.get_batch(1)))
+        self.assertEqual([], queue.get_batch(1))
+
+    def test_pipeline_queue(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 1.0, "b": 3.0, "c": 5.0})
+        queue = scheduler.PipelineQueue(2, repo)
+        self.assertEqual(2, queue.max_workers)
+        queue.add(["a", "b"])
+        self.assertEqual(["b"], queue.get_batch())
+        # The slowest of the tests still queued goes first.
+        queue.add(["c", "b"])
+        self.assertEqual(2, len(queue))
+        self.assertEqual(["c"], queue.get_batch())
+        queue.close()
+        self.assertEqual(["a"], queue.get_batch())
+        self.assertEqual([], queue.get_batch())
+
+    def test_pipeline_queue_waits(self):
+        queue = scheduler.PipelineQueue(2)
+        batches = []
+        worker = threading.Thread(target=lambda: batches.append(queue.get_batch()))
+        worker.start()
+        worker.join(0.1)
+        self.assertTrue(worker.is_alive())
+        queue.add(["a"])
+        worker.join()
+        self.assertEqual([["a"]], batches)
+        worker = threading.Thread(target=lambda: batches.append(queue.get_batch()))
+        worker.start()
+        queue.close()
+        worker.join()
+        self.assertEqual([["a"], []], batches)
+
+    def test_pipeline_queue_overlapping_add(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        queue = scheduler.PipelineQueue(2, repo)
+        calls = []
+
+        def get_test_times(test_ids, estimator):
+            # Another add of the same tests while their times are looked up.
+            calls.append(test_ids)
+            if len(calls) == 1:
+                queue.add(["a", "b"])
+            return {"known": {}}
+
+        with mock.patch.object(repo, "get_test_times", get_test_times):
+            queue.add(["a", "a"])
+        self.assertEqual([["a"], ["b"]], calls)
+        queue.close()
+        self.assertEqual(2, len(queue))
+        self.assertEqual(["a", "b"], sorted(queue.get_batch() + queue.get_batch()))
+        self.assertEqual([], queue.get_batch())
+
+    def test_pipeline_queue_speculate(self):
+        queue = scheduler.PipelineQueue(2, speculate=True)
+        queue.add(["a"])
+        self.assertEqual(["a"], queue.get_batch(0))
+        queue.test_started("a")
+        # More tests may still be added.
+        self.assertFalse(queue.test_finished("a"))
+        queue.close()
+        self.assertTrue(queue.test_finished("a"))
+
+    def test_is_idempotent(self):
+        self.assertTrue(scheduler.is_idempotent("a.test[idempotent]"))
+        self.assertTrue(scheduler.is_idempotent("a.test[fast, idempotent]"))
+        self.assertFalse(scheduler.is_idempotent("a.test[idempotently]"))
+        self.assertFalse(scheduler.is_idempotent("a.test"))
+
     @mock.patch("builtins.open", mock.mock_open(), create=True)
     def test_generate_worker_partitions(self):
         test_ids = ["test_a", "test_b", "your_test"]
@@ -212,3 +697,68 @@ class TestScheduler(base.TestCase):
             ["test_a", "test_b", "your_test"],
         ]
         self.assertEqual(expected_grouping, groups)
+
+    @mock.patch("builtins.open", mock.mock_open(), create=True)
+    def test_generate_worker_partitions_with_weights(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self._set_times(repo, {"a": 4.0, "b": 3.0, "c": 3.0, "d": 2.0})
+        fake_worker_yaml = [
+            {"worker": ["."], "weight": 2},
+            {"worker": ["."], "concurrency": 2},
+        ]
+        with mock.patch("yaml.safe_load", return_value=fake_worker_yaml):
+            groups = scheduler.generate_worker_partitions(
+                ["a", "b", "c", "d"], "fakepath", repo
+            )
+        self.assertEqual([["a", "d"], ["b"], ["c"]], groups)
+
+    @mock.patch("builtins.open", mock.mock_open(), create=True)
+    def test_generate_worker_partitions_with_weights_balances_entries(self):
+        fake_worker_yaml = [
+            {"worker": ["^x"], "weight": 1},
+            {"worker": ["."]},
+        ]
+        with mock.patch("yaml.safe_load", return_value=fake_worker_yaml):
+            groups = scheduler.generate_worker_partitions(
+                ["x1", "x2", "y1", "y2"], "fakepath"
+            )
+        # Each test only runs once, and only on workers matching it.
+        self.assertEqual([["x1"], ["x2", "y1", "y2"]], groups)
+
+    @mock.patch("builtins.open", mock.mock_open(), create=True)
+    def test_generate_worker_partitions_invalid_weight(self):
+        for weight in (0, -1, "fast", True):
+            fake_worker_yaml = [{"worker": ["."], "weight": weight}]
+            with mock.patch("yaml.safe_load", return_value=fake_worker_yaml):
+                self.assertRaises(
+                    TypeError,
+                    scheduler.generate_worker_partitions,
+                    ["a"],
+                    "fakepath",
+                )
+
+    @mock.patch("builtins.open", mock.mock_open(), create=True)
+    def test_generate_worker_partitions_invalid_concurrency(self):
+        for concurrency in (0, -1, 1.5, "2", True):
+            fake_worker_yaml = [
+                {"worker": ["."], "weight": 2, "concurrency": concurrency}
+            ]
+            with mock.patch("yaml.safe_load", return_value=fake_worker_yaml):
+                self.assertRaises(
+                    TypeError,
+                    scheduler.generate_worker_partitions,
+                    ["a"],
+                    "fakepath",
+                )
+                self.assertRaises(TypeError, scheduler.get_worker_weights, "fakepath")
+
+    @mock.patch("builtins.open", mock.mock_open(), create=True)
+    def test_get_worker_weights(self):
+        fake_worker_yaml = [
+            {"worker": ["a"], "weight": 2.5},
+            {"worker": ["b"], "concurrency": 2},
+        ]
+        with mock.patch("yaml.safe_load", return_value=fake_worker_yaml):
+            self.assertEqual([2.5, 1, 1], scheduler.get_worker_weights("fakepath"))
+        with mock.patch("yaml.safe_load", return_value=fake_worker_yaml[1:]):
+            self.assertIsNone(scheduler.get_worker_weights("fakepath"))
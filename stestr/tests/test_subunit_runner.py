@@ -0,0 +1,128 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import io
+import unittest
+from unittest import mock
+
+import subunit
+import testtools
+
+from stestr.repository import timing
+from stestr.subunit_runner import program
+from stestr.subunit_runner import run
+from stestr.tests import base
+
+
+class RecordMemory(testtools.StreamResult):
+    def __init__(self):
+        super().__init__()
+        self.memory = {}
+
+    def status(self, test_id=None, file_name=None, file_bytes=None, **kwargs):
+        if file_name == timing.MEMORY_ATTACHMENT:
+            self.memory[test_id] = int(file_bytes)
+
+
+class RecordAttachments(testtools.StreamResult):
+    def __init__(self):
+        super().__init__()
+        self.attachments = set()
+
+    def status(self, file_name=None, **kwargs):
+        if file_name is not None:
+            self.attachments.add(file_name)
+
+
+class TestMemoryStreamResult(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        if run.resource is None:
+            self.skipTest("Memory use is not recorded on this platform")
+
+    def _run_heavy_then_light(self):
+        target = RecordMemory()
+        result = run.MemoryStreamResult(target)
+        result.startTestRun()
+        result.status(test_id="heavy", test_status="inprogress")
+        data = bytearray(b"x") * (200 * 1024 * 1024)
+        del data
+        result.status(test_id="heavy", test_status="success")
+        result.status(test_id="light", test_status="inprogress")
+        result.status(test_id="light", test_status="success")
+        result.stopTestRun()
+        return target.memory
+
+    def test_light_after_heavy(self):
+        memory = self._run_heavy_then_light()
+        self.assertGreater(memory["heavy"], 100 * 1024 * 1024)
+        # The peak the heavy test set is not charged to the next test.
+        self.assertLess(memory["light"], 10 * 1024 * 1024)
+
+    def test_light_after_heavy_without_reset(self):
+        # Without a way to reset the peak a test is charged with how far it
+        # raised the peak of the process.
+        with mock.patch.object(
+            run, "_start_measuring", lambda: (run._peak_rss(), False)
+        ):
+            memory = self._run_heavy_then_light()
+        self.assertLess(memory["light"], 10 * 1024 * 1024)
+
+
+class TestSubunitTestRunner(base.TestCase):
+    class _Test(unittest.TestCase):
+        def test_fail(self):
+            self.fail("failed")
+
+    def _run(self, **kwargs):
+        stream = io.BytesIO()
+        runner = run.SubunitTestRunner(stdout=stream, **kwargs)
+        runner.run(unittest.TestSuite([self._Test("test_fail")]))
+        stream.seek(0)
+        result = RecordAttachments()
+        subunit.ByteStreamToStreamResult(stream).run(result)
+        return result.attachments
+
+    def test_no_memory_by_default(self):
+        with mock.patch.object(run, "_start_measuring") as start_measuring:
+            attachments = self._run()
+        self.assertNotIn(timing.MEMORY_ATTACHMENT, attachments)
+        self.assertIn("traceback", attachments)
+        # The peak memory use isn't reset for every test either.
+        start_measuring.assert_not_called()
+
+    def test_record_memory(self):
+        if run.resource is None:
+            self.skipTest("Memory use is not recorded on this platform")
+        self.assertIn(timing.MEMORY_ATTACHMENT, self._run(record_memory=True))
+
+
+class TestBatchSuite(base.TestCase):
+    class _Test(unittest.TestCase):
+        def test_a(self):
+            pass
+
+        def test_b(self):
+            pass
+
+    def test_batch_suite(self):
+        tests = {x.id(): x for x in (self._Test("test_a"), self._Test("test_b"))}
+        ids = [self._Test("test_b").id(), "missing", self._Test("test_a").id()]
+        suite = program.batch_suite(tests, ids)
+        self.assertEqual(
+            [ids[0], ids[2], "missing"], [x.id() for x in program.iterate_tests(suite)]
+        )
+        result = unittest.TestResult()
+        suite.run(result)
+        # The unknown test fails rather than silently not running.
+        self.assertEqual(3, result.testsRun)
+        self.assertEqual(["missing"], [x[0].id() for x in result.failures])
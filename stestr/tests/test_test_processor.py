@@ -10,9 +10,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import io
 import subprocess
+import threading
 from unittest import mock
 
+import fixtures
+import subunit
+from testtools import testresult
+
+from stestr.repository import memory
+from stestr import scheduler
 from stestr import test_processor
 from stestr.tests import base
 
@@ -44,6 +53,8 @@ class TestTestProcessorFixture(base.TestCase):
             stdout=subprocess.PIPE,
             stdin=subprocess.PIPE,
             preexec_fn=expected_fn,
+            env=None,
+            pass_fds=(),
         )
 
     def test_start_process_win32(self):
@@ -53,3 +64,300 @@ class TestTestProcessorFixture(base.TestCase):
         self._check_start_process(
             platform="linux2", expected_fn=self._fixture._clear_SIGPIPE
         )
+
+    @mock.patch.object(subprocess, "Popen")
+    @mock.patch.object(test_processor, "sys")
+    def test_start_process_cancellable(self, mock_sys, mock_Popen):
+        mock_sys.platform = "linux2"
+        self._fixture._start_process("run tests", cancellable=True)
+        self.assertEqual("exec run tests", mock_Popen.call_args[0][0])
+
+    def test_decorate_result_failfast(self):
+        fixture = test_processor.TestProcessorFixture(
+            ["a", "b"],
+            "true $IDOPTION",
+            "--list",
+            "--load-list $IDFILE",
+            None,
+            failfast=True,
+        )
+        self.assertIs(
+            mock.sentinel.result, fixture.decorate_result(mock.sentinel.result)
+        )
+        procs = [mock.Mock(), mock.Mock()]
+        for proc in procs:
+            proc.poll.return_value = None
+            proc.wait.return_value = -15
+        with mock.patch.object(fixture, "_run_tests", return_value=procs):
+            workers = fixture.run_tests()
+        tests = []
+        result = fixture.decorate_result(
+            testresult.StreamToDict(lambda x: tests.append((x["id"], x["status"])))
+        )
+        result.startTestRun()
+        result.status(test_id="a", test_status="inprogress", route_code="1")
+        result.status(test_id="b", test_status="inprogress", route_code="0")
+        result.status(test_id="b", test_status="fail", route_code="0")
+        result.status(test_id="a", test_status="success", route_code="1")
+        result.stopTestRun()
+        # Both workers are stopped, only the results finished before the
+        # failure are kept and the stopped workers don't fail the run.
+        self.assertEqual([("b", "fail")], tests)
+        for proc, worker in zip(procs, workers):
+            proc.terminate.assert_called_once_with()
+            self.assertEqual(0, worker.wait())
+
+    def test_fork_server_returncodes(self):
+        proc = mock.Mock()
+        proc.stdout.read.return_value = b"0 3\n"
+        proc.wait.return_value = 0
+        server = test_processor._ForkServer(proc, 2)
+        self.assertEqual(3, server.get_returncode(1))
+        self.assertEqual(0, server.get_returncode(0))
+        proc.wait.assert_called_once_with()
+
+    def test_fork_server_failed(self):
+        proc = mock.Mock()
+        proc.stdout.read.return_value = b""
+        proc.wait.return_value = 2
+        server = test_processor._ForkServer(proc, 2)
+        self.assertEqual([2, 2], [server.get_returncode(x) for x in range(2)])
+
+    def _parallel_discovery_fixture(self, listed):
+        fixture = test_processor.TestProcessorFixture(
+            None,
+            "list $LISTOPT",
+            "--list",
+            "--load-list $IDFILE",
+            None,
+            concurrency=2,
+            top_dir=".",
+            test_path=".",
+            moduleoption="--modules $MODULES",
+            parallel_discovery=True,
+        )
+        fixture.concurrency = 2
+        self.useFixture(
+            fixtures.MockPatchObject(
+                test_processor.discovery,
+                "split_packages",
+                return_value=[["a"], ["b", "c"]],
+            )
+        )
+        self.useFixture(
+            fixtures.MockPatchObject(
+                fixture, "_list_group", side_effect=lambda x: listed[x[0]]
+            )
+        )
+        return fixture
+
+    def _enumeration(self, test_ids, errors=None):
+        stream = io.BytesIO()
+        result = subunit.StreamResultToBytes(stream)
+        for test_id in test_ids:
+            result.status(test_id=test_id, test_status="exists")
+        if errors:
+            result.status(
+                file_name="import errors",
+                runnable=False,
+                file_bytes=errors.encode("utf8"),
+                mime_type="text/plain;charset=utf8",
+            )
+        return stream.getvalue()
+
+    def test_parallel_discovery(self):
+        fixture = self._parallel_discovery_fixture(
+            {
+                "a": (0, self._enumeration(["a.test_1", "a.test_2"]), b""),
+                "b": (0, self._enumeration(["b.test_1", "c.test_1"]), b""),
+            }
+        )
+        self.assertEqual(
+            ["a.test_1", "a.test_2", "b.test_1", "c.test_1"], fixture.list_tests()
+        )
+
+    def test_parallel_discovery_import_errors(self):
+        fixture = self._parallel_discovery_fixture(
+            {
+                "a": (2, self._enumeration([], "Failed a\n"), b""),
+                "b": (2, self._enumeration([], "Failed b\n"), b""),
+            }
+        )
+        stdout = io.StringIO()
+        with mock.patch("sys.stdout", stdout):
+            self.assertRaises(SystemExit, fixture.list_tests)
+        self.assertIn(
+            "--- import errors ---\nFailed a\n\nFailed b\n", stdout.getvalue()
+        )
+        self.assertEqual(1, stdout.getvalue().count("--- import errors ---"))
+
+    def test_pipeline_queue_tests(self):
+        fixture = test_processor.TestProcessorFixture(
+            None,
+            "list $LISTOPT",
+            "--list",
+            "--load-list $IDFILE",
+            None,
+            top_dir=".",
+            test_path=".",
+            moduleoption="--modules $MODULES",
+            test_filters=["test_1"],
+        )
+        self.useFixture(
+            fixtures.MockPatchObject(
+                test_processor.discovery,
+                "split_packages",
+                return_value=[["a"], ["b", "c"]],
+            )
+        )
+        listed = {"a": ["a.test_1", "a.test_2"], "b": ["b.test_1", "c.test_1"]}
+        self.useFixture(
+            fixtures.MockPatchObject(
+                fixture, "_list_tests", side_effect=lambda x: listed[x[0]]
+            )
+        )
+        queue = scheduler.PipelineQueue(2)
+        fixture._queue_tests(queue)
+        test_ids = []
+        batch = queue.get_batch()
+        while batch:
+            test_ids.extend(batch)
+            batch = queue.get_batch()
+        self.assertEqual(["a.test_1", "b.test_1", "c.test_1"], sorted(test_ids))
+        fixture._list_tests.assert_has_calls([mock.call(["a"]), mock.call(["b", "c"])])
+
+    def test_listing_process_failed(self):
+        def fail():
+            exit(100)
+
+        proc = test_processor._ListingProcess(fail)
+        tests = []
+        result = testresult.StreamToDict(tests.append)
+        result.startTestRun()
+        subunit.ByteStreamToStreamResult(proc.stdout).run(result)
+        result.stopTestRun()
+        self.assertEqual(100, proc.wait())
+        self.assertEqual(["test-discovery"], [x["id"] for x in tests])
+        self.assertEqual("fail", tests[0]["status"])
+
+    def test_listing_process(self):
+        proc = test_processor._ListingProcess(lambda: None)
+        self.assertEqual(b"", proc.stdout.read())
+        self.assertEqual(0, proc.wait())
+        self.assertEqual(0, proc.poll())
+
+    def _isolated_fixture(self, concurrency):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        repo._add_test_time("mod.Test.test_a", 1.0)
+        repo._add_test_time("mod.Test.test_b", 3.0)
+        fixture = test_processor.TestProcessorFixture(
+            ["mod.Test.test_a", "mod.Test.test_b", "mod.Test.test_c"],
+            "cat $IDOPTION",
+            "--list",
+            "$IDFILE",
+            repo,
+            concurrency=concurrency,
+            isolated=True,
+        )
+        self.useFixture(fixture)
+        return fixture
+
+    def test_isolated(self):
+        fixture = self._isolated_fixture(1)
+        procs = fixture.run_tests()
+        self.assertEqual(1, len(procs))
+        # Each test is run on its own, the slowest first and the test with
+        # no timing data is assumed to take the mean time.
+        self.assertEqual(
+            b"mod.Test.test_b\nmod.Test.test_c\nmod.Test.test_a\n",
+            procs[0].stdout.read(),
+        )
+        self.assertEqual(0, procs[0].wait())
+        self.assertIsNone(fixture.spawn_time)
+
+    def test_isolated_concurrency(self):
+        procs = self._isolated_fixture(2).run_tests()
+        self.assertEqual(2, len(procs))
+        lines = []
+        for proc in procs:
+            lines.extend(proc.stdout.read().splitlines())
+            self.assertEqual(0, proc.wait())
+        self.assertEqual(
+            [b"mod.Test.test_a", b"mod.Test.test_b", b"mod.Test.test_c"],
+            sorted(lines),
+        )
+
+    def test_isolated_worker_terminate(self):
+        started = []
+        running = threading.Event()
+
+        def start_test(test_id, stdout):
+            started.append(test_id)
+            running.set()
+            return subprocess.Popen(["sleep", "10"], stdout=stdout)
+
+        proc = test_processor._IsolatedWorker(
+            start_test, collections.deque(["test_a", "test_b"])
+        )
+        running.wait()
+        proc.terminate()
+        self.assertNotEqual(0, proc.wait())
+        self.assertEqual(b"", proc.stdout.read())
+        # No more tests are started once the worker has been stopped.
+        self.assertEqual(["test_a"], started)
+
+    def test_isolated_worker_failed_test(self):
+        events = []
+
+        def start_test(test_id, stdout):
+            # Only the first test runner fails.
+            returncode = 0 if events else 3
+            events.append(("start", test_id))
+            proc = mock.Mock()
+
+            def wait():
+                events.append(("wait", test_id))
+                return returncode
+
+            proc.wait.side_effect = wait
+            return proc
+
+        proc = test_processor._IsolatedWorker(
+            start_test, collections.deque(["test_a", "test_b", "test_c"])
+        )
+        self.assertEqual(3, proc.wait())
+        # Each test runner is waited on before the next one is started, also
+        # after one of them failed.
+        self.assertEqual(
+            [
+                ("start", "test_a"),
+                ("wait", "test_a"),
+                ("start", "test_b"),
+                ("wait", "test_b"),
+                ("start", "test_c"),
+                ("wait", "test_c"),
+            ],
+            events,
+        )
+
+    @mock.patch.object(scheduler, "local_concurrency", return_value=8)
+    def test_auto_concurrency(self, mock_local_concurrency):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        test_ids = ["mod.Test.test_%d" % i for i in range(10)]
+        for test_id in test_ids:
+            repo._add_test_time(test_id, 1.0)
+        repo._add_test_time("mod.Test.test_0", 4.0)
+        fixture = test_processor.TestProcessorFixture(
+            test_ids,
+            "true $IDOPTION",
+            "--list",
+            "--load-list $IDFILE",
+            repo,
+            concurrency="auto",
+        )
+        self.useFixture(fixture)
+        # 13 seconds of tests and the longest takes 4s, so 4 workers finish
+        # as soon as 8 would
+        self.assertEqual(4, fixture.concurrency)
+        self.assertEqual(4, fixture.concurrency_choice.workers)
+        self.assertEqual(4.0, fixture.concurrency_choice.makespan)
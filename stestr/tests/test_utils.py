@@ -96,3 +96,22 @@ class TestUtils(base.TestCase):
         self.assertEqual(
             "test.TestThing.test_thing[attr]", result_with_attr_and_scenario
         )
+
+    def test_parse_memory_size(self):
+        self.assertEqual(4096, utils.parse_memory_size(4096))
+        self.assertEqual(4096, utils.parse_memory_size("4096"))
+        self.assertEqual(1536, utils.parse_memory_size("1.5K"))
+        self.assertEqual(512 * 1024**2, utils.parse_memory_size("512M"))
+        self.assertEqual(8 * 1024**3, utils.parse_memory_size("8gb"))
+
+    def test_parse_memory_size_invalid(self):
+        for size in ("", "G", "lots", "0", "-1G", "inf"):
+            self.assertRaises(ValueError, utils.parse_memory_size, size)
+
+    def test_parse_shard(self):
+        self.assertEqual((1, 1), utils.parse_shard("1/1"))
+        self.assertEqual((2, 5), utils.parse_shard("2/5"))
+
+    def test_parse_shard_invalid(self):
+        for shard in ("", "1", "0/2", "3/2", "a/b", "1/2/3", "-1/2"):
+            self.assertRaises(ValueError, utils.parse_shard, shard)
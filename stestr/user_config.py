@@ -16,6 +16,8 @@ import sys
 import voluptuous as vp
 import yaml
 
+from stestr.repository import timing
+
 
 def get_user_config(path=None):
     if not path:
@@ -40,8 +42,21 @@ class UserConfig:
         self.schema = vp.Schema(
             {
                 vp.Optional("run"): {
-                    vp.Optional("concurrency"): int,
+                    vp.Optional("concurrency"): vp.Any(int, "auto"),
                     vp.Optional("random"): bool,
+                    vp.Optional("dynamic"): bool,
+                    vp.Optional("speculate"): bool,
+                    vp.Optional("pipeline"): bool,
+                    vp.Optional("failfast"): bool,
+                    vp.Optional("fork-server"): bool,
+                    vp.Optional("discovery-cache"): bool,
+                    vp.Optional("parallel-discovery"): bool,
+                    vp.Optional("static-discovery"): bool,
+                    vp.Optional("targeted-load"): bool,
+                    vp.Optional("longest-first"): bool,
+                    vp.Optional("memory-limit"): vp.Any(int, str),
+                    vp.Optional("record-memory"): bool,
+                    vp.Optional("time-estimator"): vp.In(timing.ESTIMATORS),
                     vp.Optional("no-subunit-trace"): bool,
                     vp.Optional("color"): bool,
                     vp.Optional("abbreviate"): bool,
@@ -79,3 +79,81 @@ def cleanup_test_name(name, strip_tags=True, strip_scenarios=False):
             name = newname
 
     return name
+
+
+def get_parent_id(test_id):
+    """Return the id of the parent of a test, class, or module.
+
+    The parent is found by removing the last component of the id, so the
+    parent of ``pkg.test_mod.Class.test`` is ``pkg.test_mod.Class`` and its
+    parent is ``pkg.test_mod``. Tags and scenario names are ignored.
+
+    :param str test_id: The id to find the parent of.
+    :return: The parent id or None if there isn't one.
+    """
+    if "[" in test_id or "(" in test_id:
+        test_id = cleanup_test_name(test_id, strip_scenarios=True)
+    return test_id.rpartition(".")[0] or None
+
+
+def get_parent_ids(test_id, levels):
+    """Return the ids of the parents of a test, nearest first.
+
+    :param str test_id: The test id to find the parents of.
+    :param int levels: The maximum number of parents to return.
+    :return: A list of parent ids, see get_parent_id().
+    """
+    parents = []
+    for _ in range(levels):
+        test_id = get_parent_id(test_id)
+        if test_id is None:
+            break
+        parents.append(test_id)
+    return parents
+
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_memory_size(size):
+    """Convert a memory size like ``512M`` or ``8G`` to bytes.
+
+    :param size: An int number of bytes, or a string of a number optionally
+        followed by one of the binary units K, M, G or T (with or without a
+        trailing B).
+    :return: The size in bytes as an int.
+    :raises ValueError: If size is not a valid size.
+    """
+    if isinstance(size, int):
+        value = size
+    else:
+        text = size.strip().upper()
+        if text.endswith("B"):
+            text = text[:-1]
+        unit = text[-1:] if text[-1:] in _SIZE_UNITS else ""
+        try:
+            value = int(float(text[: len(text) - len(unit)]) * _SIZE_UNITS[unit])
+        except (ValueError, OverflowError):
+            value = 0
+    if value <= 0:
+        raise ValueError("Invalid memory size: %s" % size)
+    return value
+
+
+def parse_shard(shard):
+    """Convert a shard like ``2/5`` to a (index, total) tuple.
+
+    :param str shard: The 1 based index of the shard and the total number
+        of shards, separated by a ``/``.
+    :return: A tuple of the int index and total.
+    :raises ValueError: If shard is not a valid shard.
+    """
+    index, sep, total = shard.partition("/")
+    try:
+        index = int(index)
+        total = int(total)
+    except ValueError:
+        raise ValueError("Invalid shard: %s" % shard)
+    if not 1 <= index <= total:
+        raise ValueError("Invalid shard: %s" % shard)
+    return index, total
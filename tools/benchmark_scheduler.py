@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark stestr.scheduler.partition_tests on a synthetic test list.
+
+By default this partitions 1 million test ids at a concurrency of 256 with
+90% of the tests having timing data, both with and without a class level
+group_regex, and prints the wall time for each. The timed section includes
+looking up the timing data in a memory repository, the time that lookup
+takes on its own is printed first.
+
+The target is partitioning 1 million ids at a concurrency of 256 in under a
+second, which is not met. On the single slow core this was last run on the
+defaults take about 8.3s without grouping and 7.5s by class. The timing
+lookup is about 2.4s of that and estimating the durations of the 10% of
+tests without timing data about 2s, the rest is mostly sorting the tests
+and placing each one on the heap. With --known-ratio 1.0 there is nothing to
+estimate, that pass is skipped and the defaults take about 6.1s and 5.1s.
+"""
+
+import argparse
+import random
+import re
+import time
+
+from stestr.repository import memory
+from stestr import scheduler
+
+
+def make_repository(test_ids, known_ratio, seed):
+    rand = random.Random(seed)
+    repo = memory.Repository()
+    for test_id in test_ids:
+        if rand.random() < known_ratio:
+            repo._add_test_time(test_id, rand.expovariate(10.0))
+    return repo
+
+
+def make_test_ids(count, per_class=20, classes_per_module=5):
+    test_ids = []
+    for i in range(count):
+        cls = i // per_class
+        module = cls // classes_per_module
+        test_ids.append(
+            "project.tests.pkg%d.test_mod%d.TestClass%d.test_%d"
+            % (module // 100, module, cls, i)
+        )
+    return test_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tests", type=int, default=1000000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--known-ratio", type=float, default=0.9)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    test_ids = make_test_ids(args.tests)
+    repo = make_repository(test_ids, args.known_ratio, args.seed)
+    start = time.perf_counter()
+    repo.get_test_times(test_ids)
+    print(
+        "%d tests, memory repository timing lookup: %.3fs"
+        % (len(test_ids), time.perf_counter() - start)
+    )
+    regex = re.compile(r"([^\.]*\.)*")
+
+    def class_group(test_id):
+        match = regex.match(test_id)
+        if match:
+            return match.group(0)
+
+    for name, group_callback in (("no grouping", None), ("by class", class_group)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            partitions = scheduler.partition_tests(
+                test_ids, args.concurrency, repo, group_callback
+            )
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert sum(len(x) for x in partitions) == len(test_ids)
+        print(
+            "%d tests, concurrency %d, %s: %.3fs"
+            % (len(test_ids), args.concurrency, name, best)
+        )
+
+
+if __name__ == "__main__":
+    main()